@@ -0,0 +1,74 @@
+from compaction import build_debate_summary
+from labels import LabelMatch, LabelResolver
+from response_parser import ParsedResponse
+
+# Everything the pipeline does with an agent's response after the provider call:
+# structured fields from the parsed response, village names through the label resolver.
+# main.py and bench/replay_trails.py share these, so recorded responses replay through
+# the same code that served them.
+
+ROLES = ("observer", "historian", "skeptic", "council")
+
+# Prose field of each role's output
+PROSE_FIELDS = {
+    "observer":  "observation",
+    "historian": "hypotheses_text",
+    "skeptic":   "skeptic_text",
+    "council":   "rationale",
+}
+
+
+def observer_output(parsed: ParsedResponse) -> dict:
+    if parsed.data.get("is_pottery") is False:
+        return {"is_pottery": False, "observation": ""}
+    return {"is_pottery": True, "observation": parsed.prose}
+
+
+def historian_output(parsed: ParsedResponse, resolver: LabelResolver) -> dict:
+    data = parsed.data
+    return {
+        "hypotheses_text": parsed.prose,
+        "hypothesis_a":    resolver.canonical(data.get("hypothesis_a", ""), "historian"),
+        "hypothesis_b":    resolver.canonical(data.get("hypothesis_b", ""), "historian"),
+        "preferred":       data.get("preferred", "A"),
+    }
+
+
+def skeptic_output(parsed: ParsedResponse, resolver: LabelResolver) -> dict:
+    data = parsed.data
+    return {
+        "skeptic_text":  parsed.prose,
+        "leans_towards": resolver.canonical(data.get("leans_towards", ""), "skeptic"),
+        "forgery_risk":  data.get("forgery_risk", "thấp"),
+    }
+
+
+# Also returns the label match, so the caller can report names it could not map
+def council_output(parsed: ParsedResponse, resolver: LabelResolver) -> tuple[dict, LabelMatch]:
+    data = parsed.data
+    match = resolver.resolve(data.get("predicted_label", ""), "council")
+    try:
+        confidence = max(0.0, min(1.0, float(data.get("confidence", 0.5))))
+    except (TypeError, ValueError):
+        confidence = 0.5
+    return {
+        "predicted_label": match.label,
+        "confidence":      confidence,
+        "rationale":       parsed.prose,
+        "forgery_risk":    data.get("forgery_risk", "thấp"),
+    }, match
+
+
+# Compacted Council input from the three parsed outputs
+def debate_summary(a1: dict, a2: dict, a3: dict, budget_tokens: int) -> str:
+    return build_debate_summary(
+        observation=a1["observation"],
+        hypothesis_a=a2["hypothesis_a"],
+        hypothesis_b=a2["hypothesis_b"],
+        preferred=a2["preferred"],
+        hypotheses_text=a2["hypotheses_text"],
+        skeptic_text=a3["skeptic_text"],
+        leans_towards=a3["leans_towards"],
+        forgery_risk=a3["forgery_risk"],
+        budget_tokens=budget_tokens,
+    )
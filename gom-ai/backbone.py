@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger("gom-ai-tadp.backbone")
+
+# ResNet50 + global average pooling feature extractors, shared by the local classifier
+# and the train/ scripts (which put this directory on sys.path), so an artifact that
+# trains or tests there serves here unchanged.
+
+IMG_SIZE = (224, 224)
+KERAS_VERSION = "keras-resnet50-imagenet"
+MANIFEST = "manifest.json"
+
+
+def file_version(prefix: str, path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{prefix}-{digest.hexdigest()[:12]}"
+
+
+def build_backbone():
+    import tensorflow as tf
+    from tensorflow.keras.applications import ResNet50
+
+    base_model = ResNet50(weights="imagenet", include_top=False)
+    return tf.keras.Model(
+        inputs=base_model.input,
+        outputs=tf.keras.layers.GlobalAveragePooling2D()(base_model.output),
+    )
+
+
+# Every extractor takes a (N, 224, 224, 3) batch of RGB pixels in 0..255 (uint8 or
+# float32) and returns (N, 2048) float32. version identifies the weights and
+# quantisation, for feature stores and verdict caches.
+
+class KerasExtractor:
+    def __init__(self):
+        from tensorflow.keras.applications.resnet50 import preprocess_input
+
+        self._model = build_backbone()
+        self._preprocess = preprocess_input
+        self.version = KERAS_VERSION
+
+    def __call__(self, images: np.ndarray) -> np.ndarray:
+        batch = self._preprocess(np.asarray(images, dtype=np.float32))
+        return np.asarray(self._model(batch, training=False))
+
+
+class SavedModelExtractor:
+    def __init__(self, path: str, version: str):
+        import tensorflow as tf
+
+        self._tf = tf
+        self._serve = tf.saved_model.load(path).signatures["serving_default"]
+        self.version = version
+
+    def __call__(self, images: np.ndarray) -> np.ndarray:
+        batch = self._tf.constant(np.asarray(images, dtype=np.float32))
+        return self._serve(image=batch)["features"].numpy()
+
+
+# Uses the standalone tflite-runtime package when installed, so a serving node does not
+# need TensorFlow at all; falls back to tf.lite otherwise. Not thread-safe: one caller
+# at a time.
+class TFLiteExtractor:
+    def __init__(self, path: str, version: str, threads: int | None = None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self._interpreter = Interpreter(model_path=path, num_threads=threads)
+        self._input = self._interpreter.get_input_details()[0]["index"]
+        self._output = self._interpreter.get_output_details()[0]["index"]
+        self._batch = 0
+        self.version = version
+
+    def __call__(self, images: np.ndarray) -> np.ndarray:
+        batch = np.asarray(images, dtype=np.float32)
+        if batch.shape[0] != self._batch:
+            self._interpreter.resize_tensor_input(self._input, batch.shape)
+            self._interpreter.allocate_tensors()
+            self._batch = batch.shape[0]
+        self._interpreter.set_tensor(self._input, batch)
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output).copy()
+
+
+def read_manifest(path: str) -> dict | None:
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Version of the extractor load_feature_extractor(path) would return, without loading it
+def extractor_version(path: str | None) -> str:
+    if not path:
+        return KERAS_VERSION
+    manifest = read_manifest(path)
+    if manifest is not None:
+        return manifest["tflite_version"]
+    if path.endswith(".tflite"):
+        return file_version("tflite", path)
+    return file_version("savedmodel", os.path.join(path, "saved_model.pb"))
+
+
+# path: empty for the float Keras model built from the ImageNet weights; an artifact
+# directory written by train/export_backbone.py (its TFLite file is used); a .tflite
+# file; or a SavedModel directory
+def load_feature_extractor(path: str | None = None, threads: int | None = None):
+    started = time.perf_counter()
+    version = extractor_version(path)
+    if not path:
+        extractor = KerasExtractor()
+    elif (manifest := read_manifest(path)) is not None:
+        extractor = TFLiteExtractor(os.path.join(path, manifest["tflite"]), version, threads)
+    elif path.endswith(".tflite"):
+        extractor = TFLiteExtractor(path, version, threads)
+    else:
+        extractor = SavedModelExtractor(path, version)
+    logger.info("Backbone %s loaded in %.1f s", version, time.perf_counter() - started)
+    return extractor
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+
+GOM_AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GOM_AI_DIR)
+
+from failover import FailoverRouter, ProvidersExhaustedError  # noqa: E402
+
+
+# Half-open breaker behaviour of FailoverRouter, without any network; exits 1 on failure
+def open_breaker(router: FailoverRouter, provider: str) -> None:
+    breaker = router._breakers[provider]
+    for _ in range(breaker.failure_threshold):
+        breaker.record(False, 0.0)
+    breaker.opened_at -= breaker.cooldown_sec  # cooldown over: half-open
+
+
+async def call_ok(provider, on_delta):
+    return provider
+
+
+async def call_failing_first(provider, on_delta):
+    if provider == "gemini":
+        raise RuntimeError("primary down")
+    return provider
+
+
+async def call_failing(provider, on_delta):
+    raise RuntimeError(f"{provider} down")
+
+
+async def checks() -> list[str]:
+    failures = []
+
+    # A half-open backup that is never launched must not keep its trial claimed
+    router = FailoverRouter(["gemini", "openai"], cooldown_sec=0.01)
+    open_breaker(router, "openai")
+    await router.run("observer", ["gemini", "openai"], call_ok)
+    breaker = router._breakers["openai"]
+    if breaker.trial_in_flight:
+        failures.append("unused half-open backup kept trial_in_flight")
+
+    # The next call that reaches it is its one trial; success closes the breaker
+    provider, _ = await router.run("observer", ["gemini", "openai"], call_failing_first)
+    if provider != "openai":
+        failures.append(f"failover went to {provider}, expected openai")
+    if breaker.state != "closed" or breaker.trial_in_flight:
+        failures.append(f"half-open backup is {breaker.state} after a successful trial")
+
+    # Only providers actually called are reported as tried, not ones an open breaker skipped
+    router = FailoverRouter(["gemini", "openai"], cooldown_sec=60)
+    open_breaker(router, "openai")
+    router._breakers["openai"].opened_at += 60  # back inside the cooldown: open
+    try:
+        await router.run("observer", ["gemini", "openai"], call_failing)
+        failures.append("run succeeded with every provider failing")
+    except ProvidersExhaustedError as exc:
+        if exc.attempted != ["gemini"]:
+            failures.append(f"attempted {exc.attempted}, expected ['gemini']")
+    return failures
+
+
+def main():
+    failures = asyncio.run(checks())
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    print(f"failover: {'ok' if not failures else f'{len(failures)} failures'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
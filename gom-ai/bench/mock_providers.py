@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Canned agent replies in the shapes real models produce: trailing JSON, fenced JSON,
+# markdown emphasis, and labels with diacritics or extra words for the label resolver
+OBSERVER_REPLIES = [
+    "Men lam vẽ dưới men trên nền trắng ngà, họa tiết hoa sen và lá dây. Xương gốm dày, "
+    "màu xám nhạt, đế mộc có vết son nâu.\n{\"is_pottery\": true}",
+    "**Men rạn** phủ đều thân bình, màu nâu vàng. Họa tiết đắp nổi hình rồng, kỹ thuật "
+    "tạo hình bằng bàn xoay.\n```json\n{\"is_pottery\": true}\n```",
+    "Gốm không men, màu đỏ gạch, bề mặt thô ráp, vết miết tay còn rõ ở vai.\n"
+    "{\"is_pottery\": true}",
+]
+NOT_POTTERY_REPLY = "{\"is_pottery\": false}"
+HISTORIAN_REPLIES = [
+    "Giả thuyết A: Chu Dau, thế kỷ XV, do men lam vẽ tay.\nGiả thuyết B: Bat Trang, thế kỷ XVII.\n"
+    "{\"hypothesis_a\": \"Chu Dau\", \"hypothesis_b\": \"Bat Trang\", \"preferred\": \"A\"}",
+    "1. Giả thuyết A: **Biên Hòa**, men rạn đặc trưng.\n2. Giả thuyết B: Lai Thieu.\n"
+    "```json\n{\"hypothesis_a\": \"Biên Hòa\", \"hypothesis_b\": \"Lai Thieu\", \"preferred\": \"A\"}\n```",
+    "Giả thuyết A: Bau Truc, gốm nung lộ thiên.\nGiả thuyết B: Phu Lang.\n"
+    "{\"hypothesis_a\": \"Bau Truc\", \"hypothesis_b\": \"Phu Lang\", \"preferred\": \"B\"}",
+]
+SKEPTIC_REPLIES = [
+    "Lập luận về men lam chưa đủ, cần xem thêm đế.\n"
+    "{\"leans_towards\": \"A\", \"forgery_risk\": \"thấp\"}",
+    "- Họa tiết có thể là đồ phỏng cổ thế kỷ XX.\n"
+    "{\"leans_towards\": \"B\", \"forgery_risk\": \"trung bình\"}",
+]
+COUNCIL_REPLIES = [
+    "Hội đồng đồng thuận với giả thuyết A.\n"
+    "{\"predicted_label\": \"Chu Đậu\", \"confidence\": 0.82, \"forgery_risk\": \"thấp\"}",
+    "Kết luận: gốm men rạn miền Nam.\n```json\n"
+    "{\"predicted_label\": \"Gốm Biên Hòa\", \"confidence\": 0.7, \"forgery_risk\": \"trung bình\"}\n```",
+    "**Phán quyết**: Phù Lãng.\n"
+    "{\"predicted_label\": \"phu lang\", \"confidence\": \"cao\", \"forgery_risk\": \"thấp\"}",
+    "Chưa đủ chứng cứ.\n{\"predicted_label\": \"không rõ\", \"confidence\": 1.4, \"forgery_risk\": \"cao\"}",
+]
+
+
+# Latency and failure behaviour of one stand-in provider
+class Profile:
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        sigma: float = 0.4,
+        ttft_ms: float = 250.0,
+        error_rate: float = 0.0,
+        chunks: int = 8,
+    ):
+        self.latency_ms = latency_ms
+        self.sigma      = sigma
+        self.ttft_ms    = ttft_ms
+        self.error_rate = error_rate
+        self.chunks     = chunks
+
+    # Log-normal around the median: long right tail, like real LLM latency
+    def sample_sec(self, rng: random.Random) -> float:
+        return self.latency_ms * rng.lognormvariate(0.0, self.sigma) / 1000
+
+
+def _chunks(text: str, n: int) -> list[str]:
+    size = max(1, -(-len(text) // n))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+# Picks the reply set from the prompt itself, so any provider can serve any debate role
+def _replies_for(prompt: str, has_image: bool) -> list[str]:
+    if has_image:
+        return OBSERVER_REPLIES
+    # Shared by the raw and the compact Council prompt
+    if "PHÁN QUYẾT CUỐI CÙNG" in prompt:
+        return COUNCIL_REPLIES
+    if "--- GIẢ THUYẾT ---" in prompt:
+        return SKEPTIC_REPLIES
+    return HISTORIAN_REPLIES
+
+
+def build_app(profiles: dict[str, Profile], not_pottery_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="TADP mock providers")
+    rng = random.Random(seed)
+    counters = {name: {"requests": 0, "errors": 0} for name in profiles}
+
+    def pick(prompt: str, has_image: bool) -> str:
+        if has_image and rng.random() < not_pottery_rate:
+            return NOT_POTTERY_REPLY
+        return rng.choice(_replies_for(prompt, has_image))
+
+    def fail(provider: str) -> bool:
+        counters[provider]["requests"] += 1
+        if rng.random() < profiles[provider].error_rate:
+            counters[provider]["errors"] += 1
+            return True
+        return False
+
+    async def paced(provider: str, parts: list[str]):
+        profile = profiles[provider]
+        total = profile.sample_sec(rng)
+        if len(parts) == 1:
+            # Non-streaming: the whole answer arrives at the end
+            await asyncio.sleep(total)
+            yield parts[0]
+            return
+        ttft = min(total, profile.ttft_ms / 1000)
+        await asyncio.sleep(ttft)
+        gap = (total - ttft) / max(1, len(parts) - 1)
+        for i, part in enumerate(parts):
+            if i:
+                await asyncio.sleep(gap)
+            yield part
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    # ---- Gemini: {base}/{version}/models/{model}:generateContent|streamGenerateContent ----
+    @app.post("/gemini/{version}/models/{model_action}")
+    async def gemini(version: str, model_action: str, request: Request):
+        body = await request.json()
+        if fail("gemini"):
+            return JSONResponse(
+                status_code=503,
+                content={"error": {"code": 503, "message": "mock overload", "status": "UNAVAILABLE"}},
+            )
+        parts = body["contents"][0]["parts"]
+        has_image = any("inlineData" in p or "inline_data" in p for p in parts)
+        prompt = _text_of(parts)
+        text = pick(prompt, has_image)
+        prompt_tokens = _tokens(prompt) + (258 if has_image else 0)
+        usage = {
+            "promptTokenCount":     prompt_tokens,
+            "candidatesTokenCount": _tokens(text),
+            "totalTokenCount":      prompt_tokens + _tokens(text),
+        }
+
+        def payload(delta: str, final: bool) -> dict:
+            candidate = {"content": {"role": "model", "parts": [{"text": delta}]}, "index": 0}
+            if final:
+                candidate["finishReason"] = "STOP"
+            out = {"candidates": [candidate], "modelVersion": model_action.split(":")[0]}
+            if final:
+                out["usageMetadata"] = usage
+            return out
+
+        if model_action.endswith(":streamGenerateContent"):
+            parts_out = _chunks(text, profiles["gemini"].chunks)
+
+            async def events():
+                i = 0
+                async for delta in paced("gemini", parts_out):
+                    i += 1
+                    yield f"data: {json.dumps(payload(delta, i == len(parts_out)), ensure_ascii=False)}\r\n\r\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        async for _ in paced("gemini", [text]):
+            pass
+        return payload(text, True)
+
+    # ---- OpenAI-compatible chat completions, one route per provider ----
+    def chat_route(provider: str):
+        async def chat(request: Request):
+            body = await request.json()
+            if fail(provider):
+                return JSONResponse(
+                    status_code=500,
+                    content={"error": {"message": "mock upstream error", "type": "server_error"}},
+                )
+            prompt = " ".join(_text_of(m["content"]) for m in body["messages"])
+            has_image = any(
+                isinstance(m["content"], list) and any(p.get("type") == "image_url" for p in m["content"])
+                for m in body["messages"]
+            )
+            text = pick(prompt, has_image)
+            prompt_tokens = _tokens(prompt) + (765 if has_image else 0)
+            usage = {
+                "prompt_tokens":     prompt_tokens,
+                "completion_tokens": _tokens(text),
+                "total_tokens":      prompt_tokens + _tokens(text),
+            }
+            base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body["model"]}
+            if not body.get("stream"):
+                async for _ in paced(provider, [text]):
+                    pass
+                return {
+                    **base,
+                    "object":  "chat.completion",
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                }
+
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+            async def events():
+                async for delta in paced(provider, _chunks(text, profiles[provider].chunks)):
+                    chunk = {
+                        **base,
+                        "object":  "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if include_usage:
+                    yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return chat
+
+    app.post("/openai/v1/chat/completions")(chat_route("openai"))
+    app.post("/xai/v1/chat/completions")(chat_route("xai"))
+    return app
+
+
+# "gemini=1500" or "gemini=1500:0.6" (median ms[:sigma]), overriding --latency-ms per provider
+def parse_overrides(values: list[str], profiles: dict[str, Profile]) -> None:
+    for value in values:
+        name, _, spec = value.partition("=")
+        if name not in profiles:
+            raise SystemExit(f"unknown provider {name!r}, expected one of {sorted(profiles)}")
+        median, _, sigma = spec.partition(":")
+        profiles[name].latency_ms = float(median)
+        if sigma:
+            profiles[name].sigma = float(sigma)
+
+
+def add_profile_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="median latency per call")
+    parser.add_argument("--sigma", type=float, default=0.4, help="log-normal spread of latency")
+    parser.add_argument("--ttft-ms", type=float, default=250.0, help="time to first streamed chunk")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered 5xx")
+    parser.add_argument("--not-pottery-rate", type=float, default=0.0)
+    parser.add_argument("--provider-latency", action="append", default=[], metavar="NAME=MS[:SIGMA]")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def profiles_from_args(args) -> dict[str, Profile]:
+    profiles = {
+        name: Profile(args.latency_ms, args.sigma, args.ttft_ms, args.error_rate)
+        for name in ("gemini", "openai", "xai")
+    }
+    parse_overrides(args.provider_latency, profiles)
+    return profiles
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-ins for the Gemini, OpenAI and xAI APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_profile_args(parser)
+    args = parser.parse_args()
+    app = build_app(profiles_from_args(args), args.not_pottery_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
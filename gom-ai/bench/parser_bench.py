@@ -0,0 +1,135 @@
+import argparse
+import json
+import random
+import re
+import sys
+import os
+import time
+
+GOM_AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GOM_AI_DIR)
+
+from response_parser import find_trailing_json, parse_response  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark and fuzz the agent response parser against the old regex chain"
+    )
+    parser.add_argument("--iterations", type=int, default=2000, help="parses per sample")
+    parser.add_argument("--fuzz", type=int, default=5000, help="random responses to check (0 = skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+# The regex chain main.py used before response_parser, kept as the baseline
+def legacy_strip_markdown(text: str) -> str:
+    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\*{2}(.+?)\*{2}', r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'_{2}(.+?)_{2}',   r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'\*(.+?)\*',       r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'_(.+?)_',         r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'^\s*[-*]\s+',     '', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*\d+\.\s+',    '', text, flags=re.MULTILINE)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def legacy_parse(text: str) -> tuple[str, dict]:
+    stripped = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    matches = list(re.finditer(r'\{[^{}]*\}', stripped, re.DOTALL))
+    data = {}
+    if matches:
+        try:
+            data = json.loads(matches[-1].group())
+        except json.JSONDecodeError:
+            pass
+    match = re.search(r'\{[^{}]*\}(?!.*\{)', text, re.DOTALL)
+    prose = legacy_strip_markdown(text[:match.start()].strip()) if match else legacy_strip_markdown(text)
+    return prose, data
+
+
+PROSE = (
+    "**Men** rạn màu ngà, họa tiết *hoa sen* vẽ lam dưới men; xương gốm dày, "
+    "đế mộc để lộ màu nâu đỏ của đất nung. "
+)
+VERDICT = '{"predicted_label": "Chu Dau", "confidence": 0.82, "forgery_risk": "thấp"}'
+
+
+def samples() -> dict[str, str]:
+    return {
+        "typical":        "### Nhận định\n" + PROSE * 6 + "\n\n" + VERDICT,
+        "fenced":         PROSE * 6 + "\n```json\n" + VERDICT + "\n```",
+        "long_prose":     ("- " + PROSE + "\n") * 400 + VERDICT,
+        "many_braces":    " ".join("{x%d}" % i for i in range(2000)) + "\n" + VERDICT,
+        "nested_json":    PROSE * 4 + '{"meta": {"a": {"b": [1, {"c": 2}]}}, "predicted_label": "Bat Trang"}',
+        "unclosed_brace": PROSE * 4 + "{ " + PROSE * 200,
+        "no_json":        PROSE * 300,
+    }
+
+
+def bench(func, text: str, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(text)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def random_response(rng: random.Random) -> tuple[str, dict | None]:
+    noise = "".join(rng.choice('ab {}"\\\n*_#-1. ờ`') for _ in range(rng.randrange(0, 400)))
+    if rng.random() < 0.2:
+        return noise, None
+    value = {
+        "predicted_label": rng.choice(["Bat Trang", "Chu Dau", 'Lai "Thieu"', "{Bien Hoa}", "a\\b"]),
+        "confidence": round(rng.random(), 3),
+    }
+    if rng.random() < 0.3:
+        value["nested"] = {"list": [1, {"k": "}{"}], "s": "\\}"}
+    # Prose that itself opens braces must not break recovery of the trailing object
+    prose = noise.replace("}", "")
+    fence = rng.random() < 0.3
+    body = json.dumps(value, ensure_ascii=rng.random() < 0.5)
+    return prose + ("\n```json\n" + body + "\n```" if fence else "\n" + body), value
+
+
+# Every response parses without raising; an object appended after any prose is
+# recovered exactly and never leaks into the prose
+def fuzz(count: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for i in range(count):
+        text, expected = random_response(rng)
+        try:
+            parsed = parse_response(text)
+        except Exception as exc:
+            print(f"FUZZ #{i} raised {exc!r} on {text!r}", file=sys.stderr)
+            failures += 1
+            continue
+        if not isinstance(parsed.data, dict) or not isinstance(parsed.prose, str):
+            failures += 1
+            print(f"FUZZ #{i} bad types on {text!r}", file=sys.stderr)
+        elif expected is not None and (parsed.data != expected or "predicted_label" in parsed.prose):
+            failures += 1
+            print(f"FUZZ #{i} got {parsed.data!r}, expected {expected!r} from {text!r}", file=sys.stderr)
+        if expected is None and find_trailing_json(text) is None and parsed.data:
+            failures += 1
+    return failures
+
+
+def main():
+    args = parse_args()
+    print(f"{'sample':<16}{'chars':>8}{'legacy µs':>12}{'parser µs':>12}{'speedup':>9}  recovered")
+    for name, text in samples().items():
+        iterations = max(1, args.iterations * 2000 // max(len(text), 2000))
+        legacy = bench(legacy_parse, text, iterations)
+        current = bench(parse_response, text, iterations)
+        label = parse_response(text).data.get("predicted_label", "-")
+        print(f"{name:<16}{len(text):>8}{legacy:>12.1f}{current:>12.1f}{legacy / current:>8.1f}x  {label}")
+    failures = fuzz(args.fuzz, args.seed) if args.fuzz else 0
+    if args.fuzz:
+        print(f"fuzz: {args.fuzz} responses, {failures} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
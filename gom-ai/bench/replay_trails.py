@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+GOM_AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GOM_AI_DIR)
+
+from agent_outputs import (  # noqa: E402
+    council_output, debate_summary, historian_output, observer_output, skeptic_output,
+)
+from compaction import estimate_tokens  # noqa: E402
+from labels import LabelResolver  # noqa: E402
+from response_parser import parse_response  # noqa: E402
+from trail_store import TrailStore, output_summary  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Replay recorded debate trails through the parse, label-resolution and "
+                    "compaction stages offline, and report what the current code changes"
+    )
+    parser.add_argument("--db", required=True, help="TRAIL_STORE_DB file")
+    parser.add_argument("--limit", type=int, default=0, help="most recent runs to replay (0 = all)")
+    parser.add_argument("--prompt-version", help="only runs recorded with this PROMPT_VERSION")
+    parser.add_argument("--min-score", type=float, help="LABEL_MATCH_MIN_SCORE to replay with (default: as recorded)")
+    parser.add_argument("--budget", type=int, help="COUNCIL_CONTEXT_BUDGET to replay with (default: as recorded)")
+    parser.add_argument("--show", type=int, default=10, help="changed fields to print")
+    parser.add_argument("--report", help="write the summary as JSON")
+    parser.add_argument("--fail-on-change", action="store_true",
+                        help="exit 1 if any verdict label differs from the recorded one")
+    return parser.parse_args()
+
+
+# Re-runs the post-call stages on each recorded run and tallies, per role and field,
+# where the result differs from what was recorded when it was served
+class Replay:
+    def __init__(self, min_score: float | None, budget: int | None, show: int):
+        self.min_score = min_score
+        self.budget = budget
+        self.show = show
+        self._resolvers: dict[tuple, LabelResolver] = {}
+        self.seconds = Counter()
+        self.changes = Counter()
+        self.examples: list[dict] = []
+        self.methods = Counter()
+        self.tokens = Counter()
+        self.runs = 0
+        self.replayed = Counter()
+
+    def _resolver(self, config: dict) -> LabelResolver:
+        min_score = self.min_score if self.min_score is not None else config["label_min_score"]
+        key = (tuple(config["labels"]), min_score)
+        if key not in self._resolvers:
+            self._resolvers[key] = LabelResolver(config["labels"], min_score=min_score)
+        return self._resolvers[key]
+
+    def _timed(self, stage: str, func, *args):
+        started = time.perf_counter()
+        value = func(*args)
+        self.seconds[stage] += time.perf_counter() - started
+        return value
+
+    def run(self, record: dict) -> None:
+        self.runs += 1
+        resolver = self._resolver(record["config"])
+        responses = record["responses"]
+        parsed = {
+            role: self._timed("parse", parse_response, response["raw"])
+            for role, response in responses.items()
+        }
+        outputs = {}
+        if "observer" in parsed:
+            outputs["observer"] = observer_output(parsed["observer"])
+        if "historian" in parsed:
+            outputs["historian"] = self._timed("labels", historian_output, parsed["historian"], resolver)
+        if "skeptic" in parsed:
+            outputs["skeptic"] = self._timed("labels", skeptic_output, parsed["skeptic"], resolver)
+        if "council" in parsed:
+            outputs["council"], match = self._timed("labels", council_output, parsed["council"], resolver)
+            self.methods[match.method] += 1
+
+        for role, output in outputs.items():
+            self.replayed[role] += 1
+            recorded = responses[role]["parsed"]
+            for field, value in output_summary(role, output).items():
+                if value != recorded.get(field):
+                    self.changes[f"{role}.{field}"] += 1
+                    if len(self.examples) < self.show:
+                        self.examples.append({
+                            "run": record["id"], "image": record["image_digest"][:12],
+                            "field": f"{role}.{field}", "recorded": recorded.get(field), "replayed": value,
+                        })
+
+        if {"observer", "historian", "skeptic"} <= outputs.keys():
+            budget = self.budget if self.budget is not None else record["config"]["council_context_budget"]
+            summary = self._timed(
+                "compaction", debate_summary,
+                outputs["observer"], outputs["historian"], outputs["skeptic"], budget,
+            )
+            self.tokens["runs"] += 1
+            self.tokens["raw"] += sum(
+                estimate_tokens(responses[role]["raw"]) for role in ("observer", "historian", "skeptic")
+            )
+            self.tokens["compact"] += estimate_tokens(summary)
+
+    def summary(self, elapsed: float) -> dict:
+        per_run = {
+            stage: round(seconds / self.runs * 1e6, 1) for stage, seconds in self.seconds.items()
+        } if self.runs else {}
+        tokens = None
+        if self.tokens["runs"]:
+            tokens = {
+                "raw_mean":     round(self.tokens["raw"] / self.tokens["runs"]),
+                "compact_mean": round(self.tokens["compact"] / self.tokens["runs"]),
+            }
+        return {
+            "runs":           self.runs,
+            "elapsed_sec":    round(elapsed, 3),
+            "stage_us_per_run": per_run,
+            "replayed":       dict(self.replayed),
+            "changes":        dict(self.changes),
+            "label_methods":  dict(self.methods),
+            "council_tokens": tokens,
+            "examples":       self.examples,
+        }
+
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.db):
+        print(f"{args.db} not found; run the service with TRAIL_STORE_DB set first", file=sys.stderr)
+        sys.exit(2)
+
+    replay = Replay(args.min_score, args.budget, args.show)
+    started = time.perf_counter()
+    for record in TrailStore(args.db).records(args.limit, args.prompt_version):
+        replay.run(record)
+    report = replay.summary(time.perf_counter() - started)
+
+    print(f"Replayed {report['runs']} runs in {report['elapsed_sec']} s")
+    for stage, us in report["stage_us_per_run"].items():
+        print(f"  {stage:<12}{us:>10.1f} µs/run")
+    if report["council_tokens"]:
+        t = report["council_tokens"]
+        print(f"  council context ~{t['raw_mean']} raw -> ~{t['compact_mean']} compact tokens")
+    print(f"  label methods: {report['label_methods']}")
+    if report["changes"]:
+        print("Changed against the recorded parse:")
+        for field, count in sorted(report["changes"].items()):
+            print(f"  {field:<28}{count:>6} / {report['replayed'].get(field.split('.')[0], 0)}")
+        for example in report["examples"]:
+            print(f"  run {example['run']} {example['image']} {example['field']}: "
+                  f"{example['recorded']!r} -> {example['replayed']!r}")
+    else:
+        print("No changes against the recorded parse")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if args.fail_on_change and report["changes"].get("council.predicted_label") else 0)
+
+
+if __name__ == "__main__":
+    main()
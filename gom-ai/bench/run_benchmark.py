@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+from PIL import Image
+
+from mock_providers import add_profile_args
+
+GOM_AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Load-test the TADP pipeline against local mock providers (no API spend)"
+    )
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels, e.g. 1,8,32")
+    parser.add_argument("--endpoint", choices=["/predict", "/predict/stream"], default="/predict")
+    parser.add_argument("--mode", default="sequential",
+                        help="comma-separated pipeline modes to compare, e.g. sequential,concurrent")
+    parser.add_argument("--image", help="image to upload; defaults to a generated 1600x1200 JPEG")
+    parser.add_argument("--repeat-image", action="store_true",
+                        help="send identical bytes every time, so the verdict cache answers")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--target", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--mock-port", type=int, default=9101)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="exit 1 if any level's p95 is above this")
+    parser.add_argument("--max-overhead-ms", type=float,
+                        help="exit 1 if mean pipeline overhead per request is above this")
+    parser.add_argument("--max-failure-rate", type=float, help="exit 1 if any level fails more often")
+    add_profile_args(parser)
+    return parser.parse_args()
+
+
+def sample_image(path: str | None) -> bytes:
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    rng = random.Random(0)
+    img = Image.new("RGB", (1600, 1200), (230, 225, 210))
+    pixels = img.load()
+    for _ in range(20000):
+        pixels[rng.randrange(1600), rng.randrange(1200)] = (40, 60, rng.randrange(120, 200))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+# Sum and count of tadp_agent_latency_seconds across all agents, from GET /metrics
+async def agent_seconds(client: httpx.AsyncClient) -> tuple[float, int]:
+    total = count = 0
+    text = (await client.get("/metrics")).text
+    for line in text.splitlines():
+        if line.startswith("tadp_agent_latency_seconds_sum"):
+            total += float(line.rsplit(" ", 1)[1])
+        elif line.startswith("tadp_agent_latency_seconds_count"):
+            count += int(float(line.rsplit(" ", 1)[1]))
+    return total, count
+
+
+# Wall time during which at least one provider call was in flight, from the
+# X-Debug-Timing stages; calls that overlap (concurrent mode, hedges) count once
+def provider_busy_sec(timing: dict) -> float:
+    spans = sorted((s["start_ms"], s["start_ms"] + s["wall_ms"]) for s in timing.get("stages", []))
+    busy = 0.0
+    cursor = float("-inf")
+    for start, end in spans:
+        if end > cursor:
+            busy += end - max(start, cursor)
+            cursor = end
+    return busy / 1000
+
+
+class Runner:
+    def __init__(self, client: httpx.AsyncClient, endpoint: str, image: bytes, repeat: bool):
+        self.client   = client
+        self.endpoint = endpoint
+        self.image    = image
+        self.repeat   = repeat
+        self.mode     = "sequential"
+
+    def _payload(self) -> bytes:
+        # Bytes after the JPEG end marker are ignored by decoders but change the image hash
+        return self.image if self.repeat else self.image + os.urandom(16)
+
+    # Returns (seconds, status, time to first token or None, cache header,
+    # provider busy seconds or None when the endpoint reports no timing)
+    async def one(self) -> tuple[float, str, float | None, str, float | None]:
+        started = time.perf_counter()
+        files = {"file": ("bench.jpg", self._payload(), "image/jpeg")}
+        try:
+            if self.endpoint == "/predict":
+                resp = await self.client.post(
+                    self.endpoint, files=files, params={"mode": self.mode}, headers={"X-Debug-Timing": "1"},
+                )
+                elapsed = time.perf_counter() - started
+                busy = provider_busy_sec(resp.json()["timing"]) if resp.status_code == 200 else None
+                return elapsed, str(resp.status_code), None, resp.headers.get("x-verdict-cache", ""), busy
+            first_token = None
+            status = "stream-incomplete"
+            async with self.client.stream(
+                "POST", self.endpoint, files=files, params={"mode": self.mode},
+            ) as resp:
+                async for line in resp.aiter_lines():
+                    if line == "event: token" and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif line == "event: result":
+                        status = "200"
+                    elif line == "event: error":
+                        status = "stream-error"
+            return time.perf_counter() - started, status, first_token, "", None
+        except httpx.HTTPError as exc:
+            return time.perf_counter() - started, type(exc).__name__, None, "", None
+
+    async def level(self, concurrency: int, total: int) -> dict:
+        samples: list[tuple[float, str, float | None, str, float | None]] = []
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                samples.append(await self.one())
+
+        agent_before = await agent_seconds(self.client)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        agent_after = await agent_seconds(self.client)
+
+        ok = sorted(s[0] for s in samples if s[1] == "200")
+        ttft = sorted(s[2] for s in samples if s[2] is not None)
+        statuses: dict[str, int] = {}
+        caches: dict[str, int] = {}
+        for _, status, _, cache, _ in samples:
+            statuses[status] = statuses.get(status, 0) + 1
+            if cache:
+                caches[cache] = caches.get(cache, 0) + 1
+        # Overhead: client-observed time with no provider call in flight. Without per-request
+        # timing (SSE), fall back to summed agent time, which is only exact in sequential mode.
+        agent_sec = agent_after[0] - agent_before[0]
+        timed = [(s[0], s[4]) for s in samples if s[4] is not None]
+        if timed:
+            overhead_ms = sum(latency - busy for latency, busy in timed) * 1000 / len(timed)
+        elif samples:
+            overhead_ms = (sum(s[0] for s in samples) - agent_sec) * 1000 / len(samples)
+        else:
+            overhead_ms = None
+        return {
+            "mode":            self.mode,
+            "concurrency":     concurrency,
+            "requests":        total,
+            "elapsed_sec":     round(elapsed, 2),
+            "throughput_rps":  round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "failure_rate":    round(1 - len(ok) / total, 4) if total else 0.0,
+            "statuses":        statuses,
+            "cache":           caches,
+            "p50_ms":          round(percentile(ok, 0.50) * 1000, 1),
+            "p95_ms":          round(percentile(ok, 0.95) * 1000, 1),
+            "p99_ms":          round(percentile(ok, 0.99) * 1000, 1),
+            "ttft_p50_ms":     round(percentile(ttft, 0.50) * 1000, 1) if ttft else None,
+            "agent_calls":     agent_after[1] - agent_before[1],
+            # Summed provider time per request; p50 below this shows calls running in parallel
+            "agent_ms_per_request": round(agent_sec * 1000 / len(samples), 1) if samples else None,
+            # Time with a provider call in flight: the pipeline's remote critical path
+            "critical_path_ms": round(sum(b for _, b in timed) * 1000 / len(timed), 1) if timed else None,
+            "overhead_ms":     round(overhead_ms, 1) if overhead_ms is not None else None,
+        }
+
+
+def spawn(args) -> list[subprocess.Popen]:
+    mock_cmd = [
+        sys.executable, os.path.join(GOM_AI_DIR, "bench", "mock_providers.py"),
+        "--port", str(args.mock_port),
+        "--latency-ms", str(args.latency_ms), "--sigma", str(args.sigma),
+        "--ttft-ms", str(args.ttft_ms), "--error-rate", str(args.error_rate),
+        "--not-pottery-rate", str(args.not_pottery_rate), "--seed", str(args.seed),
+    ]
+    for override in args.provider_latency:
+        mock_cmd += ["--provider-latency", override]
+    mock_base = f"http://127.0.0.1:{args.mock_port}"
+    # NO_DOTENV: gom-ai/.env would otherwise override the mock endpoints and keys
+    env = {
+        **os.environ,
+        "NO_DOTENV":      "1",
+        "GOOGLE_API_KEY": "bench", "OPENAI_API_KEY": "bench", "XAI_API_KEY": "bench",
+        "GEMINI_BASE":    f"{mock_base}/gemini",
+        "OPENAI_BASE":    f"{mock_base}/openai/v1",
+        "XAI_BASE":       f"{mock_base}/xai/v1",
+        "LOCAL_MODEL_DIR": "", "SIMILARITY_STORE_DIR": "", "SIMILARITY_UPLOADS_DB": "",
+        "VERDICT_CACHE_DB": "", "TRAIL_STORE_DB": "",
+    }
+    server_cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning",
+    ]
+    return [
+        subprocess.Popen(mock_cmd, cwd=GOM_AI_DIR),
+        subprocess.Popen(server_cmd, cwd=GOM_AI_DIR, env=env, stdout=subprocess.DEVNULL),
+    ]
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"{url} did not come up within {timeout:.0f} s")
+            await asyncio.sleep(0.2)
+
+
+def print_report(levels: list[dict]) -> None:
+    print(f"\n{'mode':>10} {'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'fail %':>7} {'agent ms':>9} {'overhead ms':>12}  statuses")
+    for r in levels:
+        overhead = "-" if r["overhead_ms"] is None else f"{r['overhead_ms']:.1f}"
+        print(f"{r['mode']:>10} {r['concurrency']:>5} {r['throughput_rps']:>8.2f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['failure_rate'] * 100:>7.2f} {r['agent_ms_per_request'] or 0:>9.1f} "
+              f"{overhead:>12}  {r['statuses']}")
+
+
+async def run(args) -> int:
+    base_url = args.target or f"http://127.0.0.1:{args.port}"
+    if args.target is None:
+        await wait_ready(f"http://127.0.0.1:{args.mock_port}/stats")
+    await wait_ready(f"{base_url}/readyz")
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        runner = Runner(client, args.endpoint, sample_image(args.image), args.repeat_image)
+        for _ in range(args.warmup):
+            await runner.one()
+        report = []
+        for mode in [m.strip() for m in args.mode.split(",") if m.strip()]:
+            runner.mode = mode
+            for concurrency in levels:
+                result = await runner.level(concurrency, args.requests)
+                report.append(result)
+                print(json.dumps(result, ensure_ascii=False), flush=True)
+        if args.target is None:
+            mock_stats = (await client.get(f"http://127.0.0.1:{args.mock_port}/stats")).json()
+            print("mock providers:", mock_stats)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": report}, f, ensure_ascii=False, indent=2)
+
+    failed = []
+    for r in report:
+        if args.max_p95_ms is not None and r["p95_ms"] > args.max_p95_ms:
+            failed.append(f"{r['mode']} c={r['concurrency']}: p95 {r['p95_ms']} ms > {args.max_p95_ms}")
+        if args.max_failure_rate is not None and r["failure_rate"] > args.max_failure_rate:
+            failed.append(f"{r['mode']} c={r['concurrency']}: failure rate {r['failure_rate']} > {args.max_failure_rate}")
+        if (args.max_overhead_ms is not None and r["overhead_ms"] is not None
+                and r["overhead_ms"] > args.max_overhead_ms):
+            failed.append(f"{r['mode']} c={r['concurrency']}: overhead {r['overhead_ms']} ms > {args.max_overhead_ms}")
+    for message in failed:
+        print("REGRESSION", message, file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main():
+    args = parse_args()
+    processes = [] if args.target else spawn(args)
+    try:
+        code = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
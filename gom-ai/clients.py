@@ -0,0 +1,184 @@
+import importlib.util
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger("gom-ai-tadp.clients")
+
+
+# Checks that a package is installed without importing it
+def module_available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+GENAI_AVAILABLE = module_available("google.genai")
+
+
+# Wraps a client's transport to count requests passing through its connection pool.
+# Delegates instead of subclassing because the OpenAI SDK may ship its own httpx fork.
+class _PoolMeter:
+    def __init__(self, inner):
+        self._inner = inner
+        self.requests_total = 0
+        self.errors_total   = 0
+        self.in_flight      = 0
+        self.peak_in_flight = 0
+
+    async def handle_async_request(self, request):
+        self.requests_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self._inner.handle_async_request(request)
+        except Exception:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+    async def __aenter__(self):
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._inner.__aexit__(*exc_info)
+
+    def stats(self) -> dict:
+        connections = list(getattr(getattr(self._inner, "_pool", None), "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "requests_total":     self.requests_total,
+            "errors_total":       self.errors_total,
+            "in_flight":          self.in_flight,
+            "peak_in_flight":     self.peak_in_flight,
+            "connections_open":   len(connections),
+            "connections_idle":   idle,
+            "connections_active": len(connections) - idle,
+        }
+
+
+# One long-lived SDK client per provider, each backed by its own keep-alive pool.
+# Clients are built on first use and closed together when the app shuts down; the
+# SDKs (and httpx) are imported then too, which keeps them off the import path.
+class ProviderClients:
+    def __init__(
+        self,
+        google_api_key: str,
+        openai_api_key: str,
+        xai_api_key: str,
+        openai_base: str,
+        xai_base: str,
+        gemini_base: str = "",
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 60.0,
+    ):
+        self._keys  = {"gemini": google_api_key, "openai": openai_api_key, "xai": xai_api_key}
+        self._bases = {"openai": openai_base, "xai": xai_base, "gemini": gemini_base}
+        self._pool_options = {
+            "max_connections":           max_connections,
+            "max_keepalive_connections": max_keepalive,
+            "keepalive_expiry":          keepalive_expiry,
+        }
+        self._meters: dict[str, _PoolMeter] = {}
+        self._http: dict[str, object] = {}
+        self._clients: dict[str, object] = {}
+        # warm() builds clients on a thread while requests may build them on the loop
+        self._lock = threading.Lock()
+
+    def _meter(self, provider: str, http) -> None:
+        meter = _PoolMeter(http._transport)
+        http._transport = meter
+        self._meters[provider] = meter
+        self._http[provider] = http
+
+    @property
+    def _limits(self):
+        import httpx
+
+        return httpx.Limits(**self._pool_options)
+
+    def _build_gemini(self):
+        import httpx
+        from google import genai as google_genai
+        from google.genai import types as genai_types
+
+        http = httpx.AsyncClient(limits=self._limits, timeout=httpx.Timeout(60.0, connect=10.0))
+        self._meter("gemini", http)
+        client = google_genai.Client(
+            api_key=self._keys["gemini"],
+            http_options=genai_types.HttpOptions(
+                base_url=self._bases["gemini"] or None, httpx_async_client=http,
+            ),
+        )
+        logger.info("Created pooled Gemini client (limits=%s)", self._limits)
+        return client
+
+    def _build_openai_compatible(self, provider: str) -> "AsyncOpenAI":
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        http = DefaultAsyncHttpxClient(limits=self._limits)
+        self._meter(provider, http)
+        # No SDK retries: FailoverRouter and ProviderGate own retry and 429 handling
+        client = AsyncOpenAI(
+            api_key=self._keys[provider],
+            base_url=self._bases[provider],
+            http_client=http,
+            max_retries=0,
+        )
+        logger.info("Created pooled %s client (limits=%s)", provider, self._limits)
+        return client
+
+    def _get(self, provider: str):
+        client = self._clients.get(provider)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(provider)
+                if client is None:
+                    client = (
+                        self._build_gemini() if provider == "gemini"
+                        else self._build_openai_compatible(provider)
+                    )
+                    self._clients[provider] = client
+        return client
+
+    def gemini(self):
+        return self._get("gemini")
+
+    def openai(self) -> "AsyncOpenAI":
+        return self._get("openai")
+
+    def xai(self) -> "AsyncOpenAI":
+        return self._get("xai")
+
+    # Opens every configured client up front so the first request does not pay for it.
+    # Blocking (imports the SDKs), so the app runs it on a thread during warm-up.
+    def warm(self) -> None:
+        if self._keys["gemini"] and GENAI_AVAILABLE:
+            self.gemini()
+        if self._keys["openai"]:
+            self.openai()
+        if self._keys["xai"]:
+            self.xai()
+
+    async def aclose(self) -> None:
+        for provider, http in self._http.items():
+            try:
+                await http.aclose()
+            except Exception as exc:
+                logger.warning("Failed to close %s client: %s", provider, exc)
+        self._http.clear()
+        self._clients.clear()
+        self._meters.clear()
+
+    def stats(self) -> dict:
+        return {provider: m.stats() for provider, m in self._meters.items()}
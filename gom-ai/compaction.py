@@ -0,0 +1,87 @@
+import re
+import unicodedata
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+# Rough count for Vietnamese prose (diacritics make it denser than English's ~4 chars
+# per token); only used for budgeting, the provider's usage figures are on /metrics
+def estimate_tokens(text: str) -> int:
+    return len(text) // 3 + 1 if text else 0
+
+
+def split_sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text or "") if s.strip()]
+
+
+def _fingerprint(sentence: str) -> str:
+    folded = unicodedata.normalize("NFC", sentence).lower()
+    return _NON_WORD.sub(" ", folded).strip()
+
+
+# Drops sentences already seen (in `seen` or earlier in the same text) and records the
+# kept ones, so later sections do not repeat earlier ones
+def _dedupe(sentences: list[str], seen: set[str]) -> list[str]:
+    kept = []
+    for sentence in sentences:
+        key = _fingerprint(sentence)
+        # Long sentences quoted inside a longer one (e.g. the Skeptic restating the observation)
+        if not key or key in seen or (len(key) > 20 and any(key in other for other in seen)):
+            continue
+        seen.add(key)
+        kept.append(sentence)
+    return kept
+
+
+# Removes trailing sentences, largest section first, until the body fits the budget.
+# Each section keeps at least its first sentence.
+def _fit(sections: list[list[str]], budget_tokens: int, fixed_tokens: int) -> None:
+    def size(section: list[str]) -> int:
+        return estimate_tokens(" ".join(section))
+
+    while fixed_tokens + sum(size(s) for s in sections) > budget_tokens:
+        trimmable = [s for s in sections if len(s) > 1]
+        if not trimmable:
+            return
+        max(trimmable, key=size).pop()
+
+
+# Structured, deduplicated summary of the debate for the Council, built from the parsed
+# agent outputs instead of their raw transcripts. budget_tokens <= 0 disables trimming.
+def build_debate_summary(
+    observation: str,
+    hypothesis_a: str,
+    hypothesis_b: str,
+    preferred: str,
+    hypotheses_text: str,
+    skeptic_text: str,
+    leans_towards: str,
+    forgery_risk: str,
+    budget_tokens: int = 0,
+) -> str:
+    seen: set[str] = set()
+    observed = _dedupe(split_sentences(observation), seen)
+    reasoning = _dedupe(split_sentences(hypotheses_text), seen)
+    objections = _dedupe(split_sentences(skeptic_text), seen)
+
+    header_obs = "QUAN SÁT VẬT LÝ:"
+    header_hyp = (
+        f"GIẢ THUYẾT CỦA SỬ GIA (ưu tiên {preferred or 'A'}):\n"
+        f"- A: {hypothesis_a or 'không rõ'}\n"
+        f"- B: {hypothesis_b or 'không rõ'}\n"
+        "Lập luận:"
+    )
+    header_obj = (
+        f"PHẢN BIỆN (nghiêng về: {leans_towards or 'không rõ'}; "
+        f"rủi ro làm giả: {forgery_risk or 'không rõ'}):"
+    )
+    if budget_tokens > 0:
+        fixed = estimate_tokens(header_obs + header_hyp + header_obj)
+        _fit([observed, reasoning, objections], budget_tokens, fixed)
+
+    return "\n\n".join([
+        f"{header_obs}\n{' '.join(observed)}",
+        f"{header_hyp}\n{' '.join(reasoning)}",
+        f"{header_obj}\n{' '.join(objections)}",
+    ])
@@ -0,0 +1,278 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import AsyncContextManager, Awaitable, Callable, TypeVar
+
+logger = logging.getLogger("gom-ai-tadp.failover")
+
+T = TypeVar("T")
+
+# Cancellation message for the losing side of a hedge, so it is not counted as a timeout
+SUPERSEDED = "superseded"
+
+
+# Opens after failure_threshold consecutive failures, where a call slower than
+# slow_call_sec also counts as a failure. After cooldown_sec one trial call is let
+# through (half-open): success closes the breaker, failure opens it again.
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 3, cooldown_sec: float = 30.0, slow_call_sec: float = 20.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec      = cooldown_sec
+        self.slow_call_sec     = slow_call_sec
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_sec:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record(self, ok: bool, seconds: float) -> None:
+        self.trial_in_flight = False
+        if ok and seconds <= self.slow_call_sec:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+
+# Raised by FailoverRouter.run when no attempt succeeded. attempted lists the providers
+# actually called, in order; the message and last are the final attempt's failure.
+class ProvidersExhaustedError(Exception):
+    def __init__(self, attempted: list[str], last: BaseException):
+        super().__init__(str(last) or type(last).__name__)
+        self.attempted = attempted
+        self.last      = last
+
+
+# Recent successful call latencies, for the hedge delay
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# Runs one debate role on an ordered list of interchangeable providers.
+# Providers with an open breaker are skipped; a failed attempt falls over to the next
+# provider. With hedge_quantile > 0, a second provider is started once the first has
+# been running longer than that latency quantile; the first good answer wins and the
+# other attempt is cancelled. gates maps a provider to an async context manager entered
+# around each call to it (admission control); time spent waiting there does not count
+# against the attempt timeout or the breaker.
+class FailoverRouter:
+    def __init__(
+        self,
+        providers: list[str],
+        failure_threshold: int = 3,
+        cooldown_sec: float = 30.0,
+        slow_call_sec: float = 20.0,
+        attempt_timeout_sec: float = 30.0,
+        hedge_quantile: float = 0.0,
+        hedge_min_delay_sec: float = 1.5,
+        hedge_min_samples: int = 20,
+        gates: dict[str, AsyncContextManager] | None = None,
+    ):
+        self.attempt_timeout_sec = attempt_timeout_sec
+        self.hedge_quantile      = hedge_quantile
+        self.hedge_min_delay_sec = hedge_min_delay_sec
+        self.hedge_min_samples   = hedge_min_samples
+        self._breakers = {
+            name: CircuitBreaker(failure_threshold, cooldown_sec, slow_call_sec) for name in providers
+        }
+        self._gates = gates or {}
+        self._latency: dict[tuple[str, str], LatencyWindow] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+
+    def _count(self, role: str, name: str) -> None:
+        role_counters = self.counters.setdefault(role, {
+            "calls": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "skipped_open": 0, "exhausted": 0,
+        })
+        role_counters[name] += 1
+
+    def _window(self, role: str, provider: str) -> LatencyWindow:
+        return self._latency.setdefault((role, provider), LatencyWindow())
+
+    # Before enough samples exist, hedge only calls that are already slow enough to count
+    # against the breaker
+    def _hedge_delay(self, role: str, provider: str) -> float:
+        window = self._window(role, provider)
+        if len(window) < self.hedge_min_samples:
+            return self._breakers[provider].slow_call_sec
+        return max(self.hedge_min_delay_sec, window.quantile(self.hedge_quantile))
+
+    async def _attempt(self, role: str, provider: str, call: Callable[[], Awaitable[T]]) -> T:
+        async with self._gates.get(provider) or contextlib.nullcontext():
+            return await self._timed_attempt(role, provider, call)
+
+    # The timeout cancels this task directly (rather than via wait_for, which wraps the
+    # call in a task of its own) so a SUPERSEDED cancel message reaches the provider call
+    async def _timed_attempt(self, role: str, provider: str, call: Callable[[], Awaitable[T]]) -> T:
+        breaker = self._breakers[provider]
+        task = asyncio.current_task()
+        timed_out = False
+
+        def expire() -> None:
+            nonlocal timed_out
+            timed_out = True
+            task.cancel()
+
+        timer = asyncio.get_running_loop().call_later(self.attempt_timeout_sec, expire)
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            if not timed_out:
+                # A superseded hedge says nothing about provider health; release a half-open trial
+                breaker.trial_in_flight = False
+                raise
+            breaker.record(False, time.perf_counter() - started)
+            raise asyncio.TimeoutError(f"{provider} exceeded {self.attempt_timeout_sec:g} s") from None
+        except Exception:
+            breaker.record(False, time.perf_counter() - started)
+            raise
+        finally:
+            timer.cancel()
+        elapsed = time.perf_counter() - started
+        breaker.record(True, elapsed)
+        self._window(role, provider).add(elapsed)
+        return result
+
+    # call(provider, on_delta) performs one request. Streamed deltas are forwarded from
+    # whichever attempt produces text first; if that attempt then loses, the final
+    # debate_trail step carries the winning text. Returns (provider, result); raises
+    # ProvidersExhaustedError when every attempt failed.
+    async def run(
+        self,
+        role: str,
+        providers: list[str],
+        call: Callable[[str, Callable[[str], None] | None], Awaitable[T]],
+        on_delta: Callable[[str], None] | None = None,
+    ) -> tuple[str, T]:
+        queue = list(providers)
+        skipped = False
+        self._count(role, "calls")
+
+        stream_owner: str | None = None
+
+        def relay(provider: str) -> Callable[[str], None] | None:
+            if on_delta is None:
+                return None
+
+            def forward(delta: str) -> None:
+                nonlocal stream_owner
+                if stream_owner is None:
+                    stream_owner = provider
+                if stream_owner == provider:
+                    on_delta(delta)
+            return forward
+
+        pending: dict[asyncio.Task, str] = {}
+        attempted: list[str] = []
+
+        def start(provider: str) -> str:
+            task = asyncio.create_task(self._attempt(role, provider, lambda: call(provider, relay(provider))))
+            pending[task] = provider
+            attempted.append(provider)
+            return provider
+
+        # Breakers are asked only for the provider about to start: allow() claims the
+        # half-open trial, which a backup that never launches would otherwise hold forever
+        def launch() -> str | None:
+            nonlocal skipped
+            while queue:
+                provider = queue.pop(0)
+                if self._breakers[provider].allow():
+                    return start(provider)
+                if not skipped:
+                    skipped = True
+                    self._count(role, "skipped_open")
+            return None
+
+        primary = launch()
+        if primary is None:
+            # Every breaker is open: trying the preferred provider beats failing outright
+            primary = start(providers[0])
+        backup: str | None = None
+        hedged = False
+        last_exc: BaseException | None = None
+        try:
+            while pending:
+                timeout = None
+                if self.hedge_quantile > 0 and queue and not hedged and len(pending) == 1:
+                    timeout = self._hedge_delay(role, primary)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backup = launch()
+                    if backup is None:
+                        continue
+                    self._count(role, "hedges")
+                    logger.info("[%s] %s slower than %.1f s, hedging on %s", role, primary, timeout, backup)
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        if provider == backup:
+                            self._count(role, "hedge_wins")
+                        return provider, task.result()
+                    last_exc = exc
+                    logger.warning("[%s] %s failed: %s", role, provider, str(exc) or type(exc).__name__)
+                if not pending and queue:
+                    next_provider = launch()
+                    if next_provider is not None:
+                        self._count(role, "failovers")
+                        primary = next_provider
+            self._count(role, "exhausted")
+            raise ProvidersExhaustedError(attempted, last_exc) from last_exc
+        finally:
+            for task in pending:
+                task.cancel(SUPERSEDED)
+
+    def stats(self) -> dict:
+        return {
+            "providers": {
+                name: {
+                    "state":        breaker.state,
+                    "failures":     breaker.failures,
+                    "times_opened": breaker.times_opened,
+                }
+                for name, breaker in self._breakers.items()
+            },
+            "roles": self.counters,
+            "latency_p95_sec": {
+                f"{role}/{provider}": round(window.quantile(0.95), 3)
+                for (role, provider), window in self._latency.items() if len(window)
+            },
+        }
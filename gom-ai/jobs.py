@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+
+from metrics import QUEUE_WAIT
+
+logger = logging.getLogger("gom-ai-tadp.jobs")
+
+# runner(image_bytes, on_step, **options) -> verdict; on_step receives each debate_trail
+# entry, options are the keyword arguments given to submit()
+JobRunner = Callable[..., Awaitable[dict]]
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, image_bytes: bytes, filename: str, options: dict):
+        self.id           = uuid.uuid4().hex
+        self.filename     = filename
+        self.image_bytes  = image_bytes
+        self.options      = options
+        self.status       = "queued"
+        self.debate_trail: list[dict] = []
+        self.result: dict | None = None
+        self.error: dict | None  = None
+        self.created_at   = time.time()
+        self.started_at: float | None  = None
+        self.finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        queued_until = self.started_at or now
+        return {
+            "job_id":       self.id,
+            "status":       self.status,
+            "filename":     self.filename,
+            "debate_trail": self.debate_trail,
+            "result":       self.result,
+            "error":        self.error,
+            "queue_wait_sec": round(queued_until - self.created_at, 3),
+            "run_sec": (
+                round((self.finished_at or now) - self.started_at, 3)
+                if self.started_at else None
+            ),
+        }
+
+
+# Bounded in-process job queue drained by a fixed pool of worker tasks.
+# Submissions beyond the queue size are rejected so callers can back off.
+class JobManager:
+    def __init__(
+        self,
+        runner: JobRunner,
+        workers: int = 4,
+        queue_size: int = 32,
+        retention_sec: float = 3600,
+    ):
+        self._runner        = runner
+        self._worker_count  = workers
+        self._retention     = retention_sec
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=queue_size)
+        self._jobs: dict[str, Job] = {}
+        self._workers: list[asyncio.Task] = []
+        self._avg_run_sec = 60.0
+        self.counters = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"tadp-job-worker-{i}")
+            for i in range(self._worker_count)
+        ]
+        logger.info("Started %d job workers (queue size %d)", self._worker_count, self._queue.maxsize)
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # Rough time until a worker frees up: queued work spread across the pool
+    def _retry_after(self) -> int:
+        pending = self._queue.qsize() + self._worker_count
+        return max(1, round(self._avg_run_sec * pending / self._worker_count / 2))
+
+    def _purge(self) -> None:
+        cutoff = time.time() - self._retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, image_bytes: bytes, filename: str, **options) -> Job:
+        self._purge()
+        job = Job(image_bytes, filename, options)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            raise QueueFullError(self._retry_after())
+        self._jobs[job.id] = job
+        self.counters["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            QUEUE_WAIT.observe(job.started_at - job.created_at, "jobs")
+            try:
+                job.result = await self._runner(job.image_bytes, job.debate_trail.append, **job.options)
+                # Cached and coalesced verdicts finish without replaying their steps
+                if not job.debate_trail:
+                    job.debate_trail.extend(job.result.get("debate_trail", []))
+                job.status = "succeeded"
+                self.counters["succeeded"] += 1
+            except HTTPException as exc:
+                job.status = "failed"
+                job.error = {"status_code": exc.status_code, "detail": exc.detail}
+                self.counters["failed"] += 1
+            except Exception as exc:
+                logger.exception("[Job %s] Worker %d failed", job.id, index)
+                job.status = "failed"
+                job.error = {"status_code": 502, "detail": f"Lỗi hệ thống AI: {exc}"}
+                self.counters["failed"] += 1
+            finally:
+                job.finished_at = time.time()
+                job.image_bytes = b""
+                self._avg_run_sec = 0.8 * self._avg_run_sec + 0.2 * (job.finished_at - job.started_at)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        running = sum(1 for job in self._jobs.values() if job.status == "running")
+        return {
+            **self.counters,
+            "queued":      self._queue.qsize(),
+            "running":     running,
+            "queue_size":  self._queue.maxsize,
+            "workers":     self._worker_count,
+            "avg_run_sec": round(self._avg_run_sec, 2),
+        }
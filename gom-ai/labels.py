@@ -0,0 +1,112 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+from metrics import LABEL_RESOLUTIONS
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Words the models put around a village name ("làng gốm Bát Tràng", "gốm Chu Đậu")
+_NOISE_WORDS = frozenset({"lang", "gom", "su", "pottery", "ceramics", "village", "kiln"})
+
+
+# Lowercase ASCII form: NFD with combining marks removed, đ -> d, punctuation -> spaces
+def normalize_label(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    ascii_text = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+    return " ".join(_NON_ALNUM.sub(" ", ascii_text).split())
+
+
+# Levenshtein distance, giving up with limit + 1 as soon as it must exceed limit
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class LabelMatch:
+    def __init__(self, label: str, score: float, method: str):
+        self.label  = label
+        self.score  = score
+        self.method = method
+
+    @property
+    def mapped(self) -> bool:
+        return self.method != "unmapped"
+
+
+# Maps free-text village names from the agents, the SVM and the dataset folders onto the
+# canonical labels. Exact and contained aliases are dictionary lookups; anything else is
+# scored by edit distance against every alias, ties going to the earlier label, and is
+# unmapped (with the best guess and its score) below min_score. Results are memoised per input string.
+class LabelResolver:
+    def __init__(
+        self,
+        labels: list[str],
+        aliases: dict[str, list[str]] | None = None,
+        min_score: float = 0.7,
+        cache_size: int = 4096,
+    ):
+        self.labels    = list(labels)
+        self.min_score = min_score
+        self._exact: dict[str, str] = {}
+        # (alias, label index, label) in label order, for the contains and fuzzy passes
+        self._aliases: list[tuple[str, int, str]] = []
+        for index, label in enumerate(self.labels):
+            for alias in [label, *(aliases or {}).get(label, [])]:
+                key = normalize_label(alias)
+                if key not in self._exact:
+                    self._aliases.append((key, index, label))
+                self._exact.setdefault(key, label)
+                self._exact.setdefault(key.replace(" ", ""), label)
+        self._match = lru_cache(maxsize=cache_size)(self._match_uncached)
+
+    def _match_uncached(self, key: str) -> LabelMatch:
+        if not key:
+            return LabelMatch(self.labels[0], 0.0, "unmapped")
+        label = self._exact.get(key) or self._exact.get(key.replace(" ", ""))
+        if label:
+            return LabelMatch(label, 1.0, "exact")
+        # A name inside longer text: the first one mentioned wins, then the longest
+        padded = f" {key} "
+        contained = [
+            (padded.find(f" {alias} "), -len(alias), index, label)
+            for alias, index, label in self._aliases
+            if f" {alias} " in padded
+        ]
+        if contained:
+            return LabelMatch(min(contained)[3], 0.95, "contains")
+
+        words = [w for w in key.split() if w not in _NOISE_WORDS]
+        candidate = " ".join(words) or key
+        best_label, best_score = self.labels[0], 0.0
+        for alias, _, label in self._aliases:
+            longest = max(len(alias), len(candidate))
+            limit = int(longest * (1 - self.min_score))
+            distance = _edit_distance(candidate, alias, limit)
+            score = 1 - distance / longest
+            # Strictly greater keeps the earlier label on ties
+            if distance <= limit and score > best_score:
+                best_label, best_score = label, score
+        method = "fuzzy" if best_score >= self.min_score else "unmapped"
+        return LabelMatch(best_label, round(best_score, 3), method)
+
+    # field names the source ("council", "historian", "skeptic", ...) on the metric
+    def resolve(self, raw: str, field: str = "council") -> LabelMatch:
+        match = self._match(normalize_label(str(raw or "")))
+        LABEL_RESOLUTIONS.inc(field, match.method)
+        return match
+
+    # Canonical label, or raw unchanged when it cannot be mapped
+    def canonical(self, raw: str, field: str) -> str:
+        match = self.resolve(raw, field)
+        return match.label if match.mapped else raw
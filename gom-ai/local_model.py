@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from PIL import Image
+
+logger = logging.getLogger("gom-ai-tadp.local")
+
+# Must match IMG_SIZE in train/extract_features.py
+IMG_SIZE = (224, 224)
+
+
+# ResNet50 + SVM classifier trained by train/extract_features.py, run on CPU before the
+# LLM debate. Needs scikit-learn and joblib. The backbone is anything
+# backbone.load_feature_extractor accepts, relative to model_dir: by default
+# model_dir/backbone when it exists (an export from train/export_backbone.py, which runs
+# on tflite-runtime alone), else the float Keras model, which needs tensorflow.
+# Disabled when model_dir is empty.
+class LocalClassifier:
+    def __init__(
+        self,
+        model_dir: str,
+        label_resolver: Callable[[str], str],
+        threshold: float = 0.9,
+        top_k: int = 3,
+        backbone: str = "",
+    ):
+        self.model_dir  = model_dir
+        self.backbone   = backbone
+        self.threshold  = threshold
+        self.top_k      = top_k
+        self._resolve   = label_resolver
+        self._extract: Callable | None = None
+        self._svm       = None
+        self._labels: list[str] = []
+        self._np = None
+        self.version = "nolocal"
+        self.load_error: str | None = None
+        # TensorFlow inference is serialised on one thread; it parallelises internally
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-model")
+        self.counters = {
+            "predictions":   0,
+            "short_circuit": 0,
+            "compared":      0,
+            "agreed":        0,
+            "errors":        0,
+            "total_ms":      0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.model_dir)
+
+    @property
+    def ready(self) -> bool:
+        return self._svm is not None
+
+    # Blocking: imports TensorFlow and builds the backbone, so call it off the event loop
+    def load(self) -> None:
+        if not self.enabled or self.ready:
+            return
+        started = time.perf_counter()
+        try:
+            import joblib
+            import numpy as np
+
+            from backbone import KERAS_VERSION, load_feature_extractor
+
+            svm_path = os.path.join(self.model_dir, "gom_svm.pkl")
+            with open(svm_path, "rb") as f:
+                version = "svm-" + hashlib.sha256(f.read()).hexdigest()[:12]
+            svm = joblib.load(svm_path)
+            class_names = joblib.load(os.path.join(self.model_dir, "class_names.pkl"))
+
+            self._extract = load_feature_extractor(self._backbone_path())
+            if self._extract.version != KERAS_VERSION:
+                version += "+" + self._extract.version
+            self._np = np
+            self._labels = [self._resolve(str(name)) for name in class_names]
+            # Verdict keys carry the version, so it only changes once predictions can run;
+            # until then, or after a failure, they stay under "nolocal"
+            self.version = version
+            self._svm = svm
+        except Exception as exc:
+            self.load_error = str(exc)
+            logger.error("Local model disabled, failed to load from %s: %s", self.model_dir, exc)
+            return
+        logger.info(
+            "Local model %s loaded in %.1f s, classes=%s",
+            self.version, time.perf_counter() - started, self._labels,
+        )
+
+    def _backbone_path(self) -> str:
+        if self.backbone:
+            return os.path.join(self.model_dir, self.backbone)
+        default = os.path.join(self.model_dir, "backbone")
+        return default if os.path.isdir(default) else ""
+
+    def _predict(self, image_bytes: bytes) -> tuple[dict, object]:
+        np = self._np
+        started = time.perf_counter()
+        # Nearest-neighbour resize, like keras load_img(target_size=...) in training
+        img = Image.open(io.BytesIO(image_bytes)).convert("RGB").resize(IMG_SIZE, Image.NEAREST)
+        batch = np.asarray(img, dtype=np.float32)[np.newaxis, ...]
+        features = self._extract(batch).reshape(1, -1)
+        proba = self._svm.predict_proba(features)[0]
+        order = np.argsort(proba)[::-1][: self.top_k]
+        top = [
+            {"label": self._labels[self._svm.classes_[i]], "probability": round(float(proba[i]), 4)}
+            for i in order
+        ]
+        return {
+            "label":      top[0]["label"],
+            "confidence": top[0]["probability"],
+            "top_k":      top,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "version":    self.version,
+        }, features[0]
+
+    # Returns (prediction, 2048-d embedding), or (None, None) when the model is disabled,
+    # not loaded, or fails on this image
+    async def classify(self, image_bytes: bytes) -> tuple[dict | None, object]:
+        if not self.ready:
+            return None, None
+        loop = asyncio.get_running_loop()
+        try:
+            result, embedding = await loop.run_in_executor(self._executor, self._predict, image_bytes)
+        except Exception as exc:
+            self.counters["errors"] += 1
+            logger.warning("Local model failed on image: %s", exc)
+            return None, None
+        self.counters["predictions"] += 1
+        self.counters["total_ms"] += result["latency_ms"]
+        result["confident"] = result["confidence"] >= self.threshold
+        return result, embedding
+
+    def record_short_circuit(self) -> None:
+        self.counters["short_circuit"] += 1
+
+    def record_agreement(self, local: dict, llm_label: str) -> bool:
+        agrees = local["label"] == llm_label
+        self.counters["compared"] += 1
+        self.counters["agreed"] += int(agrees)
+        return agrees
+
+    def stats(self) -> dict:
+        predictions = self.counters["predictions"]
+        compared = self.counters["compared"]
+        return {
+            "enabled":        self.enabled,
+            "ready":          self.ready,
+            "version":        self.version,
+            "load_error":     self.load_error,
+            "threshold":      self.threshold,
+            **self.counters,
+            "total_ms":       round(self.counters["total_ms"], 1),
+            "avg_ms":         round(self.counters["total_ms"] / predictions, 1) if predictions else 0.0,
+            "agreement_rate": round(self.counters["agreed"] / compared, 4) if compared else None,
+        }
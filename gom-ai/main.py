@@ -1,21 +1,42 @@
 import asyncio
+import base64
+import hashlib
 import json
 import logging
 import os
-import re
 import sys
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from typing import Callable, Literal
 
-import openai
-from dotenv import load_dotenv
-from fastapi import FastAPI, File, HTTPException, UploadFile
+# Start of the app import, for the time-to-serving and time-to-ready measurements
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, File, Header, HTTPException, Query, Response, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pathlib import Path
 
-try:
-    from google import genai as google_genai
-    from google.genai import types as genai_types
-    _GENAI_AVAILABLE = True
-except ImportError:
-    _GENAI_AVAILABLE = False
+from agent_outputs import (
+    council_output, debate_summary, historian_output, observer_output, skeptic_output,
+)
+from clients import GENAI_AVAILABLE, ProviderClients
+from compaction import estimate_tokens
+from failover import SUPERSEDED, FailoverRouter, ProvidersExhaustedError
+from jobs import JobManager, QueueFullError
+from labels import LabelResolver
+from local_model import LocalClassifier
+from metrics import (
+    COUNCIL_CONTEXT_TOKENS, PREPROCESS_LATENCY, REQUEST_LATENCY, RequestTrace, current_trace, record_agent_call, registry,
+)
+from preprocess import ImagePreprocessor, InvalidImageError
+from ratelimit import ProviderGate
+from response_parser import parse_response
+from similarity import SimilarityIndex
+from trail_store import TrailStore, output_summary
+from upload_store import BodyLimitMiddleware, StoredUpload, UploadStore, UploadTooLargeError
+from verdict_cache import VerdictCache, image_hash, verdict_key
+from warmup import Warmup
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,31 +46,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger("gom-ai-tadp")
 
-load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env", override=True)
+# bench/run_benchmark.py sets NO_DOTENV so .env cannot point its server at real providers
+ENV_FILE = Path(__file__).resolve().parent / ".env"
+if ENV_FILE.exists() and not os.getenv("NO_DOTENV"):
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=ENV_FILE, override=True)
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 XAI_API_KEY    = os.getenv("XAI_API_KEY", "")
 
-logger.info(
-    "API keys  GOOGLE:%s  OPENAI:%s  XAI:%s  genai_sdk:%s",
-    "OK" if GOOGLE_API_KEY else "MISSING",
-    "OK" if OPENAI_API_KEY else "MISSING",
-    "OK" if XAI_API_KEY    else "MISSING",
-    "OK" if _GENAI_AVAILABLE else "NOT INSTALLED",
+# Uploads are kept content-addressed under UPLOAD_FOLDER; the least recently uploaded are
+# evicted past UPLOAD_MAX_FILES files, UPLOAD_MAX_TOTAL_MB or UPLOAD_RETENTION_SEC (0 = no limit),
+# checked on every upload and every UPLOAD_SWEEP_SEC
+UPLOAD_FOLDER        = "uploads"
+UPLOAD_MAX_MB        = int(os.getenv("UPLOAD_MAX_MB", "50"))
+UPLOAD_MAX_FILES     = int(os.getenv("UPLOAD_MAX_FILES", "5000"))
+UPLOAD_MAX_TOTAL_MB  = int(os.getenv("UPLOAD_MAX_TOTAL_MB", "2048"))
+UPLOAD_RETENTION_SEC = float(os.getenv("UPLOAD_RETENTION_SEC", str(30 * 24 * 3600)))
+UPLOAD_SWEEP_SEC     = float(os.getenv("UPLOAD_SWEEP_SEC", "3600"))
+# Single-image requests carry one file plus a little multipart framing
+UPLOAD_PATHS         = ("/predict", "/predict/stream", "/jobs")
+MULTIPART_OVERHEAD   = 64 * 1024
+
+upload_store = UploadStore(
+    UPLOAD_FOLDER,
+    max_upload_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+    max_files=UPLOAD_MAX_FILES,
+    max_bytes=UPLOAD_MAX_TOTAL_MB * 1024 * 1024,
+    retention_sec=UPLOAD_RETENTION_SEC,
+    sweep_sec=UPLOAD_SWEEP_SEC,
 )
 
-app = FastAPI(title="Gom AI TADP")
-
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
 # Recognized pottery origin labels accepted by the classifier
 VALID_LABELS = [
     "Bat Trang", "Bau Truc", "Bien Hoa", "Chu Dau",
     "Dong Trieu", "Lai Thieu", "Phu Lang", "Thanh Ha", "Tho Ha",
 ]
 
+# Maps the village names the agents write ("Bát Tràng", "làng gốm Chu Đậu", typos) onto
+# VALID_LABELS; names it cannot map are counted on /metrics
+LABEL_MATCH_MIN_SCORE = float(os.getenv("LABEL_MATCH_MIN_SCORE", "0.7"))
+label_resolver = LabelResolver(VALID_LABELS, min_score=LABEL_MATCH_MIN_SCORE)
+
+# "sequential": Historian, then Skeptic on the Historian's hypotheses.
+# "concurrent": Historian and Skeptic run at the same time, the Skeptic on hypotheses
+# seeded from the local model (or its own); one remote call off the critical path.
+# Overridable per request with ?mode=.
+PipelineMode = Literal["sequential", "concurrent"]
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential")
+if PIPELINE_MODE not in ("sequential", "concurrent"):
+    raise ValueError(f"PIPELINE_MODE must be sequential or concurrent, got {PIPELINE_MODE!r}")
+
+# The Council reads a deduplicated summary built from the parsed agent outputs instead of
+# the three raw transcripts, trimmed to about COUNCIL_CONTEXT_BUDGET tokens (0 = no trimming)
+COUNCIL_COMPACT        = os.getenv("COUNCIL_COMPACT", "true").lower() == "true"
+COUNCIL_CONTEXT_BUDGET = int(os.getenv("COUNCIL_CONTEXT_BUDGET", "900"))
+
 # Per-agent timeout (seconds) and total hard cap for the full pipeline
 AGENT_TIMEOUT_SEC = 50
 TOTAL_TIMEOUT_SEC = 210
@@ -57,8 +111,225 @@ TOTAL_TIMEOUT_SEC = 210
 GEMINI_MODEL = "gemini-2.5-flash"
 OPENAI_MODEL = "gpt-4o-mini"
 GROK_MODEL   = "grok-4-latest"
-OPENAI_BASE  = "https://api.openai.com/v1"
-XAI_BASE     = "https://api.x.ai/v1"
+OPENAI_BASE  = os.getenv("OPENAI_BASE", "https://api.openai.com/v1")
+XAI_BASE     = os.getenv("XAI_BASE", "https://api.x.ai/v1")
+# Empty uses the SDK's default Gemini endpoint
+GEMINI_BASE  = os.getenv("GEMINI_BASE", "")
+
+# List prices in USD per 1M (prompt, completion) tokens, for the cost estimates on /metrics
+MODEL_PRICES_USD_PER_M = {
+    GEMINI_MODEL: (0.30, 2.50),
+    OPENAI_MODEL: (0.15, 0.60),
+    GROK_MODEL:   (3.00, 15.00),
+}
+
+# Keep-alive connection pool sizing, shared by each provider's long-lived client
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+HTTP_POOL_MAX_KEEPALIVE   = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10"))
+HTTP_POOL_KEEPALIVE_SEC   = float(os.getenv("HTTP_POOL_KEEPALIVE_SEC", "60"))
+
+provider_clients = ProviderClients(
+    google_api_key=GOOGLE_API_KEY,
+    openai_api_key=OPENAI_API_KEY,
+    xai_api_key=XAI_API_KEY,
+    openai_base=OPENAI_BASE,
+    xai_base=XAI_BASE,
+    gemini_base=GEMINI_BASE,
+    max_connections=HTTP_POOL_MAX_CONNECTIONS,
+    max_keepalive=HTTP_POOL_MAX_KEEPALIVE,
+    keepalive_expiry=HTTP_POOL_KEEPALIVE_SEC,
+)
+
+PROVIDER_MODELS = {"gemini": GEMINI_MODEL, "openai": OPENAI_MODEL, "xai": GROK_MODEL}
+
+
+# Comma-separated provider order for one debate role, e.g. "xai,openai"
+def _role_backends(env_name: str, default: str) -> list[str]:
+    names = [name.strip() for name in os.getenv(env_name, default).split(",") if name.strip()]
+    unknown = [name for name in names if name not in PROVIDER_MODELS]
+    if unknown or not names:
+        raise ValueError(f"{env_name}: expected providers from {list(PROVIDER_MODELS)}, got {names}")
+    return names
+
+
+# Provider order per debate role: the first is the primary, the rest take over when it
+# fails, its circuit breaker is open, or (with hedging) it is slower than usual
+ROLE_BACKENDS = {
+    "observer":  _role_backends("OBSERVER_BACKENDS", "gemini,openai"),
+    "historian": _role_backends("HISTORIAN_BACKENDS", "openai,gemini"),
+    "skeptic":   _role_backends("SKEPTIC_BACKENDS", "xai,openai"),
+    "council":   _role_backends("COUNCIL_BACKENDS", "gemini,openai"),
+}
+
+CIRCUIT_FAILURES     = int(os.getenv("CIRCUIT_FAILURES", "3"))
+CIRCUIT_COOLDOWN_SEC = float(os.getenv("CIRCUIT_COOLDOWN_SEC", "30"))
+SLOW_CALL_SEC        = float(os.getenv("SLOW_CALL_SEC", "20"))
+BACKEND_TIMEOUT_SEC  = float(os.getenv("BACKEND_TIMEOUT_SEC", "30"))
+HEDGE_QUANTILE       = float(os.getenv("HEDGE_QUANTILE", "0"))
+HEDGE_MIN_DELAY_SEC  = float(os.getenv("HEDGE_MIN_DELAY_SEC", "1.5"))
+
+# Process-wide admission control per provider, shared by every endpoint: at most
+# <NAME>_MAX_CONCURRENT calls in flight and <NAME>_RPM calls started per minute (0 = no limit)
+provider_gates = {
+    name: ProviderGate(
+        name,
+        max_concurrent=int(os.getenv(f"{name.upper()}_MAX_CONCURRENT", "16")),
+        rpm=float(os.getenv(f"{name.upper()}_RPM", "0")),
+    )
+    for name in PROVIDER_MODELS
+}
+
+provider_router = FailoverRouter(
+    list(PROVIDER_MODELS),
+    failure_threshold=CIRCUIT_FAILURES,
+    cooldown_sec=CIRCUIT_COOLDOWN_SEC,
+    slow_call_sec=SLOW_CALL_SEC,
+    attempt_timeout_sec=BACKEND_TIMEOUT_SEC,
+    hedge_quantile=HEDGE_QUANTILE,
+    hedge_min_delay_sec=HEDGE_MIN_DELAY_SEC,
+    gates=provider_gates,
+)
+
+# Verdict cache: in-memory LRU with TTL, plus an optional SQLite file that survives restarts,
+# purged of expired rows and capped at VERDICT_CACHE_DB_MAX_ROWS / _MAX_MB (0 = no limit)
+# at startup and every VERDICT_CACHE_PURGE_SEC
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "512"))
+VERDICT_CACHE_MAX_MB      = int(os.getenv("VERDICT_CACHE_MAX_MB", "32"))
+VERDICT_CACHE_TTL_SEC     = float(os.getenv("VERDICT_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+VERDICT_CACHE_DB          = os.getenv("VERDICT_CACHE_DB", "")
+VERDICT_CACHE_DB_MAX_ROWS = int(os.getenv("VERDICT_CACHE_DB_MAX_ROWS", "100000"))
+VERDICT_CACHE_DB_MAX_MB   = int(os.getenv("VERDICT_CACHE_DB_MAX_MB", "512"))
+VERDICT_CACHE_PURGE_SEC   = float(os.getenv("VERDICT_CACHE_PURGE_SEC", "3600"))
+
+verdict_cache = VerdictCache(
+    max_entries=VERDICT_CACHE_MAX_ENTRIES,
+    max_bytes=VERDICT_CACHE_MAX_MB * 1024 * 1024,
+    ttl_sec=VERDICT_CACHE_TTL_SEC,
+    sqlite_path=VERDICT_CACHE_DB,
+    disk_max_rows=VERDICT_CACHE_DB_MAX_ROWS,
+    disk_max_bytes=VERDICT_CACHE_DB_MAX_MB * 1024 * 1024,
+    purge_sec=VERDICT_CACHE_PURGE_SEC,
+)
+
+# Every pipeline run (not cache hits) is appended to TRAIL_STORE_DB with its raw agent
+# responses, versions and timings, for offline replay with bench/replay_trails.py.
+# Empty (the default) disables it; the oldest runs are dropped past TRAIL_STORE_MAX_RUNS
+# (0 = no limit).
+TRAIL_STORE_DB       = os.getenv("TRAIL_STORE_DB", "")
+TRAIL_STORE_MAX_RUNS = int(os.getenv("TRAIL_STORE_MAX_RUNS", "100000"))
+
+trail_store = TrailStore(TRAIL_STORE_DB, max_runs=TRAIL_STORE_MAX_RUNS)
+
+# Asynchronous job mode: bounded queue drained by a fixed worker pool
+JOB_WORKERS       = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE    = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_RETENTION_SEC = float(os.getenv("JOB_RETENTION_SEC", "3600"))
+
+# POST /predict_batch: images analysed at once per batch, and the most images one batch may hold
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_IMAGES  = int(os.getenv("BATCH_MAX_IMAGES", "500"))
+BATCH_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".heic", ".heif")
+
+# Interval between SSE comment lines that keep idle proxies from closing /predict/stream
+SSE_KEEPALIVE_SEC = float(os.getenv("SSE_KEEPALIVE_SEC", "15"))
+
+# Uploads are downscaled and re-encoded as metadata-free JPEG before reaching Gemini
+IMAGE_MAX_SIDE           = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+IMAGE_JPEG_QUALITY       = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "2"))
+
+image_preprocessor = ImagePreprocessor(
+    max_side=IMAGE_MAX_SIDE,
+    quality=IMAGE_JPEG_QUALITY,
+    workers=IMAGE_PREPROCESS_WORKERS,
+)
+
+# Local ResNet50+SVM pre-filter; empty LOCAL_MODEL_DIR disables it
+LOCAL_MODEL_DIR           = os.getenv("LOCAL_MODEL_DIR", "")
+LOCAL_MODEL_THRESHOLD     = float(os.getenv("LOCAL_MODEL_THRESHOLD", "0.9"))
+LOCAL_MODEL_TOP_K         = int(os.getenv("LOCAL_MODEL_TOP_K", "3"))
+LOCAL_MODEL_SKIP_OBSERVER = os.getenv("LOCAL_MODEL_SKIP_OBSERVER", "false").lower() == "true"
+# Export dir, .tflite or SavedModel under LOCAL_MODEL_DIR; empty: its backbone/ dir if any
+LOCAL_MODEL_BACKBONE      = os.getenv("LOCAL_MODEL_BACKBONE", "")
+
+# Similarity index over ResNet50 embeddings: the training feature store plus classified uploads
+SIMILARITY_STORE_DIR  = os.getenv("SIMILARITY_STORE_DIR", "")
+SIMILARITY_MODE       = os.getenv("SIMILARITY_MODE", "flat")
+SIMILARITY_NLIST      = int(os.getenv("SIMILARITY_NLIST", "64"))
+SIMILARITY_NPROBE     = int(os.getenv("SIMILARITY_NPROBE", "8"))
+SIMILARITY_UPLOADS_DB = os.getenv("SIMILARITY_UPLOADS_DB", "")
+
+similarity_index = SimilarityIndex(
+    mode=SIMILARITY_MODE,
+    nlist=SIMILARITY_NLIST,
+    nprobe=SIMILARITY_NPROBE,
+    uploads_db=SIMILARITY_UPLOADS_DB,
+)
+
+
+def _load_similarity_index() -> None:
+    dataset = uploads = 0
+    if SIMILARITY_STORE_DIR:
+        try:
+            dataset = similarity_index.load_feature_store(
+                SIMILARITY_STORE_DIR, lambda raw: label_resolver.resolve(raw, "dataset").label,
+            )
+        except (OSError, ValueError, KeyError) as exc:
+            logger.error("Cannot load feature store %s: %s", SIMILARITY_STORE_DIR, exc)
+    uploads = similarity_index.load_uploads()
+    similarity_index.build()
+    logger.info("Similarity index ready: %d dataset + %d upload vectors", dataset, uploads)
+
+
+# Warmed in the background once the server is listening. /readyz waits for the provider
+# clients, and for the local model too with READY_WAIT_FOR_LOCAL_MODEL; until it is
+# loaded, requests run the full debate without the local pre-filter. The similarity index
+# loads before the local model, which is what adds uploads to it.
+READY_WAIT_FOR_LOCAL_MODEL = os.getenv("READY_WAIT_FOR_LOCAL_MODEL", "false").lower() == "true"
+
+def _load_local_model() -> None:
+    local_classifier.load()
+    if local_classifier.load_error:
+        raise RuntimeError(local_classifier.load_error)
+
+
+warmup = Warmup(IMPORT_STARTED)
+warmup.add_group(("providers", provider_clients.warm, True))
+warmup.add_group(
+    ("similarity", _load_similarity_index, False),
+    ("local_model", _load_local_model, READY_WAIT_FOR_LOCAL_MODEL),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(
+        "API keys  GOOGLE:%s  OPENAI:%s  XAI:%s  genai_sdk:%s",
+        "OK" if GOOGLE_API_KEY else "MISSING",
+        "OK" if OPENAI_API_KEY else "MISSING",
+        "OK" if XAI_API_KEY    else "MISSING",
+        "OK" if GENAI_AVAILABLE else "NOT INSTALLED",
+    )
+    logger.info("Upload store: %d files kept", await asyncio.to_thread(upload_store.load))
+    upload_store.start()
+    verdict_cache.start()
+    job_manager.start()
+    warmup.start()
+    yield
+    await warmup.stop()
+    await job_manager.stop()
+    await verdict_cache.stop()
+    await upload_store.stop()
+    await provider_clients.aclose()
+
+
+app = FastAPI(title="Gom AI TADP", lifespan=lifespan)
+app.add_middleware(
+    BodyLimitMiddleware,
+    paths=UPLOAD_PATHS,
+    max_bytes=UPLOAD_MAX_MB * 1024 * 1024 + MULTIPART_OVERHEAD,
+    detail=f"Ảnh vượt quá {UPLOAD_MAX_MB} MB.",
+)
 
 PROMPT_AGENT1_OBSERVER = """\
 Bạn là chuyên gia phân tích vật lý gốm sứ cổ Việt Nam với 30 năm kinh nghiệm.
@@ -143,229 +414,478 @@ Nhiệm vụ: Tổng hợp toàn bộ tranh luận và đưa ra PHÁN QUYẾT CU
 Không dùng markdown. Trả lời bằng tiếng Việt có đầy đủ dấu.\
 """
 
+PROMPT_META_COUNCIL_COMPACT = """\
+Bạn là Hội đồng chuyên gia gốm sứ Việt Nam. Sau đây là tóm tắt phiên tranh luận giữa \
+Quan sát viên, Sử gia và Người hoài nghi:
 
-def _strip_markdown(text: str) -> str:
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\*{2}(.+?)\*{2}', r'\1', text, flags=re.DOTALL)
-    text = re.sub(r'_{2}(.+?)_{2}',   r'\1', text, flags=re.DOTALL)
-    text = re.sub(r'\*(.+?)\*',       r'\1', text, flags=re.DOTALL)
-    text = re.sub(r'_(.+?)_',         r'\1', text, flags=re.DOTALL)
-    text = re.sub(r'^\s*[-*]\s+',     '', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*\d+\.\s+',    '', text, flags=re.MULTILINE)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    return text.strip()
+{summary}
+
+Nhiệm vụ: Tổng hợp toàn bộ tranh luận và đưa ra PHÁN QUYẾT CUỐI CÙNG:
+1. Viết 2–3 câu tóm tắt bằng chứng và lý luận chính (văn xuôi, không markdown).
+2. Xác định ĐÚNG MỘT làng gốm từ danh sách: Bat Trang, Bau Truc, Bien Hoa, Chu Dau, Dong Trieu, Lai Thieu, Phu Lang, Thanh Ha, Tho Ha.
+3. Cuối cùng, trả về ĐÚNG MỘT dòng JSON:
+{{"predicted_label": "<tên làng>", "confidence": <0.0–1.0>, "forgery_risk": "<rất thấp|thấp|trung bình|cao|rất cao>"}}
 
+Không dùng markdown. Trả lời bằng tiếng Việt có đầy đủ dấu.\
+"""
+
+# Appended to the Historian prompt when the local model is unsure but has candidates
+PROMPT_HISTORIAN_LOCAL_HINT = """
+
+Gợi ý từ mô hình thị giác cục bộ (ResNet50 + SVM), xếp theo xác suất giảm dần:
+{candidates}
+Hãy ưu tiên cân nhắc các làng gốm này, nhưng mọi lập luận vẫn phải dựa trên bản mô tả.\
+"""
+
+# Stands in for the Historian's output when the Skeptic runs concurrently with it
+PROMPT_SKEPTIC_SEEDED_CANDIDATES = """\
+Giả thuyết A: {label_a} (đề xuất sơ bộ của mô hình thị giác cục bộ, xác suất {prob_a:.0f}%)
+Giả thuyết B: {label_b} (đề xuất sơ bộ của mô hình thị giác cục bộ, xác suất {prob_b:.0f}%)
+Sử gia đang lập luận độc lập; hãy phản biện hai giả thuyết này chỉ dựa trên bản mô tả.\
+"""
+
+PROMPT_SKEPTIC_SEEDED_OPEN = """\
+Sử gia chưa đưa ra giả thuyết. Hãy tự chọn hai làng gốm có khả năng nhất trong danh sách \
+Bat Trang, Bau Truc, Bien Hoa, Chu Dau, Dong Trieu, Lai Thieu, Phu Lang, Thanh Ha, Tho Ha, \
+gọi là Giả thuyết A và Giả thuyết B, rồi phản biện chúng như dưới đây.\
+"""
+
+# Changes whenever any prompt is edited, so cached verdicts from older prompts are not reused
+PROMPT_VERSION = hashlib.sha256(
+    "\0".join([
+        PROMPT_AGENT1_OBSERVER, PROMPT_AGENT2_HISTORIAN, PROMPT_HISTORIAN_LOCAL_HINT,
+        PROMPT_AGENT3_SKEPTIC, PROMPT_META_COUNCIL,
+        PROMPT_SKEPTIC_SEEDED_CANDIDATES, PROMPT_SKEPTIC_SEEDED_OPEN, PROMPT_META_COUNCIL_COMPACT,
+        f"compact={COUNCIL_COMPACT}:{COUNCIL_CONTEXT_BUDGET}",
+    ]).encode("utf-8")
+).hexdigest()[:12]
+
+
+local_classifier = LocalClassifier(
+    LOCAL_MODEL_DIR,
+    label_resolver=lambda raw: label_resolver.resolve(raw, "local_model").label,
+    threshold=LOCAL_MODEL_THRESHOLD,
+    top_k=LOCAL_MODEL_TOP_K,
+    backbone=LOCAL_MODEL_BACKBONE,
+)
+
+
+# Token-delta callback: receives each text chunk as the provider streams it
+DeltaCallback = Callable[[str], None]
 
-# Extracts the last JSON object from a model response, stripping code fences
-def _extract_json(text: str) -> dict:
-    text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
-    matches = list(re.finditer(r'\{[^{}]*\}', text, re.DOTALL))
-    if matches:
-        try:
-            return json.loads(matches[-1].group())
-        except json.JSONDecodeError:
-            pass
-    return {}
+
+# One Gemini call; streams chunks to on_delta when given, returns the full text.
+# Wall time, time to first token, token usage and cost are recorded under agent.
+async def _gemini_generate(
+    agent: str,
+    contents: list,
+    on_delta: DeltaCallback | None = None,
+    config=None,
+) -> str:
+    client = provider_clients.gemini()
+    started = time.perf_counter()
+    ttft = usage = None
+    outcome = "error"
+    try:
+        if on_delta is None:
+            response = await client.aio.models.generate_content(
+                model=GEMINI_MODEL, contents=contents, config=config,
+            )
+            usage = response.usage_metadata
+            outcome = "ok"
+            return response.text or ""
+        parts: list[str] = []
+        stream = await client.aio.models.generate_content_stream(
+            model=GEMINI_MODEL, contents=contents, config=config,
+        )
+        async for chunk in stream:
+            usage = chunk.usage_metadata or usage
+            delta = chunk.text or ""
+            if delta:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(delta)
+                on_delta(delta)
+        outcome = "ok"
+        return "".join(parts)
+    except asyncio.CancelledError as exc:
+        outcome = "superseded" if SUPERSEDED in exc.args else "timeout"
+        raise
+    finally:
+        record_agent_call(
+            MODEL_PRICES_USD_PER_M, agent, GEMINI_MODEL, time.perf_counter() - started, outcome, ttft,
+            getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None),
+        )
 
 
-# Returns the prose section before the final JSON block in a model response
-def _text_before_json(text: str) -> str:
-    match = re.search(r'\{[^{}]*\}(?!.*\{)', text, re.DOTALL)
-    if match:
-        return _strip_markdown(text[:match.start()].strip())
-    return _strip_markdown(text)
+# One chat completion against an OpenAI-compatible endpoint (OpenAI or xAI)
+async def _chat_generate(
+    agent: str,
+    client,
+    model: str,
+    messages: list[dict],
+    temperature: float | None,
+    on_delta: DeltaCallback | None = None,
+) -> str:
+    options = {"max_tokens": 800}
+    if temperature is not None:
+        options["temperature"] = temperature
+    started = time.perf_counter()
+    ttft = usage = None
+    outcome = "error"
+    try:
+        if on_delta is None:
+            resp = await client.chat.completions.create(model=model, messages=messages, **options)
+            usage = resp.usage
+            outcome = "ok"
+            return resp.choices[0].message.content or ""
+        parts: list[str] = []
+        stream = await client.chat.completions.create(
+            model=model, messages=messages, **options,
+            stream=True, stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # With include_usage the last chunk has no choices, only the usage totals
+            usage = chunk.usage or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(delta)
+                on_delta(delta)
+        outcome = "ok"
+        return "".join(parts)
+    except asyncio.CancelledError as exc:
+        outcome = "superseded" if SUPERSEDED in exc.args else "timeout"
+        raise
+    finally:
+        record_agent_call(
+            MODEL_PRICES_USD_PER_M, agent, model, time.perf_counter() - started, outcome, ttft,
+            getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None),
+        )
 
 
-def _closest_label(raw: str) -> str:
-    raw_lower = raw.lower()
-    for label in VALID_LABELS:
-        if label.lower() in raw_lower or raw_lower in label.lower():
-            return label
-    return max(VALID_LABELS, key=lambda lbl: sum(c in raw_lower for c in lbl.lower()))
+# One role prompt on one provider. image is (bytes, mime type) for vision calls;
+# temperature None keeps the provider default.
+async def _provider_generate(
+    agent: str,
+    provider: str,
+    prompt: str,
+    on_delta: DeltaCallback | None = None,
+    image: tuple[bytes, str] | None = None,
+    system: str | None = None,
+    temperature: float | None = None,
+) -> str:
+    if provider == "gemini":
+        from google.genai import types as genai_types
+
+        contents = []
+        if image is not None:
+            contents.append(genai_types.Part.from_bytes(data=image[0], mime_type=image[1]))
+        contents.append(genai_types.Part.from_text(text=prompt))
+        config = None
+        if system is not None or temperature is not None:
+            config = genai_types.GenerateContentConfig(system_instruction=system, temperature=temperature)
+        return await _gemini_generate(agent, contents, on_delta, config)
+
+    content: str | list[dict] = prompt
+    if image is not None:
+        data_url = f"data:{image[1]};base64,{base64.b64encode(image[0]).decode()}"
+        content = [
+            {"type": "image_url", "image_url": {"url": data_url}},
+            {"type": "text", "text": prompt},
+        ]
+    messages = [{"role": "system", "content": system}] if system is not None else []
+    messages.append({"role": "user", "content": content})
+    client = provider_clients.openai() if provider == "openai" else provider_clients.xai()
+    return await _chat_generate(agent, client, PROVIDER_MODELS[provider], messages, temperature, on_delta)
+
+
+def _provider_available(provider: str) -> bool:
+    if provider == "gemini":
+        return bool(GOOGLE_API_KEY) and GENAI_AVAILABLE
+    return bool(OPENAI_API_KEY if provider == "openai" else XAI_API_KEY)
+
+
+_PROVIDER_KEY_NAMES = {"gemini": "GOOGLE_API_KEY", "openai": "OPENAI_API_KEY", "xai": "XAI_API_KEY"}
+
+
+# Runs a role on its configured providers with failover and hedging; returns (model, text)
+async def _routed_generate(
+    role: str,
+    prompt: str,
+    on_delta: DeltaCallback | None = None,
+    **options,
+) -> tuple[str, str]:
+    providers = [p for p in ROLE_BACKENDS[role] if _provider_available(p)]
+    if not providers:
+        primary = ROLE_BACKENDS[role][0]
+        if primary == "gemini" and GOOGLE_API_KEY:
+            raise HTTPException(500, detail="Thư viện google-genai chưa được cài đặt.")
+        raise HTTPException(500, detail=f"{_PROVIDER_KEY_NAMES[primary]} chưa được thiết lập trong .env")
+    try:
+        provider, raw = await provider_router.run(
+            role,
+            providers,
+            lambda p, forward: _provider_generate(role, p, prompt, forward, **options),
+            on_delta,
+        )
+    except ProvidersExhaustedError as exc:
+        # Every provider timing out is still a timeout (504) to the caller
+        if isinstance(exc.last, asyncio.TimeoutError):
+            raise asyncio.TimeoutError(str(exc)) from exc
+        raise
+    return PROVIDER_MODELS[provider], raw
 
 
+# ", đã thử a, b" when the router got as far as calling providers, for the 502 details
+def _tried(exc: Exception) -> str:
+    if isinstance(exc, ProvidersExhaustedError):
+        return f", đã thử {', '.join(exc.attempted)}"
+    return ""
 
-async def _agent1_observer(image_bytes: bytes) -> dict:
-    if not GOOGLE_API_KEY:
-        raise HTTPException(500, detail="GOOGLE_API_KEY chưa được thiết lập trong .env")
-    if not _GENAI_AVAILABLE:
-        raise HTTPException(500, detail="Thư viện google-genai chưa được cài đặt.")
-    logger.info("[Agent1] Calling %s", GEMINI_MODEL)
+
+async def _agent1_observer(
+    image_bytes: bytes,
+    mime_type: str = "image/jpeg",
+    on_delta: DeltaCallback | None = None,
+) -> dict:
+    logger.info("[Agent1] Calling %s", ROLE_BACKENDS["observer"])
     try:
-        client = google_genai.Client(api_key=GOOGLE_API_KEY)
-        response = await asyncio.wait_for(
-            client.aio.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=[
-                    genai_types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                    genai_types.Part.from_text(text=PROMPT_AGENT1_OBSERVER),
-                ],
+        model, raw = await asyncio.wait_for(
+            _routed_generate(
+                "observer", PROMPT_AGENT1_OBSERVER, on_delta, image=(image_bytes, mime_type),
             ),
             timeout=AGENT_TIMEOUT_SEC,
         )
-        raw = response.text or ""
-        logger.info("[Agent1] Response: %s", raw[:250])
-        data = _extract_json(raw)
-        if data.get("is_pottery") is False:
-            return {"is_pottery": False, "observation": ""}
-        observation = _text_before_json(raw)
-        return {"is_pottery": True, "observation": observation, "raw": raw}
+        logger.info("[Agent1] Response (%s): %s", model, raw[:250])
+        return {**observer_output(parse_response(raw)), "raw": raw, "model": model}
     except asyncio.TimeoutError:
         raise HTTPException(504, detail="Agent 1 (Quan sát viên) hết thời gian chờ.")
     except HTTPException:
         raise
     except Exception as exc:
         logger.error("[Agent1] Error: %s", exc)
-        raise HTTPException(502, detail=f"Lỗi Agent 1 (Gemini Vision): {exc}")
+        raise HTTPException(502, detail=f"Lỗi Agent 1 (Quan sát viên{_tried(exc)}): {exc}")
 
 
 
-async def _agent2_historian(observation: str) -> dict:
-    if not OPENAI_API_KEY:
-        raise HTTPException(500, detail="OPENAI_API_KEY chưa được thiết lập trong .env")
-    logger.info("[Agent2] Calling %s", OPENAI_MODEL)
+async def _agent2_historian(
+    observation: str,
+    on_delta: DeltaCallback | None = None,
+    candidates: list[dict] | None = None,
+) -> dict:
+    logger.info("[Agent2] Calling %s", ROLE_BACKENDS["historian"])
     prompt = PROMPT_AGENT2_HISTORIAN.format(observation=observation)
+    if candidates:
+        prompt += PROMPT_HISTORIAN_LOCAL_HINT.format(candidates="\n".join(
+            f"- {c['label']}: {c['probability'] * 100:.0f}%" for c in candidates
+        ))
     try:
-        client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE)
-        resp = await asyncio.wait_for(
-            client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=800,
-                temperature=0.4,
-            ),
+        model, raw = await asyncio.wait_for(
+            _routed_generate("historian", prompt, on_delta, temperature=0.4),
             timeout=AGENT_TIMEOUT_SEC,
         )
-        raw = resp.choices[0].message.content or ""
-        logger.info("[Agent2] Response: %s", raw[:250])
-        data = _extract_json(raw)
-        hypotheses_text = _text_before_json(raw)
-        return {
-            "hypotheses_text": hypotheses_text,
-            "hypothesis_a":    data.get("hypothesis_a", ""),
-            "hypothesis_b":    data.get("hypothesis_b", ""),
-            "preferred":       data.get("preferred", "A"),
-            "raw":             raw,
-        }
+        logger.info("[Agent2] Response (%s): %s", model, raw[:250])
+        return {**historian_output(parse_response(raw), label_resolver), "raw": raw, "model": model}
     except asyncio.TimeoutError:
         raise HTTPException(504, detail="Agent 2 (Sử gia) hết thời gian chờ.")
     except HTTPException:
         raise
     except Exception as exc:
         logger.error("[Agent2] Error: %s", exc)
-        raise HTTPException(502, detail=f"Lỗi Agent 2 (OpenAI GPT-4o mini): {exc}")
+        raise HTTPException(502, detail=f"Lỗi Agent 2 (Sử gia{_tried(exc)}): {exc}")
 
 
 
-async def _agent3_skeptic(observation: str, hypotheses_text: str) -> dict:
-    if not XAI_API_KEY:
-        raise HTTPException(500, detail="XAI_API_KEY chưa được thiết lập trong .env")
-    logger.info("[Agent3] Calling %s", GROK_MODEL)
+async def _agent3_skeptic(
+    observation: str,
+    hypotheses_text: str,
+    on_delta: DeltaCallback | None = None,
+) -> dict:
+    logger.info("[Agent3] Calling %s", ROLE_BACKENDS["skeptic"])
     prompt = PROMPT_AGENT3_SKEPTIC.format(
         observation=observation, hypotheses=hypotheses_text
     )
     try:
-        client = openai.AsyncOpenAI(api_key=XAI_API_KEY, base_url=XAI_BASE)
-        resp = await asyncio.wait_for(
-            client.chat.completions.create(
-                model=GROK_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "Bạn là nhà nghiên cứu hoài nghi, sắc bén và thẳng thắn. "
-                            "Trả lời bằng tiếng Việt có đầy đủ dấu."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=800,
+        model, raw = await asyncio.wait_for(
+            _routed_generate(
+                "skeptic",
+                prompt,
+                on_delta,
+                system=(
+                    "Bạn là nhà nghiên cứu hoài nghi, sắc bén và thẳng thắn. "
+                    "Trả lời bằng tiếng Việt có đầy đủ dấu."
+                ),
                 temperature=0.5,
             ),
             timeout=AGENT_TIMEOUT_SEC,
         )
-        raw = resp.choices[0].message.content or ""
-        logger.info("[Agent3] Response: %s", raw[:250])
-        data = _extract_json(raw)
-        skeptic_text = _text_before_json(raw)
-        return {
-            "skeptic_text":  skeptic_text,
-            "leans_towards": data.get("leans_towards", ""),
-            "forgery_risk":  data.get("forgery_risk", "thấp"),
-            "raw":           raw,
-        }
+        logger.info("[Agent3] Response (%s): %s", model, raw[:250])
+        return {**skeptic_output(parse_response(raw), label_resolver), "raw": raw, "model": model}
     except asyncio.TimeoutError:
         raise HTTPException(504, detail="Agent 3 (Người hoài nghi) hết thời gian chờ.")
     except HTTPException:
         raise
     except Exception as exc:
         logger.error("[Agent3] Error: %s", exc)
-        raise HTTPException(502, detail=f"Lỗi Agent 3 (Grok 4 Latest – xAI): {exc}")
+        raise HTTPException(502, detail=f"Lỗi Agent 3 (Người hoài nghi{_tried(exc)}): {exc}")
+
+
 
+# Council input: the compacted debate summary, or the raw transcripts with COUNCIL_COMPACT off.
+# Both sizes are recorded so the saving shows on /metrics.
+def _council_prompt(a1: dict, a2: dict, a3: dict) -> str:
+    raw_prompt = PROMPT_META_COUNCIL.format(
+        agent1_output=a1["raw"],
+        agent2_output=a2["raw"],
+        agent3_output=a3["raw"],
+    )
+    raw_tokens = estimate_tokens(raw_prompt)
+    COUNCIL_CONTEXT_TOKENS.observe(raw_tokens, "raw")
+    if not COUNCIL_COMPACT:
+        return raw_prompt
+    summary = debate_summary(a1, a2, a3, COUNCIL_CONTEXT_BUDGET)
+    prompt = PROMPT_META_COUNCIL_COMPACT.format(summary=summary)
+    compact_tokens = estimate_tokens(prompt)
+    COUNCIL_CONTEXT_TOKENS.observe(compact_tokens, "compact")
+    logger.info("[Meta] Context compacted: ~%d -> ~%d tokens", raw_tokens, compact_tokens)
+    return prompt
 
 
 async def _meta_council(
-    agent1_output: str,
-    agent2_output: str,
-    agent3_output: str,
+    a1: dict,
+    a2: dict,
+    a3: dict,
+    on_delta: DeltaCallback | None = None,
 ) -> dict:
-    if not GOOGLE_API_KEY:
-        raise HTTPException(500, detail="GOOGLE_API_KEY chưa được thiết lập trong .env")
-    if not _GENAI_AVAILABLE:
-        raise HTTPException(500, detail="Thư viện google-genai chưa được cài đặt.")
-    logger.info("[Meta] Calling %s", GEMINI_MODEL)
-    prompt = PROMPT_META_COUNCIL.format(
-        agent1_output=agent1_output,
-        agent2_output=agent2_output,
-        agent3_output=agent3_output,
-    )
+    logger.info("[Meta] Calling %s", ROLE_BACKENDS["council"])
+    prompt = _council_prompt(a1, a2, a3)
     try:
-        client = google_genai.Client(api_key=GOOGLE_API_KEY)
-        response = await asyncio.wait_for(
-            client.aio.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=[genai_types.Part.from_text(text=prompt)],
-            ),
+        model, raw = await asyncio.wait_for(
+            _routed_generate("council", prompt, on_delta),
             timeout=AGENT_TIMEOUT_SEC,
         )
-        raw = response.text or ""
-        logger.info("[Meta] Verdict: %s", raw[:300])
-        data      = _extract_json(raw)
-        rationale = _text_before_json(raw)
-
-        raw_label = str(data.get("predicted_label", ""))
-        if raw_label not in VALID_LABELS:
-            raw_label = _closest_label(raw_label)
-
-        try:
-            confidence = max(0.0, min(1.0, float(data.get("confidence", 0.5))))
-        except (TypeError, ValueError):
-            confidence = 0.5
-
-        return {
-            "predicted_label": raw_label,
-            "confidence":      confidence,
-            "rationale":       rationale,
-            "forgery_risk":    data.get("forgery_risk", "thấp"),
-        }
+        logger.info("[Meta] Verdict (%s): %s", model, raw[:300])
+        parsed = parse_response(raw)
+        meta, match = council_output(parsed, label_resolver)
+        if not match.mapped:
+            logger.warning(
+                "[Meta] Unmapped label %r, using closest %s (score %.2f)",
+                parsed.data.get("predicted_label"), match.label, match.score,
+            )
+        return {**meta, "raw": raw, "model": model}
     except asyncio.TimeoutError:
         raise HTTPException(504, detail="Meta-Agent (Hội đồng) hết thời gian chờ.")
     except HTTPException:
         raise
     except Exception as exc:
         logger.error("[Meta] Error: %s", exc)
-        raise HTTPException(502, detail=f"Lỗi Meta-Agent (Gemini): {exc}")
+        raise HTTPException(502, detail=f"Lỗi Meta-Agent (Hội đồng{_tried(exc)}): {exc}")
 
 
 
-# Runs the four agents sequentially; each agent receives the prior agent's output
-async def _run_tadp_pipeline(image_bytes: bytes) -> dict:
+# Hypotheses for a Skeptic that runs before the Historian has answered
+def _seeded_hypotheses(candidates: list[dict] | None) -> str:
+    if candidates and len(candidates) >= 2:
+        return PROMPT_SKEPTIC_SEEDED_CANDIDATES.format(
+            label_a=candidates[0]["label"], prob_a=candidates[0]["probability"] * 100,
+            label_b=candidates[1]["label"], prob_b=candidates[1]["probability"] * 100,
+        )
+    return PROMPT_SKEPTIC_SEEDED_OPEN
+
+
+# Like asyncio.gather, but a failure cancels the sibling calls instead of leaving them running
+async def _gather_cancelling(*aws):
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+# Verdict taken straight from a confident local ResNet50+SVM prediction
+def _local_verdict(
+    local: dict,
+    observation: str,
+    debate_trail: list[dict],
+    record: Callable[[dict], None],
+) -> dict:
+    local_classifier.record_short_circuit()
+    summary = (
+        f"Mô hình ResNet50 + SVM cục bộ nhận diện dòng gốm {local['label']} "
+        f"với độ tin cậy {local['confidence'] * 100:.1f}%, vượt ngưỡng "
+        f"{local_classifier.threshold * 100:.0f}% nên không cần mở phiên tranh luận."
+    )
+    record({
+        "step": len(debate_trail) + 1, "agent": "Mô hình cục bộ",
+        "model": "ResNet50 + SVM", "role": "Nhận diện nhanh",
+        "content": summary,
+    })
+    logger.info("[TADP] Local short-circuit, label=%s confidence=%.1f%%", local["label"], local["confidence"] * 100)
+    return {
+        "predicted_label": local["label"],
+        "confidence":      local["confidence"],
+        "raw_text":        summary,
+        "evidence":        observation,
+        "rationale":       "",
+        "forgery_risk":    "không đánh giá",
+        "debate_trail":    debate_trail,
+        "local_model":     local,
+    }
+
+
+# Runs the four agents; in sequential mode each agent receives the prior agent's output,
+# in concurrent mode the Historian and Skeptic run side by side (see PIPELINE_MODE).
+# on_step, if given, is called with each debate_trail entry as soon as it is recorded;
+# on_token, if given, switches agents to streaming and receives (step, text delta);
+# local is the ResNet50+SVM prediction for the image, if the local model is enabled;
+# responses, if given, collects each agent's raw response and parsed fields by role.
+async def _run_tadp_pipeline(
+    image_bytes: bytes,
+    mime_type: str = "image/jpeg",
+    on_step: Callable[[dict], None] | None = None,
+    on_token: Callable[[int, str], None] | None = None,
+    local: dict | None = None,
+    mode: PipelineMode = "sequential",
+    responses: dict[str, dict] | None = None,
+) -> dict:
     debate_trail: list[dict] = []
 
-    a1 = await _agent1_observer(image_bytes)
+    def keep(role: str, output: dict) -> None:
+        if responses is not None:
+            responses[role] = {
+                "model": output["model"], "raw": output["raw"], "parsed": output_summary(role, output),
+            }
+
+    def record(entry: dict) -> None:
+        entry["pipeline_mode"] = mode
+        debate_trail.append(entry)
+        if on_step is not None:
+            on_step(entry)
+
+    def deltas(step: int) -> DeltaCallback | None:
+        if on_token is None:
+            return None
+        return lambda text: on_token(step, text)
+
+    if local is not None and local["confident"] and LOCAL_MODEL_SKIP_OBSERVER:
+        return _local_verdict(local, "", debate_trail, record)
+
+    a1 = await _agent1_observer(image_bytes, mime_type, deltas(1))
+    keep("observer", a1)
 
     # Short-circuit: non-pottery images skip the remaining three agents
     if not a1.get("is_pottery", True):
+        record({
+            "step":    1,
+            "agent":   "Quan sát viên",
+            "model":   a1["model"],
+            "role":    "Phân tích hình ảnh",
+            "content": "Ảnh không chứa đồ gốm. Pipeline dừng tại đây.",
+        })
         return {
             "predicted_label": "not_pottery",
             "confidence":      0.0,
@@ -373,47 +893,57 @@ async def _run_tadp_pipeline(image_bytes: bytes) -> dict:
             "evidence":        "",
             "rationale":       "",
             "forgery_risk":    "không áp dụng",
-            "debate_trail": [{
-                "step":    1,
-                "agent":   "Quan sát viên",
-                "model":   GEMINI_MODEL,
-                "role":    "Phân tích hình ảnh",
-                "content": "Ảnh không chứa đồ gốm. Pipeline dừng tại đây.",
-            }],
+            "debate_trail": debate_trail,
         }
 
     observation = a1["observation"]
-    debate_trail.append({
+    record({
         "step": 1, "agent": "Quan sát viên",
-        "model": GEMINI_MODEL, "role": "Mô tả vật lý",
+        "model": a1["model"], "role": "Mô tả vật lý",
         "content": observation,
     })
     logger.info("[TADP] Step 1 done, observation: %d chars", len(observation))
 
-    a2 = await _agent2_historian(observation)
-    debate_trail.append({
-        "step": 2, "agent": "Sử gia",
-        "model": OPENAI_MODEL, "role": "Phân tích lịch sử & Giả thuyết",
-        "content": a2["hypotheses_text"],
-    })
-    logger.info("[TADP] Step 2 done, A=%s B=%s", a2["hypothesis_a"], a2["hypothesis_b"])
-
-    a3 = await _agent3_skeptic(observation, a2["hypotheses_text"])
-    debate_trail.append({
-        "step": 3, "agent": "Người hoài nghi",
-        "model": GROK_MODEL, "role": "Phản biện & Đánh giá rủi ro",
-        "content": a3["skeptic_text"],
-    })
-    logger.info("[TADP] Step 3 done, leans=%s forgery=%s", a3["leans_towards"], a3["forgery_risk"])
-
-    meta = await _meta_council(
-        agent1_output=a1["raw"],
-        agent2_output=a2["raw"],
-        agent3_output=a3["raw"],
-    )
-    debate_trail.append({
+    # Confident local prediction: the Observer has confirmed pottery, skip the debate
+    if local is not None and local["confident"]:
+        return _local_verdict(local, observation, debate_trail, record)
+
+    candidates = local["top_k"] if local is not None else None
+
+    async def historian() -> dict:
+        a2 = await _agent2_historian(observation, deltas(2), candidates=candidates)
+        keep("historian", a2)
+        record({
+            "step": 2, "agent": "Sử gia",
+            "model": a2["model"], "role": "Phân tích lịch sử & Giả thuyết",
+            "content": a2["hypotheses_text"],
+        })
+        logger.info("[TADP] Step 2 done, A=%s B=%s", a2["hypothesis_a"], a2["hypothesis_b"])
+        return a2
+
+    async def skeptic(hypotheses_text: str) -> dict:
+        a3 = await _agent3_skeptic(observation, hypotheses_text, deltas(3))
+        keep("skeptic", a3)
+        record({
+            "step": 3, "agent": "Người hoài nghi",
+            "model": a3["model"], "role": "Phản biện & Đánh giá rủi ro",
+            "content": a3["skeptic_text"],
+        })
+        logger.info("[TADP] Step 3 done, leans=%s forgery=%s", a3["leans_towards"], a3["forgery_risk"])
+        return a3
+
+    if mode == "concurrent":
+        a2, a3 = await _gather_cancelling(historian(), skeptic(_seeded_hypotheses(candidates)))
+        debate_trail.sort(key=lambda entry: entry["step"])
+    else:
+        a2 = await historian()
+        a3 = await skeptic(a2["hypotheses_text"])
+
+    meta = await _meta_council(a1, a2, a3, on_delta=deltas(4))
+    keep("council", meta)
+    record({
         "step": 4, "agent": "Hội đồng",
-        "model": GEMINI_MODEL, "role": "Phán quyết cuối cùng",
+        "model": meta["model"], "role": "Phán quyết cuối cùng",
         "content": meta["rationale"],
     })
     logger.info(
@@ -421,7 +951,7 @@ async def _run_tadp_pipeline(image_bytes: bytes) -> dict:
         meta["predicted_label"], meta["confidence"] * 100, meta["forgery_risk"],
     )
 
-    return {
+    result = {
         "predicted_label": meta["predicted_label"],
         "confidence":      meta["confidence"],
         "raw_text":        meta["rationale"],
@@ -429,24 +959,43 @@ async def _run_tadp_pipeline(image_bytes: bytes) -> dict:
         "rationale":       a2["hypotheses_text"],
         "forgery_risk":    meta["forgery_risk"],
         "debate_trail":    debate_trail,
+        "pipeline_mode":   mode,
     }
+    if local is not None:
+        local["agrees"] = local_classifier.record_agreement(local, meta["predicted_label"])
+        result["local_model"] = local
+    return result
 
 
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    logger.info(
-        "POST /predict  pipeline=TADP  file=%s  size=%d bytes",
-        file.filename, len(image_bytes),
-    )
-    safe_name = Path(file.filename).name if file.filename else "upload.jpg"
-    with open(os.path.join(UPLOAD_FOLDER, safe_name), "wb") as f:
-        f.write(image_bytes)
-
+async def _run_pipeline_with_timeout(
+    image_bytes: bytes,
+    image_digest: str,
+    on_step: Callable[[dict], None] | None = None,
+    on_token: Callable[[int, str], None] | None = None,
+    mode: PipelineMode = "sequential",
+) -> dict:
+    trace = current_trace.get()
+    if trace is None and trail_store.enabled:
+        # Jobs and streams carry no trace; start one so the trail gets per-agent timings
+        trace = RequestTrace()
+        current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        prepared = await image_preprocessor.prepare(image_bytes)
+    except InvalidImageError:
+        raise HTTPException(400, detail="Tệp tải lên không phải ảnh hợp lệ.")
+    elapsed = time.perf_counter() - started
+    PREPROCESS_LATENCY.observe(elapsed)
+    started = time.perf_counter()
+    local, embedding = await local_classifier.classify(prepared.data)
+    if trace is not None:
+        trace.span("preprocess", elapsed)
+        trace.span("local_model", time.perf_counter() - started)
+    responses: dict[str, dict] = {}
     try:
         result = await asyncio.wait_for(
-            _run_tadp_pipeline(image_bytes),
+            _run_tadp_pipeline(prepared.data, prepared.mime_type, on_step, on_token, local, mode, responses),
             timeout=TOTAL_TIMEOUT_SEC,
         )
     except asyncio.TimeoutError:
@@ -457,8 +1006,371 @@ async def predict(file: UploadFile = File(...)):
         logger.exception("Lỗi không xác định trong TADP pipeline:")
         raise HTTPException(502, detail=f"Lỗi hệ thống AI: {exc}")
 
+    # Classified pottery joins the similarity index under its content hash
+    if embedding is not None and result["predicted_label"] != "not_pottery":
+        await similarity_index.add(image_digest, embedding, result["predicted_label"])
+    await trail_store.append(_trail_record(image_digest, mode, local, responses, result, trace))
+    return result
+
+
+# One pipeline run as stored by trail_store: enough to replay parsing, label resolution
+# and compaction offline against the recorded responses
+def _trail_record(
+    image_digest: str,
+    mode: str,
+    local: dict | None,
+    responses: dict[str, dict],
+    result: dict,
+    trace: RequestTrace | None,
+) -> dict:
+    return {
+        "created_at":   time.time(),
+        "image_digest": image_digest,
+        "mode":         mode,
+        "versions": {
+            "prompt":        PROMPT_VERSION,
+            "preprocess":    image_preprocessor.version,
+            "local_model":   local_classifier.version,
+            "role_backends": ROLE_BACKENDS,
+        },
+        "config": {
+            "labels":                 VALID_LABELS,
+            "label_min_score":        LABEL_MATCH_MIN_SCORE,
+            "council_compact":        COUNCIL_COMPACT,
+            "council_context_budget": COUNCIL_CONTEXT_BUDGET,
+        },
+        "local_model": local,
+        "responses":   responses,
+        "verdict": {
+            "predicted_label": result["predicted_label"],
+            "confidence":      result["confidence"],
+            "forgery_risk":    result["forgery_risk"],
+        },
+        "timings": trace.to_dict() if trace is not None else None,
+    }
+
+
+# Cache-aware entry point shared by /predict, /predict/stream and the job workers
+async def _classify(
+    image_bytes: bytes,
+    on_step: Callable[[dict], None] | None = None,
+    on_token: Callable[[int, str], None] | None = None,
+    image_digest: str | None = None,
+    mode: PipelineMode | None = None,
+) -> tuple[dict, str]:
+    mode = mode or PIPELINE_MODE
+    image_digest = image_digest or image_hash(image_bytes)
+    key = verdict_key(
+        image_digest, GEMINI_MODEL, OPENAI_MODEL, GROK_MODEL, PROMPT_VERSION, str(ROLE_BACKENDS),
+        image_preprocessor.version, local_classifier.version, mode,
+    )
+    return await verdict_cache.get_or_compute(
+        key, lambda: _run_pipeline_with_timeout(image_bytes, image_digest, on_step, on_token, mode)
+    )
+
+
+async def _run_job(
+    image_bytes: bytes,
+    on_step: Callable[[dict], None],
+    mode: PipelineMode | None = None,
+) -> dict:
+    started = time.perf_counter()
+    result, source = await _classify(image_bytes, on_step, mode=mode)
+    REQUEST_LATENCY.observe(time.perf_counter() - started, "/jobs", source)
+    return result
+
+
+job_manager = JobManager(
+    _run_job,
+    workers=JOB_WORKERS,
+    queue_size=JOB_QUEUE_SIZE,
+    retention_sec=JOB_RETENTION_SEC,
+)
+
+
+# Stores the upload content-addressed, rejecting it past UPLOAD_MAX_MB; bodies that are
+# far too large were already turned away by BodyLimitMiddleware
+async def _receive_upload(file: UploadFile) -> StoredUpload:
+    try:
+        return await upload_store.receive(file)
+    except UploadTooLargeError:
+        raise HTTPException(413, detail=f"Ảnh vượt quá {UPLOAD_MAX_MB} MB.")
+
+
+# Sending X-Debug-Timing: 1 adds a "timing" breakdown (per-agent wall time, time queued
+# at the provider gate, TTFT, tokens and estimated cost) to the response
+@app.post("/predict")
+async def predict(
+    response: Response,
+    file: UploadFile = File(...),
+    mode: PipelineMode | None = Query(None, description="sequential hoặc concurrent"),
+    debug_timing: str | None = Header(None, alias="X-Debug-Timing"),
+):
+    trace = RequestTrace()
+    current_trace.set(trace)
+    stored = await _receive_upload(file)
+    image_bytes, digest = stored.data, stored.digest
+    logger.info(
+        "POST /predict  pipeline=TADP  file=%s  size=%d bytes",
+        file.filename, len(image_bytes),
+    )
+
+    result, source = await _classify(image_bytes, image_digest=digest, mode=mode)
+    response.headers["X-Verdict-Cache"] = source
+    response.headers["X-Image-Hash"] = digest
+    REQUEST_LATENCY.observe(time.perf_counter() - trace.started, "/predict", source)
+
     logger.info(
-        "Final result: label=%s  confidence=%.2f  forgery=%s",
-        result["predicted_label"], result["confidence"], result.get("forgery_risk"),
+        "Final result: label=%s  confidence=%.2f  forgery=%s  cache=%s",
+        result["predicted_label"], result["confidence"], result.get("forgery_risk"), source,
     )
+    if debug_timing:
+        # The cached verdict is shared between requests, never mutate it
+        return {**result, "timing": trace.to_dict()}
     return result
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Streams the debate as Server-Sent Events: "token" deltas while an agent is writing,
+# a "step" event per finished debate_trail entry, then "result" (the /predict payload)
+# or "error". Cached verdicts replay their steps before the result.
+@app.post("/predict/stream")
+async def predict_stream(
+    file: UploadFile = File(...),
+    mode: PipelineMode | None = Query(None, description="sequential hoặc concurrent"),
+):
+    stored = await _receive_upload(file)
+    image_bytes, digest = stored.data, stored.digest
+    logger.info(
+        "POST /predict/stream  pipeline=TADP  file=%s  size=%d bytes",
+        file.filename, len(image_bytes),
+    )
+
+    events: asyncio.Queue[str | None] = asyncio.Queue()
+    streamed_steps: set[int] = set()
+
+    def on_step(entry: dict) -> None:
+        streamed_steps.add(entry["step"])
+        events.put_nowait(_sse("step", entry))
+
+    def on_token(step: int, delta: str) -> None:
+        events.put_nowait(_sse("token", {"step": step, "delta": delta}))
+
+    async def run() -> None:
+        started = time.perf_counter()
+        try:
+            result, source = await _classify(image_bytes, on_step, on_token, digest, mode)
+            REQUEST_LATENCY.observe(time.perf_counter() - started, "/predict/stream", source)
+            for entry in result.get("debate_trail", []):
+                if entry["step"] not in streamed_steps:
+                    events.put_nowait(_sse("step", entry))
+            events.put_nowait(_sse("result", result))
+        except HTTPException as exc:
+            events.put_nowait(_sse("error", {"status_code": exc.status_code, "detail": exc.detail}))
+        except Exception as exc:
+            logger.exception("Lỗi không xác định trong TADP stream:")
+            events.put_nowait(_sse("error", {"status_code": 502, "detail": f"Lỗi hệ thống AI: {exc}"}))
+        finally:
+            events.put_nowait(None)
+
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Image-Hash": digest},
+    )
+
+
+# (filename, loader) for every image in the upload; zip archives are expanded lazily.
+# Each loader stores its image and returns the StoredUpload.
+async def _batch_items(files: list[UploadFile]) -> list[tuple[str, Callable]]:
+    items: list[tuple[str, Callable]] = []
+    for upload in files:
+        name = upload.filename or "upload.jpg"
+        if not name.lower().endswith(".zip"):
+            items.append((name, lambda upload=upload: _receive_upload(upload)))
+            continue
+        try:
+            archive = await asyncio.to_thread(zipfile.ZipFile, upload.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(400, detail=f"Tệp {name} không phải file zip hợp lệ.")
+        # ZipFile reads from one shared file handle, so members are read one at a time
+        lock = asyncio.Lock()
+
+        def member_loader(info: zipfile.ZipInfo, archive=archive, lock=lock) -> Callable:
+            async def load() -> StoredUpload:
+                if info.file_size > upload_store.max_upload_bytes:
+                    raise HTTPException(413, detail=f"Ảnh vượt quá {UPLOAD_MAX_MB} MB.")
+                async with lock:
+                    data = await asyncio.to_thread(archive.read, info)
+                return await upload_store.save(data, info.filename)
+            return load
+
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                items.append((info.filename, member_loader(info)))
+    if not items:
+        raise HTTPException(400, detail="Không tìm thấy ảnh nào trong yêu cầu.")
+    if len(items) > BATCH_MAX_IMAGES:
+        raise HTTPException(413, detail=f"Mỗi lô tối đa {BATCH_MAX_IMAGES} ảnh.")
+    return items
+
+
+# Analyses many images (multipart files and/or zip archives) and streams one NDJSON line
+# per image as it finishes, in completion order, then a summary line. A failed image
+# gets an "error" line and the batch carries on. Provider calls go through the same
+# per-provider gates as every other request, so batches cannot starve /predict of quota.
+@app.post("/predict_batch")
+async def predict_batch(
+    files: list[UploadFile] = File(...),
+    mode: PipelineMode | None = Query(None, description="sequential hoặc concurrent"),
+):
+    items = await _batch_items(files)
+    logger.info("POST /predict_batch  images=%d  concurrency=%d", len(items), BATCH_CONCURRENCY)
+    lines: asyncio.Queue[str | None] = asyncio.Queue()
+    pending = iter(enumerate(items))
+    summary = {"images": len(items), "succeeded": 0, "failed": 0, "cached": 0}
+    started = time.perf_counter()
+
+    async def analyse(index: int, filename: str, load: Callable) -> dict:
+        item_started = time.perf_counter()
+        line = {"index": index, "filename": filename}
+        try:
+            stored = await load()
+            digest = stored.digest
+            result, source = await _classify(stored.data, image_digest=digest, mode=mode)
+            line.update(status="ok", image_hash=digest, cache=source, result=result)
+            summary["succeeded"] += 1
+            summary["cached"] += source != "miss"
+        except HTTPException as exc:
+            line.update(status="error", error={"status_code": exc.status_code, "detail": exc.detail})
+            summary["failed"] += 1
+        except Exception as exc:
+            logger.exception("Lỗi không xác định khi phân tích %s trong lô:", filename)
+            line.update(status="error", error={"status_code": 502, "detail": f"Lỗi hệ thống AI: {exc}"})
+            summary["failed"] += 1
+        line["ms"] = round((time.perf_counter() - item_started) * 1000, 1)
+        return line
+
+    async def worker() -> None:
+        for index, (filename, load) in pending:
+            line = await analyse(index, filename, load)
+            lines.put_nowait(json.dumps(line, ensure_ascii=False) + "\n")
+
+    async def run() -> None:
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(BATCH_CONCURRENCY, len(items)))))
+        finally:
+            lines.put_nowait(None)
+
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            while (line := await lines.get()) is not None:
+                yield line
+            summary["elapsed_sec"] = round(time.perf_counter() - started, 2)
+            logger.info("Batch done: %s", summary)
+            yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+        finally:
+            task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# Queues the image for the TADP pipeline and returns immediately; poll GET /jobs/{id}
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    mode: PipelineMode | None = Query(None, description="sequential hoặc concurrent"),
+):
+    image_bytes = (await _receive_upload(file)).data
+    logger.info("POST /jobs  file=%s  size=%d bytes", file.filename, len(image_bytes))
+    try:
+        job = job_manager.submit(image_bytes, file.filename or "upload.jpg", mode=mode)
+    except QueueFullError as exc:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Hàng đợi phân tích đang đầy, vui lòng thử lại sau."},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Không tìm thấy job.")
+    return job.to_dict()
+
+
+# Nearest neighbours of an already-indexed image, by the X-Image-Hash of its upload
+# or by a dataset path from the training feature store
+@app.get("/similar")
+async def similar(
+    image_hash: str = Query(..., description="X-Image-Hash của ảnh đã phân tích, hoặc đường dẫn ảnh trong dataset"),
+    k: int = Query(5, ge=1, le=50),
+):
+    vector = similarity_index.vector(image_hash)
+    if vector is None:
+        raise HTTPException(404, detail="Ảnh chưa có trong chỉ mục tương đồng.")
+    started = time.perf_counter()
+    results = similarity_index.search(vector, k=k, exclude=image_hash)
+    return {
+        "image_hash": image_hash,
+        "results":    results,
+        "took_ms":    round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+# Liveness: the process is up and serving, whatever the warm-up state
+@app.get("/livez")
+async def livez():
+    return {"status": "ok"}
+
+
+# Readiness: 200 once the required warm-up steps have finished, 503 before
+@app.get("/readyz")
+async def readyz():
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "warmup":        warmup.status(),
+        "clients":       provider_clients.stats(),
+        "verdict_cache": verdict_cache.stats(),
+        "trails":        trail_store.stats(),
+        "uploads":       upload_store.stats(),
+        "jobs":          job_manager.stats(),
+        "preprocess":    image_preprocessor.stats(),
+        "local_model":   local_classifier.stats(),
+        "similarity":    similarity_index.stats(),
+        "failover":      provider_router.stats(),
+        "provider_gates": {name: gate.stats() for name, gate in provider_gates.items()},
+    }
+
+
+# Prometheus text exposition of the per-agent latency, token, cost and queue histograms
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,229 @@
+import contextvars
+import math
+import time
+
+# Seconds; remote LLM calls range from ~1 s to the 50 s agent timeout
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 50, 80, 120, 210)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {total:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _labels(self.labelnames, values, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labelnames, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {count}")
+        return lines
+
+    # Approximate quantile from bucket bounds, for logs and benchmarks
+    def quantile(self, q: float, *labelvalues) -> float:
+        series = self._series.get(labelvalues)
+        if not series or not series[2]:
+            return math.nan
+        target = q * series[2]
+        cumulative = 0
+        for bound, n in zip(self.buckets, series[0]):
+            cumulative += n
+            if cumulative >= target:
+                return bound
+        return math.inf
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+AGENT_LATENCY = registry.histogram(
+    "tadp_agent_latency_seconds", "Wall time of one agent call", ("agent", "model"),
+)
+AGENT_TTFT = registry.histogram(
+    "tadp_agent_ttft_seconds", "Time to first streamed token of one agent call", ("agent", "model"),
+)
+AGENT_PROMPT_TOKENS = registry.histogram(
+    "tadp_agent_prompt_tokens", "Prompt tokens per agent call", ("agent", "model"), TOKEN_BUCKETS,
+)
+AGENT_COMPLETION_TOKENS = registry.histogram(
+    "tadp_agent_completion_tokens", "Completion tokens per agent call", ("agent", "model"), TOKEN_BUCKETS,
+)
+AGENT_CALLS = registry.counter(
+    "tadp_agent_calls_total", "Agent calls by outcome", ("agent", "model", "outcome"),
+)
+COST_USD = registry.counter(
+    "tadp_cost_usd_total", "Estimated provider spend in USD", ("model",),
+)
+REQUEST_LATENCY = registry.histogram(
+    "tadp_request_seconds", "End-to-end request time", ("endpoint", "cache"),
+)
+QUEUE_WAIT = registry.histogram(
+    "tadp_queue_wait_seconds", "Time a job waited in the queue before a worker picked it up", ("queue",),
+)
+COUNCIL_CONTEXT_TOKENS = registry.histogram(
+    "tadp_council_context_tokens", "Estimated Council prompt tokens, raw transcripts vs compacted summary",
+    ("variant",), TOKEN_BUCKETS,
+)
+LABEL_RESOLUTIONS = registry.counter(
+    "tadp_label_resolutions_total", "Village names mapped to a canonical label, by source field and method",
+    ("field", "method"),
+)
+STARTUP_SECONDS = registry.histogram(
+    "tadp_startup_seconds", "Seconds from import to serving and to ready, and per warm-up step", ("phase",),
+    (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+PREPROCESS_LATENCY = registry.histogram(
+    "tadp_preprocess_seconds", "Image preprocessing time", (),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2),
+)
+
+
+# Per-request breakdown of where the time and tokens went; attached to the response
+# when the caller sends the debug header
+class RequestTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: list[dict] = []
+        self.spans: dict[str, float] = {}
+
+    def span(self, name: str, seconds: float) -> None:
+        self.spans[name] = round(self.spans.get(name, 0.0) + seconds * 1000, 1)
+
+    def add_stage(self, stage: dict) -> None:
+        self.stages.append(stage)
+
+    def to_dict(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans_ms": self.spans,
+            "stages":   self.stages,
+            "prompt_tokens":     sum(s.get("prompt_tokens") or 0 for s in self.stages),
+            "completion_tokens": sum(s.get("completion_tokens") or 0 for s in self.stages),
+            "cost_usd":          round(sum(s.get("cost_usd") or 0.0 for s in self.stages), 6),
+        }
+
+
+current_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+# Seconds the current provider attempt waited in its ProviderGate; each attempt runs in
+# its own task, so the value belongs to that attempt alone
+current_gate_wait: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "current_gate_wait", default=None
+)
+
+
+# prices: {model: (USD per 1M prompt tokens, USD per 1M completion tokens)}
+def estimate_cost(prices: dict, model: str, prompt_tokens: int | None, completion_tokens: int | None) -> float | None:
+    price = prices.get(model)
+    if price is None or (prompt_tokens is None and completion_tokens is None):
+        return None
+    return ((prompt_tokens or 0) * price[0] + (completion_tokens or 0) * price[1]) / 1_000_000
+
+
+def record_agent_call(
+    prices: dict,
+    agent: str,
+    model: str,
+    seconds: float,
+    outcome: str,
+    ttft: float | None = None,
+    prompt_tokens: int | None = None,
+    completion_tokens: int | None = None,
+) -> None:
+    AGENT_CALLS.inc(agent, model, outcome)
+    AGENT_LATENCY.observe(seconds, agent, model)
+    if ttft is not None:
+        AGENT_TTFT.observe(ttft, agent, model)
+    if prompt_tokens is not None:
+        AGENT_PROMPT_TOKENS.observe(prompt_tokens, agent, model)
+    if completion_tokens is not None:
+        AGENT_COMPLETION_TOKENS.observe(completion_tokens, agent, model)
+    cost = estimate_cost(prices, model, prompt_tokens, completion_tokens)
+    if cost:
+        COST_USD.inc(model, amount=cost)
+    trace = current_trace.get()
+    if trace is not None:
+        queue_wait = current_gate_wait.get()
+        trace.add_stage({
+            "agent":             agent,
+            "model":             model,
+            "outcome":           outcome,
+            "start_ms":          round((time.perf_counter() - seconds - trace.started) * 1000, 1),
+            "wall_ms":           round(seconds * 1000, 1),
+            "queue_wait_ms":     round(queue_wait * 1000, 1) if queue_wait is not None else None,
+            "ttft_ms":           round(ttft * 1000, 1) if ttft is not None else None,
+            "prompt_tokens":     prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd":          round(cost, 6) if cost is not None else None,
+        })
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger("gom-ai-tadp.preprocess")
+
+# Formats Gemini accepts that Pillow may not be able to decode (e.g. HEIC without a plugin)
+_MAGIC_MIME = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"RIFF", "image/webp"),
+]
+_FTYP_MIME = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"heif": "image/heif"}
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+class PreparedImage:
+    def __init__(self, data: bytes, mime_type: str, stats: dict):
+        self.data      = data
+        self.mime_type = mime_type
+        self.stats     = stats
+
+
+def sniff_mime(data: bytes) -> str | None:
+    for magic, mime in _MAGIC_MIME:
+        if data.startswith(magic):
+            if mime == "image/webp" and data[8:12] != b"WEBP":
+                continue
+            return mime
+    if data[4:8] == b"ftyp":
+        return _FTYP_MIME.get(data[8:12])
+    return None
+
+
+# Decodes, orients, downscales and re-encodes to JPEG without metadata. Blocking.
+def prepare_image(data: bytes, max_side: int, quality: int) -> PreparedImage:
+    started = time.perf_counter()
+    sniffed = sniff_mime(data)
+    try:
+        img = Image.open(io.BytesIO(data))
+        source_format = img.format
+        source_size = img.size
+        # Let the JPEG decoder scale down by DCT while decoding instead of after
+        longest = max(source_size)
+        if longest > max_side:
+            scale = max_side / longest
+            img.draft("RGB", (math.ceil(source_size[0] * scale), math.ceil(source_size[1] * scale)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        if sniffed is None:
+            raise InvalidImageError(str(exc)) from exc
+        # Gemini can still read it; send it untouched rather than failing the request
+        logger.warning("Cannot decode %s locally, sending original bytes: %s", sniffed, exc)
+        return PreparedImage(data, sniffed, {
+            "bytes_in":   len(data),
+            "bytes_out":  len(data),
+            "source_mime": sniffed,
+            "passthrough": True,
+            "ms":         round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    result = out.getvalue()
+    return PreparedImage(result, "image/jpeg", {
+        "bytes_in":    len(data),
+        "bytes_out":   len(result),
+        "source_mime": Image.MIME.get(source_format, sniffed),
+        "source_size": list(source_size),
+        "output_size": list(img.size),
+        "passthrough": False,
+        "ms":          round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+# Runs prepare_image on a small dedicated thread pool so the event loop stays free
+class ImagePreprocessor:
+    def __init__(self, max_side: int = 1536, quality: int = 85, workers: int = 2):
+        self.max_side = max_side
+        self.quality  = quality
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="img-prep")
+        self.totals = {"images": 0, "bytes_in": 0, "bytes_out": 0, "ms": 0.0, "passthrough": 0}
+
+    # Identifies the settings in cache keys: changing them changes what the models see
+    @property
+    def version(self) -> str:
+        return f"img{self.max_side}q{self.quality}"
+
+    async def prepare(self, data: bytes) -> PreparedImage:
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(
+            self._executor, prepare_image, data, self.max_side, self.quality,
+        )
+        stats = prepared.stats
+        self.totals["images"]      += 1
+        self.totals["bytes_in"]    += stats["bytes_in"]
+        self.totals["bytes_out"]   += stats["bytes_out"]
+        self.totals["ms"]          += stats["ms"]
+        self.totals["passthrough"] += int(stats["passthrough"])
+        logger.info(
+            "Preprocessed image  %s -> %s  bytes %d -> %d  in %.1f ms",
+            stats.get("source_size"), stats.get("output_size"),
+            stats["bytes_in"], stats["bytes_out"], stats["ms"],
+        )
+        return prepared
+
+    def stats(self) -> dict:
+        images = self.totals["images"]
+        return {
+            **self.totals,
+            "ms":          round(self.totals["ms"], 1),
+            "avg_ms":      round(self.totals["ms"] / images, 1) if images else 0.0,
+            "bytes_saved": self.totals["bytes_in"] - self.totals["bytes_out"],
+        }
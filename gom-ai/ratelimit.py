@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+
+from metrics import QUEUE_WAIT, current_gate_wait
+
+logger = logging.getLogger("gom-ai-tadp.ratelimit")
+
+# Pause applied after a 429 that carries no usable Retry-After header
+DEFAULT_RATE_LIMIT_PAUSE_SEC = 5.0
+
+
+# Requests-per-minute limiter; burst is how many calls may go out back to back after
+# an idle period. rpm <= 0 disables the rate, but a 429 pause still applies.
+class TokenBucket:
+    def __init__(self, rpm: float, burst: int | None = None):
+        self.rate     = rpm / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(rpm // 10)))
+        self._tokens  = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Callers queue on the lock, so tokens are handed out in arrival order
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if not self.enabled:
+                    return
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    # After a 429 nobody gets a token until the provider's Retry-After has passed,
+    # and the bucket restarts empty so calls resume at the steady rate, not in a burst
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+# The SDKs are built without retries, so a 429 reaches the gate on the first answer;
+# honour the same hints they would have: retry-after-ms, then retry-after in seconds
+def _rate_limit_delay(exc: BaseException) -> float | None:
+    if getattr(exc, "status_code", None) != 429 and getattr(exc, "code", None) != 429:
+        return None
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(header)) / scale
+        except (TypeError, ValueError):
+            continue
+    return DEFAULT_RATE_LIMIT_PAUSE_SEC
+
+
+# Admission control for one provider, shared by every request in the process: at most
+# max_concurrent calls in flight and at most rpm calls started per minute. Used as
+# `async with gate:` around one provider call; a 429 raised inside pauses the bucket.
+class ProviderGate:
+    def __init__(self, name: str, max_concurrent: int, rpm: float = 0.0, burst: int | None = None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self._bucket = TokenBucket(rpm, burst)
+        self.waiting = 0
+        self.in_flight = 0
+        self.counters = {"admitted": 0, "rate_limited": 0, "wait_sec": 0.0}
+
+    async def __aenter__(self) -> "ProviderGate":
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            if self._semaphore is not None:
+                await self._semaphore.acquire()
+            try:
+                await self._bucket.acquire()
+            except BaseException:
+                if self._semaphore is not None:
+                    self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        QUEUE_WAIT.observe(waited, self.name)
+        current_gate_wait.set(waited)
+        self.counters["admitted"] += 1
+        self.counters["wait_sec"] += waited
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+        delay = _rate_limit_delay(exc) if exc is not None else None
+        if delay is not None:
+            self.counters["rate_limited"] += 1
+            logger.warning("%s answered 429, pausing new calls for %.1f s", self.name, delay)
+            self._bucket.pause(delay)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "rpm":            round(self._bucket.rate * 60, 1),
+            "in_flight":      self.in_flight,
+            "waiting":        self.waiting,
+            **self.counters,
+            "wait_sec":       round(self.counters["wait_sec"], 2),
+        }
@@ -0,0 +1,96 @@
+import json
+import re
+
+# Every markdown construct the agents are told not to use, matched in one pass over
+# the prose. Line markers (headings, bullets, numbered items) are matched with the
+# newline before them, which lets the engine skip straight to "\n", "*" and "_";
+# emphasis groups are unwrapped, not removed.
+_MARKDOWN = re.compile(
+    r"\n(?:\n\n+)?[ \t]*(?:#{1,6}|[-*]|\d+\.)[ \t]+"
+    r"|\n\n\n+"
+    r"|(\*\*?|__?)(.+?)\1",
+    re.DOTALL,
+)
+_STRUCTURAL = re.compile(r'[{}"\\\n]')
+_FENCE_TAIL = re.compile(r"`{3}[a-zA-Z]*\s*$")
+_FENCE_HEAD = re.compile(r"^\s*`{3}[a-zA-Z]*[ \t]*\n?")
+
+# "{" positions tried, right to left, before falling back to the full brace scan
+_FAST_ATTEMPTS = 4
+
+
+class ParsedResponse:
+    def __init__(self, prose: str, data: dict):
+        self.prose = prose
+        self.data  = data
+
+
+def _unwrap(match: re.Match) -> str:
+    inner = match.group(2)
+    if inner is not None:
+        return _MARKDOWN.sub(_unwrap, inner) if "*" in inner or "_" in inner else inner
+    return "\n\n" if match.group().startswith("\n\n") else "\n"
+
+
+def strip_markdown(text: str) -> str:
+    return _MARKDOWN.sub(_unwrap, "\n" + text).strip()
+
+
+# (start, end) of the outermost {...} that closes at the last matched "}", or None.
+# Only the structural characters are visited. Braces inside JSON strings are skipped;
+# an unmatched "{" in the prose before it does not hide the object.
+def find_trailing_json(text: str) -> tuple[int, int] | None:
+    opened: list[int] = []
+    span = None
+    in_string = escaped = False
+    for match in _STRUCTURAL.finditer(text):
+        ch = match.group()
+        i = match.start()
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                # Only the character right after the backslash is escaped
+                escaped = i + 1 < len(text) and text[i + 1] in '"\\'
+            elif ch == '"' or ch == "\n":
+                # JSON strings cannot span lines, so a newline means it was prose
+                in_string = False
+        elif ch == "{":
+            opened.append(i)
+        elif ch == "}":
+            if opened:
+                span = (opened.pop(), i + 1)
+        elif ch == '"' and opened:
+            in_string = True
+    return span
+
+
+# Splits a model response into the markdown-free prose before its trailing JSON
+# object and that object parsed ({} when there is none or it is not valid JSON)
+def parse_response(text: str) -> ParsedResponse:
+    text = _FENCE_HEAD.sub("", text.strip(), count=1)
+    # Usual case: a flat object at the very end parses from one of the last few "{"
+    end = text.rfind("}") + 1
+    start = text.rfind("{", 0, end)
+    for _ in range(_FAST_ATTEMPTS):
+        if start < 0:
+            break
+        try:
+            return _split(text, start, json.loads(text[start:end]))
+        except json.JSONDecodeError:
+            start = text.rfind("{", 0, start)
+
+    span = find_trailing_json(text)
+    if span is None:
+        return ParsedResponse(strip_markdown(text), {})
+    start, end = span
+    try:
+        data = json.loads(text[start:end])
+    except json.JSONDecodeError:
+        data = {}
+    return _split(text, start, data)
+
+
+def _split(text: str, start: int, data) -> ParsedResponse:
+    prose = _FENCE_TAIL.sub("", text[:start].rstrip())
+    return ParsedResponse(strip_markdown(prose), data if isinstance(data, dict) else {})
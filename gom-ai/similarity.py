@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+logger = logging.getLogger("gom-ai-tadp.similarity")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Spherical k-means on unit vectors; used as the IVF coarse quantiser
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 8, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+# Upload embeddings kept across restarts; blocking, small and append-mostly
+class _UploadTier:
+    def __init__(self, path: str):
+        self._path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, label TEXT NOT NULL, meta TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=5.0)
+
+    def load(self):
+        with self._connect() as conn:
+            for key, label, meta, blob in conn.execute("SELECT key, label, meta, vector FROM embeddings"):
+                yield key, label, json.loads(meta), np.frombuffer(blob, dtype=np.float32)
+
+    def put(self, key: str, label: str, meta: dict, vector: np.ndarray) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, label, meta, vector) VALUES (?, ?, ?, ?)",
+                (key, label, json.dumps(meta, ensure_ascii=False), vector.astype(np.float32).tobytes()),
+            )
+
+
+# Cosine nearest-neighbour index over ResNet50 GAP embeddings.
+# "flat" scans every vector with one matrix-vector product; "ivf" clusters vectors into
+# nlist inverted lists and only scans the nprobe lists closest to the query.
+class SimilarityIndex:
+    def __init__(
+        self,
+        dim: int = 2048,
+        mode: str = "flat",
+        nlist: int = 64,
+        nprobe: int = 8,
+        uploads_db: str = "",
+    ):
+        self.dim    = dim
+        self.mode   = mode
+        self.nlist  = nlist
+        self.nprobe = nprobe
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._count = 0
+        self._keys: list[str] = []
+        self._items: list[dict] = []
+        self._rows: dict[str, int] = {}
+        self._centroids: np.ndarray | None = None
+        self._assign: list[list[int]] = []
+        self._uploads = _UploadTier(uploads_db) if uploads_db else None
+        self.counters = {"searches": 0, "inserts": 0, "search_ms": 0.0}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._count + extra
+        if needed <= len(self._vectors):
+            return
+        grown = np.zeros((max(needed, len(self._vectors) * 2, 256), self.dim), dtype=np.float32)
+        grown[: self._count] = self._vectors[: self._count]
+        self._vectors = grown
+
+    def _insert(self, key: str, vector: np.ndarray, item: dict) -> None:
+        row = self._rows.get(key)
+        if row is None:
+            self._reserve(1)
+            row = self._count
+            self._count += 1
+            self._keys.append(key)
+            self._items.append(item)
+            self._rows[key] = row
+            if self._centroids is not None:
+                self._assign[int(np.argmax(self._centroids @ vector))].append(row)
+        else:
+            self._items[row] = item
+        self._vectors[row] = vector
+
+    # Bulk-loads the training feature store written by train/feature_store.py
+    def load_feature_store(self, store_dir: str, label_resolver) -> int:
+        with open(os.path.join(store_dir, "index.json"), encoding="utf-8") as f:
+            entries = json.load(f)["entries"]
+        if not entries:
+            return 0
+        matrix = np.load(os.path.join(store_dir, "features.npy"), mmap_mode="r")
+        ordered = sorted(entries.items(), key=lambda kv: kv[1]["row"])
+        vectors = _normalize(matrix[: len(ordered)])
+        self._reserve(len(ordered))
+        for (path, entry), vector in zip(ordered, vectors):
+            self._insert(path, vector, {
+                "label":  label_resolver(entry["label"]),
+                "source": "dataset",
+                "path":   path,
+            })
+        return len(ordered)
+
+    def load_uploads(self) -> int:
+        if self._uploads is None:
+            return 0
+        loaded = 0
+        for key, label, meta, vector in self._uploads.load():
+            if vector.shape[0] == self.dim:
+                self._insert(key, _normalize(vector), {"label": label, "source": "upload", **meta})
+                loaded += 1
+        return loaded
+
+    # (Re)builds the inverted lists; a no-op in flat mode or for small collections
+    def build(self) -> None:
+        if self.mode != "ivf" or self._count < self.nlist * 4:
+            self._centroids = None
+            return
+        started = time.perf_counter()
+        vectors = self._vectors[: self._count]
+        self._centroids = _kmeans(vectors, self.nlist)
+        assign = np.argmax(vectors @ self._centroids.T, axis=1)
+        self._assign = [np.flatnonzero(assign == c).tolist() for c in range(self.nlist)]
+        logger.info(
+            "Built IVF index: %d vectors, %d lists in %.2f s",
+            self._count, self.nlist, time.perf_counter() - started,
+        )
+
+    def contains(self, key: str) -> bool:
+        return key in self._rows
+
+    def vector(self, key: str) -> np.ndarray | None:
+        row = self._rows.get(key)
+        return None if row is None else self._vectors[row]
+
+    # Inserts or replaces one embedding; persisted when an uploads database is configured,
+    # on a worker thread so the SQLite write stays off the event loop
+    async def add(self, key: str, vector, label: str, meta: dict | None = None) -> None:
+        vector = _normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        meta = meta or {}
+        self._insert(key, vector, {"label": label, "source": "upload", **meta})
+        self.counters["inserts"] += 1
+        if self._uploads is not None:
+            try:
+                await asyncio.to_thread(self._uploads.put, key, label, meta, vector)
+            except Exception as exc:
+                logger.warning("Failed to persist embedding %s: %s", key, exc)
+
+    def search(self, vector, k: int = 5, exclude: str | None = None) -> list[dict]:
+        started = time.perf_counter()
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        if self._centroids is not None:
+            probes = np.argsort(self._centroids @ query)[::-1][: self.nprobe]
+            candidates = np.concatenate(
+                [np.asarray(self._assign[p], dtype=np.int64) for p in probes]
+            )
+        else:
+            candidates = None
+        vectors = self._vectors[: self._count] if candidates is None else self._vectors[candidates]
+        scores = vectors @ query
+        wanted = min(k + 1, len(scores))
+        if wanted == 0:
+            return []
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for position in top:
+            row = int(position if candidates is None else candidates[position])
+            key = self._keys[row]
+            if key == exclude:
+                continue
+            results.append({"id": key, "score": round(float(scores[position]), 4), **self._items[row]})
+            if len(results) == k:
+                break
+        self.counters["searches"] += 1
+        self.counters["search_ms"] += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self) -> dict:
+        searches = self.counters["searches"]
+        return {
+            "mode":     "ivf" if self._centroids is not None else "flat",
+            "vectors":  self._count,
+            "lists":    len(self._assign) if self._centroids is not None else 0,
+            **self.counters,
+            "search_ms": round(self.counters["search_ms"], 2),
+            "avg_search_ms": round(self.counters["search_ms"] / searches, 3) if searches else 0.0,
+        }
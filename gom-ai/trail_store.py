@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from typing import Iterator
+
+from agent_outputs import PROSE_FIELDS
+
+logger = logging.getLogger("gom-ai-tadp.trails")
+
+# Structured fields of each role's output kept in a record; prose is kept as a hash
+RECORDED_FIELDS = {
+    "observer":  ("is_pottery",),
+    "historian": ("hypothesis_a", "hypothesis_b", "preferred"),
+    "skeptic":   ("leans_towards", "forgery_risk"),
+    "council":   ("predicted_label", "confidence", "forgery_risk"),
+}
+
+
+def prose_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+# What a role's parse produced, in the form stored with the run and compared on replay
+def output_summary(role: str, output: dict) -> dict:
+    summary = {field: output.get(field) for field in RECORDED_FIELDS[role]}
+    summary["prose"] = prose_hash(output.get(PROSE_FIELDS[role], ""))
+    return summary
+
+
+# Append-only SQLite log of pipeline runs: image hash, versions, raw agent responses,
+# their parsed fields and per-stage timings, zlib-compressed JSON per row. Runs beyond
+# max_runs are dropped oldest first (0 = no limit). An empty path disables it; the
+# file is only created by the first append.
+class TrailStore:
+    def __init__(self, path: str, max_runs: int = 0):
+        self.path     = path
+        self.max_runs = max_runs
+        self.counters = {"appended": 0, "errors": 0}
+        self._created = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        if not self._created:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS runs ("
+                    " id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL,"
+                    " image_digest TEXT NOT NULL, prompt_version TEXT NOT NULL,"
+                    " predicted_label TEXT, record BLOB NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS runs_prompt ON runs (prompt_version)")
+            self._created = True
+        return conn
+
+    def _insert(self, record: dict) -> None:
+        blob = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"), 6)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (created_at, image_digest, prompt_version, predicted_label, record)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    record["created_at"], record["image_digest"], record["versions"]["prompt"],
+                    record["verdict"]["predicted_label"], blob,
+                ),
+            )
+            if self.max_runs > 0:
+                conn.execute("DELETE FROM runs WHERE id <= ?", (cursor.lastrowid - self.max_runs,))
+
+    # Never raises: losing a record must not fail the request that produced it
+    async def append(self, record: dict) -> None:
+        if not self.enabled:
+            return
+        record.setdefault("created_at", time.time())
+        try:
+            await asyncio.to_thread(self._insert, record)
+            self.counters["appended"] += 1
+        except Exception as exc:
+            self.counters["errors"] += 1
+            logger.warning("Debate trail write failed: %s", exc)
+
+    # Blocking; newest first. prompt_version narrows to runs made with those prompts.
+    def records(self, limit: int = 0, prompt_version: str | None = None) -> Iterator[dict]:
+        query = "SELECT id, record FROM runs"
+        params: list = []
+        if prompt_version:
+            query += " WHERE prompt_version = ?"
+            params.append(prompt_version)
+        query += " ORDER BY id DESC"
+        if limit > 0:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            for run_id, blob in conn.execute(query, params):
+                record = json.loads(zlib.decompress(blob))
+                record["id"] = run_id
+                yield record
+
+    def stats(self) -> dict:
+        return {**self.counters, "enabled": self.enabled, "max_runs": self.max_runs}
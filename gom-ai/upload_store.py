@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from starlette.responses import JSONResponse
+
+from preprocess import sniff_mime
+
+logger = logging.getLogger("gom-ai-tadp.uploads")
+
+CHUNK_SIZE = 1024 * 1024
+_TEMP_PREFIX = ".part-"
+_MIME_EXT = {
+    "image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp",
+    "image/heic": ".heic", "image/heif": ".heif",
+}
+
+
+class UploadTooLargeError(ValueError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class StoredUpload:
+    def __init__(self, data: bytes, digest: str, path: str, duplicate: bool):
+        self.data      = data
+        self.digest    = digest
+        self.path      = path
+        self.duplicate = duplicate
+
+
+# Named from the bytes alone, so the same image always maps to the same file
+def _extension(head: bytes) -> str:
+    return _MIME_EXT.get(sniff_mime(head) or "", ".bin")
+
+
+# Content-addressed copy of every upload under <sha256><ext>, so re-uploads are written
+# once and same-named files no longer overwrite each other. Files are kept in
+# least-recently-uploaded order and evicted past max_files, max_bytes or retention_sec
+# (0 = no limit), on every commit and every sweep_sec in between. All disk I/O runs on
+# worker threads.
+class UploadStore:
+    def __init__(
+        self,
+        directory: str,
+        max_upload_bytes: int = 50 * 1024 * 1024,
+        max_files: int = 0,
+        max_bytes: int = 0,
+        retention_sec: float = 0,
+        sweep_sec: float = 3600,
+    ):
+        self.directory        = directory
+        self.max_upload_bytes = max_upload_bytes
+        self.max_files        = max_files
+        self.max_bytes        = max_bytes
+        self.retention_sec    = retention_sec
+        self.sweep_sec        = sweep_sec
+        self._sweeper: asyncio.Task | None = None
+        # name -> (size, last upload time), oldest first
+        self._index: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._total_bytes = 0
+        self.counters = {"stored": 0, "duplicates": 0, "rejected": 0, "evicted": 0}
+        # Serialises the rename and index update of each commit with evictions, so
+        # identical uploads arriving together are counted once
+        self._commit_lock = asyncio.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Indexes files left by earlier runs and removes interrupted partial writes. Blocking.
+    def load(self) -> int:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(_TEMP_PREFIX):
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._index.clear()
+        self._total_bytes = 0
+        for mtime, name, size in sorted(entries):
+            self._index[name] = (size, mtime)
+            self._total_bytes += size
+        self._remove(self._pop_expired(time.time()))
+        return len(self._index)
+
+    def _check_size(self, size: int) -> None:
+        if size > self.max_upload_bytes:
+            self.counters["rejected"] += 1
+            raise UploadTooLargeError(self.max_upload_bytes)
+
+    # Hashes an UploadFile in chunks, stopping as soon as it passes max_upload_bytes,
+    # then reads it into memory once. The framework has already spooled the body, so the
+    # only copy written here is the stored file itself.
+    async def receive(self, upload) -> StoredUpload:
+        if upload.size is not None:
+            self._check_size(upload.size)
+        hasher = hashlib.sha256()
+        size = 0
+        while chunk := await upload.read(CHUNK_SIZE):
+            size += len(chunk)
+            self._check_size(size)
+            hasher.update(chunk)
+        await upload.seek(0)
+        data = await upload.read()
+        return await self.save(data, upload.filename, hasher.hexdigest())
+
+    # Persists bytes that are already in memory (e.g. zip members of a batch)
+    async def save(self, data: bytes, filename: str | None = None, digest: str | None = None) -> StoredUpload:
+        self._check_size(len(data))
+        digest = digest or hashlib.sha256(data).hexdigest()
+        name = digest + _extension(data[:16])
+        if name not in self._index:
+            temp_path = os.path.join(self.directory, f"{_TEMP_PREFIX}{uuid.uuid4().hex}")
+            await asyncio.to_thread(Path(temp_path).write_bytes, data)
+        else:
+            temp_path = None
+        return await self._commit(temp_path, name, data, digest, filename)
+
+    async def _commit(
+        self, temp_path: str | None, name: str, data: bytes, digest: str, filename: str | None,
+    ) -> StoredUpload:
+        path = os.path.join(self.directory, name)
+        async with self._commit_lock:
+            now = time.time()
+            duplicate = name in self._index
+            if duplicate:
+                # Already stored: drop the new copy, just mark the file as recently used
+                await asyncio.to_thread(self._touch, temp_path, path, now)
+                self._total_bytes -= self._index.pop(name)[0]
+                self.counters["duplicates"] += 1
+            elif temp_path is None:
+                await asyncio.to_thread(Path(path).write_bytes, data)
+                self.counters["stored"] += 1
+            else:
+                await asyncio.to_thread(os.replace, temp_path, path)
+                self.counters["stored"] += 1
+            self._index[name] = (len(data), now)
+            self._total_bytes += len(data)
+            expired = self._pop_expired(now)
+            if expired:
+                await asyncio.to_thread(self._remove, expired)
+        logger.info("Upload %s stored as %s%s", filename, name, " (duplicate)" if duplicate else "")
+        return StoredUpload(data, digest, path, duplicate)
+
+    @staticmethod
+    def _touch(temp_path: str | None, path: str, now: float) -> None:
+        if temp_path is not None:
+            os.remove(temp_path)
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            pass
+
+    def _over_limits(self, now: float) -> bool:
+        if not self._index:
+            return False
+        oldest_seen = next(iter(self._index.values()))[1]
+        return (
+            (self.max_files and len(self._index) > self.max_files)
+            or (self.max_bytes and self._total_bytes > self.max_bytes)
+            or (self.retention_sec and now - oldest_seen > self.retention_sec)
+        )
+
+    # Drops the least recently uploaded files from the index until every limit holds
+    # and returns their names; the files themselves are removed by _remove
+    def _pop_expired(self, now: float) -> list[str]:
+        expired = []
+        while self._index and self._over_limits(now):
+            name, (size, _) = self._index.popitem(last=False)
+            self._total_bytes -= size
+            expired.append(name)
+        self.counters["evicted"] += len(expired)
+        return expired
+
+    # Applies the limits without waiting for the next upload, so retention also holds
+    # while none arrive
+    async def sweep(self) -> int:
+        async with self._commit_lock:
+            expired = self._pop_expired(time.time())
+            if expired:
+                await asyncio.to_thread(self._remove, expired)
+        return len(expired)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_sec)
+            try:
+                if evicted := await self.sweep():
+                    logger.info("Upload sweep evicted %d files", evicted)
+            except Exception as exc:
+                logger.warning("Upload sweep failed: %s", exc)
+
+    def start(self) -> None:
+        if self._sweeper is None and self.sweep_sec > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop(), name="upload-sweeper")
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    def _remove(self, names: list[str]) -> None:
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "files":       len(self._index),
+            "bytes":       self._total_bytes,
+            "max_files":   self.max_files,
+            "max_bytes":   self.max_bytes,
+            "retention_sec": self.retention_sec,
+        }
+
+
+# ASGI middleware answering 413 for request bodies on paths past max_bytes before the
+# endpoint parses them: at once from Content-Length, or as soon as a body without one
+# passes the limit while it is being received
+class BodyLimitMiddleware:
+    def __init__(self, app, paths: tuple[str, ...], max_bytes: int, detail: str):
+        self.app       = app
+        self.paths     = paths
+        self.max_bytes = max_bytes
+        self.detail    = detail
+
+    async def _reject(self, scope, receive, send) -> None:
+        await JSONResponse(status_code=413, content={"detail": self.detail})(scope, receive, send)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        over = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, over
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    over = True
+                    raise UploadTooLargeError(self.max_bytes)
+            return message
+
+        # Whatever error response the app makes of the aborted body is replaced by the 413
+        async def guarded_send(message) -> None:
+            nonlocal started
+            if over and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not over or started:
+                raise
+        if over and not started:
+            await self._reject(scope, receive, send)
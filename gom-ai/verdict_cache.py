@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+logger = logging.getLogger("gom-ai-tadp.cache")
+
+
+def image_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+# Cache key: image content hash plus everything that can change the verdict for that image
+def verdict_key(image_digest: str, *versions: str) -> str:
+    return ":".join([image_digest, *versions])
+
+
+# On-disk tier; every call is blocking and meant to run in a worker thread
+class _SqliteTier:
+    def __init__(self, path: str):
+        self._path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS verdicts_created ON verdicts (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=5.0)
+
+    def get(self, key: str, ttl: float) -> tuple[dict, float] | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if ttl > 0 and time.time() - row[1] > ttl:
+                conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value: dict, created_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), created_at),
+            )
+
+
+    # Deletes rows past the TTL, then the oldest rows until at most max_rows remain and
+    # their values total at most max_bytes (0 = no limit). Returns the rows deleted.
+    def purge(self, ttl: float, max_rows: int, max_bytes: int) -> int:
+        with self._connect() as conn:
+            deleted = 0
+            if ttl > 0:
+                deleted += conn.execute(
+                    "DELETE FROM verdicts WHERE created_at < ?", (time.time() - ttl,)
+                ).rowcount
+            if max_rows > 0:
+                deleted += conn.execute(
+                    "DELETE FROM verdicts WHERE key IN ("
+                    " SELECT key FROM verdicts ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (max_rows,),
+                ).rowcount
+            if max_bytes > 0:
+                deleted += conn.execute(
+                    "DELETE FROM verdicts WHERE key IN ("
+                    " SELECT key FROM (SELECT key, SUM(length(CAST(value AS BLOB)))"
+                    " OVER (ORDER BY created_at DESC, key) AS total FROM verdicts)"
+                    " WHERE total > ?)",
+                    (max_bytes,),
+                ).rowcount
+        return deleted
+
+
+# Two-tier verdict cache: in-memory LRU (TTL + entry/byte caps) over optional SQLite,
+# which is purged of expired rows and trimmed oldest first to disk_max_rows and
+# disk_max_bytes at start() and every purge_sec after.
+# Concurrent misses on the same key share a single computation.
+class VerdictCache:
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_sec: float = 7 * 24 * 3600,
+        sqlite_path: str = "",
+        disk_max_rows: int = 0,
+        disk_max_bytes: int = 0,
+        purge_sec: float = 3600,
+    ):
+        self._max_entries = max_entries
+        self._max_bytes   = max_bytes
+        self._ttl         = ttl_sec
+        self._entries: OrderedDict[str, tuple[dict, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._disk = _SqliteTier(sqlite_path) if sqlite_path else None
+        self._disk_max_rows  = disk_max_rows
+        self._disk_max_bytes = disk_max_bytes
+        self._purge_sec      = purge_sec
+        self._purger: asyncio.Task | None = None
+        self.counters = {
+            "hits_memory": 0,
+            "hits_disk":   0,
+            "misses":      0,
+            "coalesced":   0,
+            "evictions":   0,
+            "expired":     0,
+            "disk_errors": 0,
+            "disk_purged": 0,
+        }
+
+    def _expired(self, created_at: float) -> bool:
+        return self._ttl > 0 and time.time() - created_at > self._ttl
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _memory_get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry[1]):
+            self._drop(key)
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _memory_put(self, key: str, value: dict, created_at: float) -> None:
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self._max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, created_at, size)
+        self._bytes += size
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    async def get(self, key: str) -> tuple[dict | None, str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["hits_memory"] += 1
+            return value, "memory"
+        if self._disk is not None:
+            try:
+                found = await asyncio.to_thread(self._disk.get, key, self._ttl)
+            except Exception as exc:
+                self.counters["disk_errors"] += 1
+                logger.warning("Verdict cache disk read failed: %s", exc)
+                found = None
+            if found is not None:
+                value, created_at = found
+                self._memory_put(key, value, created_at)
+                self.counters["hits_disk"] += 1
+                return value, "disk"
+        return None, "miss"
+
+    async def put(self, key: str, value: dict) -> None:
+        created_at = time.time()
+        self._memory_put(key, value, created_at)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.put, key, value, created_at)
+            except Exception as exc:
+                self.counters["disk_errors"] += 1
+                logger.warning("Verdict cache disk write failed: %s", exc)
+
+    async def purge_disk(self) -> int:
+        if self._disk is None:
+            return 0
+        try:
+            deleted = await asyncio.to_thread(
+                self._disk.purge, self._ttl, self._disk_max_rows, self._disk_max_bytes
+            )
+        except Exception as exc:
+            self.counters["disk_errors"] += 1
+            logger.warning("Verdict cache disk purge failed: %s", exc)
+            return 0
+        self.counters["disk_purged"] += deleted
+        if deleted:
+            logger.info("Verdict cache purged %d rows from disk", deleted)
+        return deleted
+
+    async def _purge_loop(self) -> None:
+        while True:
+            await self.purge_disk()
+            if self._purge_sec <= 0:
+                return
+            await asyncio.sleep(self._purge_sec)
+
+    def start(self) -> None:
+        if self._disk is not None and self._purger is None:
+            self._purger = asyncio.create_task(self._purge_loop(), name="verdict-cache-purge")
+
+    async def stop(self) -> None:
+        if self._purger is not None:
+            self._purger.cancel()
+            await asyncio.gather(self._purger, return_exceptions=True)
+            self._purger = None
+
+    async def _compute_and_store(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        value = await compute()
+        await self.put(key, value)
+        return value
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    # Returns (value, source) where source is "memory", "disk", "coalesced" or "miss".
+    # The computation runs in its own task so one caller disconnecting does not cancel
+    # it for the others. Failures are not cached; every waiter sees the exception.
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[dict]]
+    ) -> tuple[dict, str]:
+        value, source = await self.get(key)
+        if value is not None:
+            return value, source
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(task), "coalesced"
+
+        self.counters["misses"] += 1
+        task = asyncio.create_task(self._compute_and_store(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task), "miss"
+
+    def stats(self) -> dict:
+        hits = self.counters["hits_memory"] + self.counters["hits_disk"] + self.counters["coalesced"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio":  round(hits / lookups, 4) if lookups else 0.0,
+            "entries":    len(self._entries),
+            "bytes":      self._bytes,
+            "disk":       self._disk is not None,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from metrics import STARTUP_SECONDS
+
+logger = logging.getLogger("gom-ai-tadp.warmup")
+
+
+class _Step:
+    def __init__(self, name: str, load: Callable[[], object], required: bool):
+        self.name     = name
+        self.load     = load
+        self.required = required
+        self.state    = "pending"
+        self.error: str | None = None
+        self.seconds: float | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "state":    self.state,
+            "required": self.required,
+            "seconds":  round(self.seconds, 3) if self.seconds is not None else None,
+            "error":    self.error,
+        }
+
+
+# Loads slow components (SDK clients, TensorFlow, indexes) on a worker thread after the
+# server starts listening, so a new worker answers /livez at once and reports /readyz
+# when the required steps are done. Each group runs its steps in order; groups run
+# side by side. started_at is when the process began importing the app.
+class Warmup:
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.serving_sec: float | None = None
+        self.ready_sec: float | None = None
+        self._groups: list[list[_Step]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    # load is blocking and runs on a thread. Failed steps are reported, not retried;
+    # the component behind them falls back to loading on first use or stays disabled.
+    def add_group(self, *steps: tuple[str, Callable[[], object], bool]) -> None:
+        self._groups.append([_Step(name, load, required) for name, load, required in steps])
+
+    @property
+    def steps(self) -> list[_Step]:
+        return [step for group in self._groups for step in group]
+
+    @property
+    def ready(self) -> bool:
+        return all(step.state in ("ready", "failed") for step in self.steps if step.required)
+
+    def start(self) -> None:
+        self.serving_sec = time.perf_counter() - self.started_at
+        STARTUP_SECONDS.observe(self.serving_sec, "serving")
+        logger.info("Accepting traffic %.3f s after import", self.serving_sec)
+        self._tasks = [asyncio.create_task(self._run(group)) for group in self._groups]
+        if self.ready:
+            self._mark_ready()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, group: list[_Step]) -> None:
+        for step in group:
+            step.state = "loading"
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(step.load)
+                step.state = "ready"
+            except Exception as exc:
+                step.state = "failed"
+                step.error = str(exc)
+                logger.error("Warm-up of %s failed: %s", step.name, exc)
+            step.seconds = time.perf_counter() - started
+            STARTUP_SECONDS.observe(step.seconds, step.name)
+            logger.info("Warm-up of %s: %s in %.2f s", step.name, step.state, step.seconds)
+            if self.ready_sec is None and self.ready:
+                self._mark_ready()
+
+    def _mark_ready(self) -> None:
+        self.ready_sec = time.perf_counter() - self.started_at
+        STARTUP_SECONDS.observe(self.ready_sec, "ready")
+        logger.info("Ready %.3f s after import", self.ready_sec)
+
+    def status(self) -> dict:
+        return {
+            "ready":       self.ready,
+            "serving_sec": round(self.serving_sec, 3) if self.serving_sec is not None else None,
+            "ready_sec":   round(self.ready_sec, 3) if self.ready_sec is not None else None,
+            "components":  {step.name: step.to_dict() for step in self.steps},
+        }
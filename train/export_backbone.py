@@ -0,0 +1,172 @@
+import argparse
+import gc
+import json
+import sys
+import time
+
+import numpy as np
+import joblib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from feature_extractor import (
+    KERAS_VERSION, QUANTIZATIONS, export_backbone, load_feature_extractor,
+)
+from feature_pipeline import IMG_SIZE, iter_features, log
+from feature_store import FeatureStore, stored_backbone
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Xuất ResNet50 + pooling thành SavedModel/TFLite tối ưu cho CPU và kiểm tra độ chính xác"
+    )
+    parser.add_argument("--output", default="backbone", help="thư mục artifact")
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, default="float16")
+    parser.add_argument("--threads", type=int, help="số luồng TFLite (mặc định: theo CPU)")
+    parser.add_argument("--latency-runs", type=int, default=30, help="số lần đo batch 1")
+    parser.add_argument("--check", action="store_true",
+                        help="so độ chính xác SVM với model float trên tập held-out")
+    parser.add_argument("--store", default="feature_store", help="kho đặc trưng từ extract_features.py")
+    parser.add_argument("--model", default="gom_svm.pkl")
+    parser.add_argument("--classes", default="class_names.pkl")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-accuracy-drop", type=float, default=1.0,
+                        help="exit 1 nếu accuracy giảm quá số điểm phần trăm này")
+    parser.add_argument("--report", help="ghi báo cáo ra file JSON")
+    return parser.parse_args()
+
+
+# None where the resource module is missing (Windows)
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Load time, peak-RSS growth and batch-1 latency of one extractor
+def profile(path: str, threads: int | None, runs: int) -> tuple[object, dict]:
+    gc.collect()
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    extractor = load_feature_extractor(path, threads)
+    load_sec = time.perf_counter() - started
+    image = np.random.default_rng(0).integers(0, 256, (1, *IMG_SIZE, 3), dtype=np.uint8)
+    extractor(image)  # first call allocates and traces
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        extractor(image)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return extractor, {
+        "version":         extractor.version,
+        "load_sec":        round(load_sec, 2),
+        "batch1_p50_ms":   round(timings[len(timings) // 2], 1),
+        "batch1_p95_ms":   round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1) if rss_before is not None else None,
+    }
+
+
+# Same held-out split as extract_features.py: train_test_split on the store rows with
+# test_size=0.2, random_state=42, stratified by class
+def held_out(store: FeatureStore, class_names: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    from sklearn.model_selection import train_test_split
+
+    y = np.array([class_names.index(name) for name in store.labels()])
+    _, test_rows = train_test_split(
+        np.arange(store.count), test_size=0.2, random_state=42, stratify=y
+    )
+    return np.sort(test_rows), y
+
+
+def extract(extractor, paths: list[str], batch_size: int, workers: int) -> tuple[list[int], np.ndarray]:
+    indices, chunks = [], []
+    for batch_indices, features in iter_features(extractor, paths, batch_size, workers):
+        indices += batch_indices
+        chunks.append(features)
+    return indices, np.concatenate(chunks) if chunks else np.empty((0, 2048), np.float32)
+
+
+def check_accuracy(args, float_model, artifact) -> dict:
+    svm = joblib.load(args.model)
+    class_names = joblib.load(args.classes)
+    backbone = stored_backbone(args.store)
+    store = FeatureStore(args.store, backbone=backbone or KERAS_VERSION)
+    if store.count == 0:
+        raise SystemExit(f"{args.store} trống; chạy extract_features.py trước")
+    test_rows, y = held_out(store, class_names)
+    paths = store.paths()
+    test_paths = [paths[row] for row in test_rows]
+
+    # A store extracted with the float model already holds the reference features
+    if backbone == KERAS_VERSION:
+        reference = store.features()[test_rows]
+    else:
+        ref_indices, ref_features = extract(float_model, test_paths, args.batch_size, args.workers)
+        reference = np.zeros((len(test_paths), ref_features.shape[1]), dtype=np.float32)
+        reference[ref_indices] = ref_features
+    kept, quantised = extract(artifact, test_paths, args.batch_size, args.workers)
+    reference, y_test = reference[kept], y[test_rows][kept]
+
+    float_pred = svm.predict(reference)
+    artifact_pred = svm.predict(quantised)
+    cosine = np.sum(reference * quantised, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(quantised, axis=1) + 1e-12
+    )
+    return {
+        "images":            len(kept),
+        "float_accuracy":    round(float(np.mean(float_pred == y_test)) * 100, 2),
+        "artifact_accuracy": round(float(np.mean(artifact_pred == y_test)) * 100, 2),
+        "top1_agreement":    round(float(np.mean(float_pred == artifact_pred)) * 100, 2),
+        "cosine_mean":       round(float(cosine.mean()), 5),
+        "cosine_min":        round(float(cosine.min()), 5),
+    }
+
+
+def main():
+    args = parse_args()
+
+    # ===== XUẤT ARTIFACT =====
+    manifest = export_backbone(args.output, args.quantize)
+    log(f"[export] {args.output}: {manifest['tflite']} ({manifest['tflite_bytes'] / 1e6:.1f} MB)")
+
+    # ===== ĐO ĐỘ TRỄ BATCH 1 & BỘ NHỚ =====
+    # Artifact first: peak RSS only grows, so the float model loaded later cannot hide it
+    artifact, artifact_profile = profile(args.output, args.threads, args.latency_runs)
+    float_model, float_profile = profile("", None, args.latency_runs)
+    report = {"manifest": manifest, "float": float_profile, "artifact": artifact_profile}
+    print(f"{'':<10}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'RSS +MB':>9}")
+    for name in ("float", "artifact"):
+        p = report[name]
+        rss = "n/a" if p["peak_rss_growth_mb"] is None else p["peak_rss_growth_mb"]
+        print(f"{name:<10}{p['load_sec']:>8}{p['batch1_p50_ms']:>9}{p['batch1_p95_ms']:>9}{rss:>9}")
+
+    # ===== KIỂM TRA HỒI QUY ĐỘ CHÍNH XÁC =====
+    code = 0
+    if args.check:
+        accuracy = check_accuracy(args, float_model, artifact)
+        report["accuracy"] = accuracy
+        print(
+            f"Held-out {accuracy['images']} ảnh: float {accuracy['float_accuracy']}%  "
+            f"artifact {accuracy['artifact_accuracy']}%  trùng top-1 {accuracy['top1_agreement']}%  "
+            f"cosine tb {accuracy['cosine_mean']} / min {accuracy['cosine_min']}"
+        )
+        drop = accuracy["float_accuracy"] - accuracy["artifact_accuracy"]
+        if drop > args.max_accuracy_drop:
+            print(f"REGRESSION accuracy giảm {drop:.2f} điểm > {args.max_accuracy_drop}", file=sys.stderr)
+            code = 1
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,117 @@
-import tensorflow as tf
-import numpy as np
+import argparse
+import json
 import os
-from tensorflow.keras.applications import ResNet50
-from tensorflow.keras.applications.resnet50 import preprocess_input
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
+import time
+
+import numpy as np
+import sklearn
 from sklearn.model_selection import train_test_split
-from sklearn.svm import SVC
 import joblib
 
-DATASET_PATH = "dataset/train"
-IMG_SIZE = (224, 224)
-
-# ===== LOAD RESNET LÀM FEATURE EXTRACTOR =====
-base_model = ResNet50(weights="imagenet", include_top=False)
-
-feature_model = tf.keras.Model(
-    inputs=base_model.input,
-    outputs=tf.keras.layers.GlobalAveragePooling2D()(base_model.output)
-)
-
-# ===== LẤY TÊN LỚP =====
-class_names = sorted(os.listdir(DATASET_PATH))
-print("Classes:", class_names)
-
-X = []
-y = []
-
-# ===== DUYỆT DATASET =====
-for label, class_name in enumerate(class_names):
-    class_path = os.path.join(DATASET_PATH, class_name)
+from feature_extractor import extractor_version, load_feature_extractor
+from feature_pipeline import list_dataset, log
+from feature_store import FeatureStore
+from svm_training import TRAINERS, fit_calibrated, search, time_predict
 
-    for img_name in os.listdir(class_path):
-        img_path = os.path.join(class_path, img_name)
-
-        img = load_img(img_path, target_size=IMG_SIZE)
-        img_array = img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = preprocess_input(img_array)
-
-        # TRÍCH FEATURE 2048 chiều
-        features = feature_model.predict(img_array)
-        X.append(features.flatten())
-        y.append(label)
-
-X = np.array(X)
-y = np.array(y)
-
-print("Feature shape:", X.shape)   # (số ảnh, 2048)
-
-# ===== CHIA TRAIN/TEST =====
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-# ===== TRAIN SVM =====
-svm = SVC(kernel="linear", probability=True)
-svm.fit(X_train, y_train)
-
-# ===== ĐÁNH GIÁ =====
-acc = svm.score(X_test, y_test)
-print(f"Accuracy SVM: {acc*100:.2f}%")
+DATASET_PATH = "dataset/train"
 
-# ===== LƯU MODEL =====
-joblib.dump(svm, "gom_svm.pkl")
-joblib.dump(class_names, "class_names.pkl")
 
-print("Đã lưu gom_svm.pkl và class_names.pkl")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Trích đặc trưng ResNet50 và huấn luyện SVM")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="số tiến trình giải mã ảnh")
+    parser.add_argument("--store", default="feature_store", help="thư mục lưu đặc trưng đã trích")
+    parser.add_argument("--backbone", default="",
+                        help="artifact từ export_backbone.py (.tflite/SavedModel); bỏ trống: ResNet50 Keras float")
+    parser.add_argument("--trainer", choices=TRAINERS, default="svc",
+                        help="svc: SVC linear (chậm khi nhiều ảnh); linear: LinearSVC; sgd: SGDClassifier")
+    parser.add_argument("--search", action="store_true",
+                        help="tìm siêu tham số bằng cross-validation song song trước khi train")
+    parser.add_argument("--pca", type=int, nargs="+", default=[0],
+                        help="số chiều PCA (0: không giảm chiều); nhiều giá trị sẽ được thử khi --search")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="số tiến trình cho search/calibration (-1: mọi core)")
+    parser.add_argument("--card", default="gom_svm.card.json", help="model card JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # ===== LẤY TÊN LỚP =====
+    dataset_classes, items = list_dataset(args.dataset)
+    print("Classes:", dataset_classes)
+
+    # ===== CẬP NHẬT KHO ĐẶC TRƯNG: CHỈ TRÍCH ẢNH MỚI HOẶC ĐÃ ĐỔI =====
+    # ResNet50 is only built if at least one image needs extracting
+    store = FeatureStore(args.store, backbone=extractor_version(args.backbone))
+    store.update(
+        [(path, dataset_classes[label]) for path, label in items],
+        lambda: load_feature_extractor(args.backbone),
+        batch_size=args.batch_size,
+        workers=args.workers,
+    )
+
+    # ===== ĐỌC ĐẶC TRƯNG QUA MEMMAP, KHÔNG NẠP LẠI TỪNG ẢNH =====
+    class_names = sorted(set(store.labels()))
+    X = store.features()
+    y = np.array([class_names.index(name) for name in store.labels()])
+
+    print("Feature shape:", X.shape)   # (số ảnh, 2048)
+
+    # ===== CHIA TRAIN/TEST =====
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    # ===== TÌM SIÊU THAM SỐ (CV SONG SONG TRÊN ĐẶC TRƯNG ĐÃ LƯU) =====
+    params, cv_accuracy, search_sec = {"pca": args.pca[0]}, None, 0.0
+    if args.search:
+        params, cv_accuracy, search_sec = search(
+            X_train, y_train, args.trainer, args.pca, args.folds, args.jobs,
+            cache_dir=os.path.join(args.store, "sklearn_cache"),
+        )
+        log(f"[search] best {params} CV {cv_accuracy * 100:.2f}% in {search_sec:.1f}s")
+
+    # ===== TRAIN SVM =====
+    svm, fit_sec = fit_calibrated(X_train, y_train, args.trainer, params, args.jobs)
+
+    # ===== ĐÁNH GIÁ =====
+    acc = svm.score(X_test, y_test)
+    print(f"Accuracy SVM: {acc*100:.2f}%")
+    predict = time_predict(svm, X_test)
+
+    # ===== LƯU MODEL & MODEL CARD =====
+    joblib.dump(svm, "gom_svm.pkl")
+    joblib.dump(class_names, "class_names.pkl")
+    card = {
+        "model":         "gom_svm.pkl",
+        "trained_at":    time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "trainer":       args.trainer,
+        "params":        params,
+        "backbone":      store.backbone,
+        "feature_dim":   int(X.shape[1]),
+        "classes":       class_names,
+        "train_images":  len(y_train),
+        "test_images":   len(y_test),
+        "cv_folds":      args.folds if args.search else None,
+        "cv_accuracy":   round(cv_accuracy * 100, 2) if cv_accuracy is not None else None,
+        "test_accuracy": round(acc * 100, 2),
+        "timings": {
+            "search_sec": round(search_sec, 2),
+            "fit_sec":    round(fit_sec, 2),
+            **predict,
+        },
+        "sklearn":       sklearn.__version__,
+    }
+    with open(args.card, "w", encoding="utf-8") as f:
+        json.dump(card, f, ensure_ascii=False, indent=2)
+    print(f"Train {fit_sec:.1f}s (search {search_sec:.1f}s), "
+          f"dự đoán {predict['batch_ms_per_image']} ms/ảnh theo lô, {predict['batch1_p50_ms']} ms ảnh lẻ")
+
+    print(f"Đã lưu gom_svm.pkl, class_names.pkl và {args.card}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from feature_pipeline import IMG_SIZE, log
+
+# The loaders live with the service so training, testing and serving share them
+GOM_AI_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gom-ai")
+sys.path.append(GOM_AI_DIR)
+
+import backbone  # noqa: E402
+from backbone import MANIFEST, build_backbone, file_version  # noqa: E402
+
+# What the other train scripts take from here
+KERAS_VERSION = backbone.KERAS_VERSION
+extractor_version = backbone.extractor_version
+
+QUANTIZATIONS = ("none", "float16", "int8")
+
+# resnet50.preprocess_input ("caffe" mode): RGB -> BGR, then minus the ImageNet means
+_BGR_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+def load_feature_extractor(path: str | None = None, threads: int | None = None):
+    started = time.perf_counter()
+    extractor = backbone.load_feature_extractor(path, threads)
+    log(f"[backbone] {extractor.version} loaded in {time.perf_counter() - started:.1f}s")
+    return extractor
+
+
+# Freezes ResNet50 + global average pooling, with the caffe preprocessing folded into
+# the graph, into <output_dir>/saved_model and a TFLite file quantised as requested:
+# "float16" halves the weights, "int8" stores them as int8 (dynamic range) for the
+# fastest CPU inference. Returns the manifest.
+def export_backbone(output_dir: str, quantize: str = "float16") -> dict:
+    import tensorflow as tf
+
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"quantize must be one of {QUANTIZATIONS}, got {quantize!r}")
+    model = build_backbone()
+    mean = tf.constant(_BGR_MEAN)
+
+    @tf.function(input_signature=[tf.TensorSpec([None, *IMG_SIZE, 3], tf.float32, name="image")])
+    def serve(image):
+        return {"features": model(tf.reverse(image, axis=[-1]) - mean, training=False)}
+
+    saved_model_dir = os.path.join(output_dir, "saved_model")
+    os.makedirs(output_dir, exist_ok=True)
+    module = tf.Module()
+    module.backbone = model
+    tf.saved_model.save(module, saved_model_dir, signatures={"serving_default": serve})
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if quantize != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    tflite_name = f"resnet50_gap_{quantize}.tflite"
+    tflite_path = os.path.join(output_dir, tflite_name)
+    with open(tflite_path, "wb") as f:
+        f.write(converter.convert())
+
+    manifest = {
+        "backbone":       "resnet50-imagenet-gap",
+        "input":          {"shape": [None, *IMG_SIZE, 3], "dtype": "float32", "pixels": "RGB 0-255"},
+        "output_dim":     2048,
+        "quantize":       quantize,
+        "saved_model":    "saved_model",
+        "tflite":         tflite_name,
+        "tflite_bytes":   os.path.getsize(tflite_path),
+        "tflite_version": file_version(f"tflite-{quantize}", tflite_path),
+    }
+    with open(os.path.join(output_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (224, 224)
+FEATURE_DIM = 2048
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+# Lists dataset/<class>/<image> pairs; labels are indices into the sorted class names
+def list_dataset(dataset_path: str) -> tuple[list[str], list[tuple[str, int]]]:
+    class_names = sorted(
+        name for name in os.listdir(dataset_path)
+        if os.path.isdir(os.path.join(dataset_path, name))
+    )
+    items = []
+    for label, class_name in enumerate(class_names):
+        class_path = os.path.join(dataset_path, class_name)
+        for img_name in sorted(os.listdir(class_path)):
+            if img_name.startswith("."):
+                continue
+            items.append((os.path.join(class_path, img_name), label))
+    return class_names, items
+
+
+# Same decoding as keras load_img(path, target_size=IMG_SIZE): RGB, nearest-neighbour resize.
+# Runs inside worker processes, so it only depends on Pillow and NumPy.
+def load_image(path: str) -> tuple[np.ndarray | None, str | None]:
+    try:
+        with Image.open(path) as img:
+            img = img.convert("RGB").resize(IMG_SIZE, Image.NEAREST)
+            return np.asarray(img, dtype=np.uint8), None
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+
+
+# Decodes images in worker processes, yielding (index, array, error) in input order.
+# At most `prefetch` images are in flight so memory stays bounded when the model is slower.
+def iter_decoded(paths: list[str], workers: int, prefetch: int = 256):
+    if workers <= 1:
+        for index, path in enumerate(paths):
+            array, error = load_image(path)
+            yield index, array, error
+        return
+
+    # spawn: forking a process that has already initialised TensorFlow can deadlock.
+    # Spawned workers re-import the calling script, so every script that decodes with
+    # workers > 1 must keep its entry point under `if __name__ == "__main__":`.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        next_index = 0
+        while next_index < len(paths) or pending:
+            while next_index < len(paths) and len(pending) < prefetch:
+                pending.append((next_index, pool.submit(load_image, paths[next_index])))
+                next_index += 1
+            index, future = pending.popleft()
+            array, error = future.result()
+            yield index, array, error
+
+
+# Streams (indices, features) for fixed-size batches; unreadable images are logged
+# and reported through `skipped` instead of aborting the run. feature_model is an
+# extractor from feature_extractor.load_feature_extractor.
+def iter_features(
+    feature_model,
+    paths: list[str],
+    batch_size: int = 32,
+    workers: int = 4,
+    skipped: list[tuple[str, str]] | None = None,
+):
+    started = time.perf_counter()
+    done = 0
+    indices: list[int] = []
+    images: list[np.ndarray] = []
+
+    def flush():
+        nonlocal done
+        features = feature_model(np.stack(images))
+        done += len(images)
+        elapsed = time.perf_counter() - started
+        log(f"[extract] {done}/{len(paths)} ảnh  {done / elapsed:.1f} ảnh/s")
+        return list(indices), features
+
+    for index, array, error in iter_decoded(paths, workers, prefetch=batch_size * 4):
+        if array is None:
+            log(f"[extract] Bỏ qua ảnh lỗi {paths[index]}: {error}")
+            if skipped is not None:
+                skipped.append((paths[index], error))
+            continue
+        indices.append(index)
+        images.append(array)
+        if len(images) == batch_size:
+            yield flush()
+            indices.clear()
+            images.clear()
+    if images:
+        yield flush()
+
+    elapsed = time.perf_counter() - started
+    log(
+        f"[extract] Xong {done} ảnh trong {elapsed:.1f}s "
+        f"({done / elapsed if elapsed else 0:.1f} ảnh/s), bỏ qua {len(paths) - done}"
+    )
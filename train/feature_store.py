@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from feature_extractor import KERAS_VERSION
+from feature_pipeline import FEATURE_DIM, iter_features, log
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Backbone version the store at root was extracted with, or None if there is no store
+def stored_backbone(root: str) -> str | None:
+    index_path = os.path.join(root, "index.json")
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f).get("backbone", KERAS_VERSION)
+
+
+# On-disk feature matrix (features.npy, memory-mapped) plus index.json mapping each
+# image path to its row, mtime, size, content hash and class. Unreadable files are
+# remembered too, so they are not retried until they change on disk.
+# Rows 0..count-1 are always in use: deleting swaps the last row into the hole, so
+# readers get one contiguous zero-copy slice. Features from another backbone version
+# (e.g. a quantised export) are discarded and re-extracted.
+class FeatureStore:
+    def __init__(self, root: str, dim: int = FEATURE_DIM, backbone: str = KERAS_VERSION):
+        self.root = root
+        self.dim = dim
+        self.backbone = backbone
+        self._matrix_path = os.path.join(root, "features.npy")
+        self._index_path = os.path.join(root, "index.json")
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self._index_path):
+            with open(self._index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            if index["dim"] != dim:
+                raise ValueError(f"{self._index_path} has dim {index['dim']}, expected {dim}")
+            self.entries: dict[str, dict] = index["entries"]
+            self.unreadable: dict[str, dict] = index.get("unreadable", {})
+            stored_backbone = index.get("backbone", KERAS_VERSION)
+            if stored_backbone != backbone:
+                log(f"[store] Backbone changed {stored_backbone} -> {backbone}, re-extracting everything")
+                self.entries = {}
+                self.unreadable = {}
+        else:
+            self.entries = {}
+            self.unreadable = {}
+        self._row_paths = [None] * len(self.entries)
+        for path, entry in self.entries.items():
+            self._row_paths[entry["row"]] = path
+
+    @property
+    def count(self) -> int:
+        return len(self.entries)
+
+    def _open(self, capacity: int):
+        if os.path.exists(self._matrix_path):
+            matrix = np.load(self._matrix_path, mmap_mode="r+")
+            if matrix.shape[0] >= capacity:
+                return matrix
+            # Grow by half again so repeated small additions stay amortised O(1)
+            new_capacity = max(capacity, int(matrix.shape[0] * 1.5) + 64)
+            tmp_path = self._matrix_path + ".tmp"
+            grown = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, self.dim)
+            )
+            for start in range(0, self.count, 4096):
+                grown[start:start + 4096] = matrix[start:min(start + 4096, self.count)]
+            grown.flush()
+            del matrix, grown
+            os.replace(tmp_path, self._matrix_path)
+            return np.load(self._matrix_path, mmap_mode="r+")
+        return np.lib.format.open_memmap(
+            self._matrix_path, mode="w+", dtype=np.float32, shape=(max(capacity, 64), self.dim)
+        )
+
+    def _save_index(self) -> None:
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "dim": self.dim, "backbone": self.backbone,
+                    "entries": self.entries, "unreadable": self.unreadable,
+                },
+                f, ensure_ascii=False,
+            )
+        os.replace(tmp_path, self._index_path)
+
+    def _remove(self, matrix, path: str) -> None:
+        row = self.entries.pop(path)["row"]
+        last = len(self._row_paths) - 1
+        if row != last:
+            moved = self._row_paths[last]
+            matrix[row] = matrix[last]
+            self.entries[moved]["row"] = row
+            self._row_paths[row] = moved
+        self._row_paths.pop()
+
+    def _append(self, path: str, meta: dict) -> int:
+        row = len(self._row_paths)
+        self._row_paths.append(path)
+        self.entries[path] = {**meta, "row": row}
+        return row
+
+    # Brings the store in line with `items` (path, class name): drops removed images and
+    # extracts features only for new or changed files. Returns a summary of what changed.
+    def update(
+        self,
+        items: list[tuple[str, str]],
+        feature_model_factory,
+        batch_size: int = 32,
+        workers: int = 4,
+    ) -> dict:
+        wanted = dict(items)
+        by_hash = {entry["sha256"]: path for path, entry in self.entries.items()}
+        removed = [path for path in self.entries if path not in wanted]
+        unchanged, copied, to_extract = 0, [], []
+        self.unreadable = {path: bad for path, bad in self.unreadable.items() if path in wanted}
+
+        for path, label in items:
+            stat = os.stat(path)
+            bad = self.unreadable.get(path)
+            if bad and bad["mtime"] == stat.st_mtime and bad["size"] == stat.st_size:
+                continue
+            self.unreadable.pop(path, None)
+            entry = self.entries.get(path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                entry["label"] = label
+                unchanged += 1
+                continue
+            sha = file_sha256(path)
+            meta = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha, "label": label}
+            if entry and entry["sha256"] == sha:
+                entry.update(meta)
+                unchanged += 1
+            elif sha in by_hash and by_hash[sha] in self.entries:
+                copied.append((path, meta, by_hash[sha]))
+            else:
+                to_extract.append((path, meta))
+
+        matrix = self._open(self.count + len(copied) + len(to_extract))
+
+        # Copy before removing so renamed files can reuse their old row's features
+        for path, meta, source in copied:
+            source_row = self.entries[source]["row"]
+            if path in self.entries:
+                self._remove(matrix, path)
+                source_row = self.entries[source]["row"]
+            row = self._append(path, meta)
+            matrix[row] = matrix[source_row]
+        for path in removed:
+            if path in self.entries:
+                self._remove(matrix, path)
+        for path, _ in to_extract:
+            if path in self.entries:
+                self._remove(matrix, path)
+
+        skipped: list[tuple[str, str]] = []
+        skipped_total = 0
+        extracted = 0
+        if to_extract:
+            paths = [path for path, _ in to_extract]
+            metas = [meta for _, meta in to_extract]
+            meta_by_path = dict(to_extract)
+
+            def note_skipped():
+                nonlocal skipped_total
+                for path, error in skipped:
+                    meta = meta_by_path[path]
+                    self.unreadable[path] = {"mtime": meta["mtime"], "size": meta["size"], "error": error}
+                skipped_total += len(skipped)
+                skipped.clear()
+
+            for indices, features in iter_features(
+                feature_model_factory(), paths, batch_size, workers, skipped
+            ):
+                for index, vector in zip(indices, features):
+                    row = self._append(paths[index], metas[index])
+                    matrix[row] = vector
+                extracted += len(indices)
+                note_skipped()
+                # Persist progress so an interrupted run resumes where it stopped
+                matrix.flush()
+                self._save_index()
+            note_skipped()
+
+        matrix.flush()
+        del matrix
+        self._save_index()
+        summary = {
+            "unchanged": unchanged,
+            "copied":    len(copied),
+            "extracted": extracted,
+            "removed":   len(removed),
+            "skipped":   skipped_total,
+            "total":     self.count,
+        }
+        log(f"[store] {summary}")
+        return summary
+
+    # Zero-copy (count, dim) view of all stored features, in row order
+    def features(self) -> np.ndarray:
+        if not self.count:
+            return np.empty((0, self.dim), dtype=np.float32)
+        matrix = np.load(self._matrix_path, mmap_mode="r")
+        return matrix[: self.count]
+
+    def paths(self) -> list[str]:
+        return list(self._row_paths)
+
+    def labels(self) -> list[str]:
+        return [self.entries[path]["label"] for path in self._row_paths]
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+
+from feature_pipeline import log
+
+TRAINERS = ("svc", "linear", "sgd")
+
+# Regularisation values tried by the cross-validated search, per trainer
+PARAM_GRIDS = {
+    "svc":    {"clf__C": [0.01, 0.1, 1.0, 10.0]},
+    "linear": {"clf__C": [0.001, 0.01, 0.1, 1.0]},
+    "sgd":    {"clf__alpha": [1e-5, 1e-4, 1e-3, 1e-2]},
+}
+
+
+def _classifier(trainer: str, dual: bool, **params):
+    if trainer == "svc":
+        from sklearn.svm import SVC
+        return SVC(kernel="linear", **params)
+    if trainer == "linear":
+        from sklearn.svm import LinearSVC
+        return LinearSVC(dual=dual, max_iter=5000, **params)
+    if trainer == "sgd":
+        from sklearn.linear_model import SGDClassifier
+        return SGDClassifier(loss="hinge", max_iter=2000, tol=1e-4, random_state=42, **params)
+    raise ValueError(f"trainer must be one of {TRAINERS}, got {trainer!r}")
+
+
+def _reducer(components: int):
+    from sklearn.decomposition import PCA
+    return PCA(n_components=components, random_state=42) if components else "passthrough"
+
+
+# scale -> optional PCA -> classifier. memory caches the fitted scaler/PCA per fold, so
+# the search fits them once per (fold, components) instead of once per C or alpha.
+def build_pipeline(trainer: str, components: int = 0, dual: bool = False, memory: str | None = None, **params):
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    return Pipeline(
+        [
+            ("scale", StandardScaler()),
+            ("pca", _reducer(components)),
+            ("clf", _classifier(trainer, dual, **params)),
+        ],
+        memory=memory,
+    )
+
+
+# Stratified k-fold grid search over the trainer's grid and the PCA sizes, on n_jobs
+# cores. Scores the bare classifier: calibration only matters for the final model.
+# Returns (best params, best mean CV accuracy, seconds).
+def search(
+    X: np.ndarray,
+    y: np.ndarray,
+    trainer: str,
+    pca: list[int],
+    folds: int,
+    n_jobs: int,
+    cache_dir: str | None,
+) -> tuple[dict, float, float]:
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+    grid = dict(PARAM_GRIDS[trainer])
+    grid["pca"] = [_reducer(n) for n in pca]
+    # Reducing transforms only pay off when there is a PCA to reuse
+    memory = cache_dir if cache_dir and any(pca) else None
+    estimator = build_pipeline(trainer, dual=X.shape[0] <= X.shape[1], memory=memory)
+    started = time.perf_counter()
+    searcher = GridSearchCV(
+        estimator,
+        grid,
+        cv=StratifiedKFold(n_splits=folds, shuffle=True, random_state=42),
+        scoring="accuracy",
+        n_jobs=n_jobs,
+        refit=False,
+    )
+    searcher.fit(X, y)
+    seconds = time.perf_counter() - started
+
+    best = dict(searcher.best_params_)
+    best["pca"] = 0 if isinstance(best["pca"], str) else best["pca"].n_components
+    ranked = np.argsort(searcher.cv_results_["rank_test_score"])
+    for i in ranked[:5]:
+        log(f"[search] {searcher.cv_results_['mean_test_score'][i] * 100:.2f}% "
+            f"± {searcher.cv_results_['std_test_score'][i] * 100:.2f}  {searcher.cv_results_['params'][i]}")
+    return best, float(searcher.best_score_), seconds
+
+
+# Final model with predict_proba, as LocalClassifier and test_svm.py need: SVC keeps its
+# built-in Platt scaling; LinearSVC/SGD are wrapped in a 3-fold sigmoid calibration,
+# which is far cheaper than SVC's 5 extra kernel fits
+def fit_calibrated(X: np.ndarray, y: np.ndarray, trainer: str, params: dict, n_jobs: int):
+    from sklearn.calibration import CalibratedClassifierCV
+
+    params = dict(params)
+    components = params.pop("pca", 0)
+    clf_params = {key.removeprefix("clf__"): value for key, value in params.items()}
+    dual = X.shape[0] <= (components or X.shape[1])
+    if trainer == "svc":
+        model = build_pipeline(trainer, components, probability=True, **clf_params)
+    else:
+        model = build_pipeline(trainer, components, dual=dual, **clf_params)
+        calibrated = CalibratedClassifierCV(model.steps[-1][1], method="sigmoid", cv=3, n_jobs=n_jobs)
+        model.steps[-1] = ("clf", calibrated)
+    started = time.perf_counter()
+    model.fit(X, y)
+    return model, time.perf_counter() - started
+
+
+# Per-image latency of predict_proba for the whole test set at once and for one image
+def time_predict(model, X: np.ndarray, runs: int = 20) -> dict:
+    started = time.perf_counter()
+    model.predict_proba(X)
+    batch_ms = (time.perf_counter() - started) * 1000 / max(len(X), 1)
+    single = []
+    for row in X[:runs]:
+        started = time.perf_counter()
+        model.predict_proba(row[np.newaxis, :])
+        single.append((time.perf_counter() - started) * 1000)
+    single.sort()
+    return {
+        "batch_ms_per_image": round(batch_ms, 4),
+        "batch1_p50_ms":      round(single[len(single) // 2], 3) if single else None,
+    }
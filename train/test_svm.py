@@ -1,57 +1,199 @@
-import tensorflow as tf
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+
 import numpy as np
 import joblib
-import tkinter as tk
-from tkinter import filedialog
-
-from tensorflow.keras.applications.resnet50 import preprocess_input
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
-from tensorflow.keras.applications import ResNet50
-
-# ===== LOAD MODEL & LABEL =====
-svm = joblib.load("gom_svm.pkl")
-class_names = joblib.load("class_names.pkl")
-
-# ===== LOAD RESNET LÀM FEATURE EXTRACTOR =====
-base_model = ResNet50(weights="imagenet", include_top=False)
-feature_model = tf.keras.Model(
-    inputs=base_model.input,
-    outputs=tf.keras.layers.GlobalAveragePooling2D()(base_model.output)
-)
-
-# ===== MỞ HỘP THOẠI CHỌN ẢNH =====
-root = tk.Tk()
-root.withdraw()
-root.attributes('-topmost', True)
-
-IMG_PATH = filedialog.askopenfilename(
-    parent=root,
-    title="Chọn ảnh gốm cần nhận diện",
-    filetypes=[("Image files", "*.jpg *.jpeg *.png")]
-)
-
-root.destroy()
-
-if not IMG_PATH:
-    print(" Bạn chưa chọn ảnh!")
-    exit()
-
-print(f"\n Ảnh đã chọn: {IMG_PATH}\n")
-
-# ===== TIỀN XỬ LÝ ẢNH =====
-img = load_img(IMG_PATH, target_size=(224,224))
-img_array = img_to_array(img)
-img_array = np.expand_dims(img_array, axis=0)
-img_array = preprocess_input(img_array)
-
-# ===== TRÍCH ĐẶC TRƯNG =====
-features = feature_model.predict(img_array)
-features = features.reshape(1, -1)
-
-# ===== DỰ ĐOÁN =====
-pred = svm.predict(features)[0]
-prob = svm.predict_proba(features)[0]
-
-print("===== KẾT QUẢ NHẬN DIỆN =====")
-print("Dòng gốm dự đoán:", class_names[pred])
-print(f"Độ tin cậy: {max(prob)*100:.2f}%")
+
+from feature_extractor import load_feature_extractor
+from feature_pipeline import iter_features, log
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Nhận diện dòng gốm bằng ResNet50 + SVM. "
+                    "Không truyền đối số: mở hộp thoại chọn một ảnh."
+    )
+    parser.add_argument("inputs", nargs="*", help="thư mục, file ảnh hoặc mẫu glob")
+    parser.add_argument("--manifest", help="file danh sách đường dẫn ảnh, mỗi dòng một ảnh")
+    parser.add_argument("--output", help="ghi kết quả ra .csv hoặc .jsonl")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="số tiến trình giải mã ảnh")
+    parser.add_argument("--model", default="gom_svm.pkl")
+    parser.add_argument("--classes", default="class_names.pkl")
+    parser.add_argument("--backbone", default="",
+                        help="artifact từ export_backbone.py (.tflite/SavedModel); bỏ trống: ResNet50 Keras float")
+    return parser.parse_args()
+
+
+# Expands directories (recursively), globs and manifest lines into a sorted list of images
+def collect_images(inputs: list[str], manifest: str | None) -> list[str]:
+    paths = set()
+    patterns = list(inputs)
+    if manifest:
+        with open(manifest, encoding="utf-8") as f:
+            patterns += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.update(
+                    os.path.join(root, name) for name in files
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                )
+        elif os.path.isfile(pattern):
+            paths.add(pattern)
+        else:
+            paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(paths)
+
+
+def pick_image_dialog() -> str:
+    import tkinter as tk
+    from tkinter import filedialog
+
+    root = tk.Tk()
+    root.withdraw()
+    root.attributes('-topmost', True)
+
+    path = filedialog.askopenfilename(
+        parent=root,
+        title="Chọn ảnh gốm cần nhận diện",
+        filetypes=[("Image files", "*.jpg *.jpeg *.png")]
+    )
+
+    root.destroy()
+    return path
+
+
+class ResultWriter:
+    def __init__(self, path: str | None, top_k: int):
+        self._file = None
+        self._csv = None
+        if not path:
+            return
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        if path.lower().endswith(".csv"):
+            fields = ["path", "predicted", "confidence", "true_label", "ms"]
+            for i in range(1, top_k + 1):
+                fields += [f"top{i}", f"top{i}_prob"]
+            self._csv = csv.DictWriter(self._file, fieldnames=fields)
+            self._csv.writeheader()
+
+    def write(self, row: dict) -> None:
+        if self._file is None:
+            return
+        if self._csv is None:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return
+        flat = {k: row[k] for k in ("path", "predicted", "confidence", "true_label", "ms")}
+        for i, item in enumerate(row["top_k"], start=1):
+            flat[f"top{i}"] = item["label"]
+            flat[f"top{i}_prob"] = item["probability"]
+        self._csv.writerow(flat)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def print_confusion(class_names: list[str], y_true: list[int], y_pred: list[int]) -> None:
+    from sklearn.metrics import confusion_matrix
+
+    matrix = confusion_matrix(y_true, y_pred, labels=list(range(len(class_names))))
+    width = max(len(name) for name in class_names) + 2
+    print("\n===== MA TRẬN NHẦM LẪN (hàng: thật, cột: dự đoán) =====")
+    print(" " * width + "".join(f"{i:>6}" for i in range(len(class_names))))
+    for i, name in enumerate(class_names):
+        print(f"{name:<{width}}" + "".join(f"{n:>6}" for n in matrix[i]) + f"   [{i}]")
+    correct = sum(t == p for t, p in zip(y_true, y_pred))
+    print(f"Accuracy: {correct / len(y_true) * 100:.2f}% ({correct}/{len(y_true)})")
+
+
+def main():
+    args = parse_args()
+
+    # ===== LOAD MODEL & LABEL =====
+    svm = joblib.load(args.model)
+    class_names = joblib.load(args.classes)
+
+    if args.inputs or args.manifest:
+        paths = collect_images(args.inputs, args.manifest)
+        if not paths:
+            print(" Không tìm thấy ảnh nào!")
+            sys.exit(1)
+    else:
+        # ===== MỞ HỘP THOẠI CHỌN ẢNH =====
+        img_path = pick_image_dialog()
+        if not img_path:
+            print(" Bạn chưa chọn ảnh!")
+            sys.exit()
+        print(f"\n Ảnh đã chọn: {img_path}\n")
+        paths = [img_path]
+
+    # ===== LOAD RESNET LÀM FEATURE EXTRACTOR (MỘT LẦN) =====
+    feature_model = load_feature_extractor(args.backbone)
+
+    # ===== TRÍCH ĐẶC TRƯNG & DỰ ĐOÁN THEO LÔ =====
+    writer = ResultWriter(args.output, args.top_k)
+    y_true, y_pred = [], []
+    done = 0
+    started = time.perf_counter()
+    batch_started = started
+    first_row = None
+    for indices, features in iter_features(feature_model, paths, args.batch_size, args.workers):
+        probs = svm.predict_proba(features)
+        ms = (time.perf_counter() - batch_started) * 1000 / len(indices)
+        for index, prob in zip(indices, probs):
+            path = paths[index]
+            order = np.argsort(prob)[::-1][: args.top_k]
+            top = [
+                {"label": class_names[svm.classes_[i]], "probability": round(float(prob[i]), 4)}
+                for i in order
+            ]
+            # Ground truth is the parent folder name when it is one of the classes
+            folder = os.path.basename(os.path.dirname(path))
+            true_label = folder if folder in class_names else None
+            row = {
+                "path":       path,
+                "predicted":  top[0]["label"],
+                "confidence": top[0]["probability"],
+                "top_k":      top,
+                "true_label": true_label,
+                "ms":         round(ms, 1),
+            }
+            writer.write(row)
+            first_row = first_row or row
+            if true_label is not None:
+                y_true.append(class_names.index(true_label))
+                y_pred.append(class_names.index(top[0]["label"]))
+        done += len(indices)
+        batch_started = time.perf_counter()
+    writer.close()
+    elapsed = time.perf_counter() - started
+
+    # ===== KẾT QUẢ =====
+    if len(paths) == 1 and first_row:
+        print("===== KẾT QUẢ NHẬN DIỆN =====")
+        print("Dòng gốm dự đoán:", first_row["predicted"])
+        print(f"Độ tin cậy: {first_row['confidence']*100:.2f}%")
+        return
+
+    print(f"\nĐã nhận diện {done}/{len(paths)} ảnh trong {elapsed:.1f}s "
+          f"({done / elapsed if elapsed else 0:.1f} ảnh/s)")
+    if args.output:
+        print(f"Đã ghi kết quả vào {args.output}")
+    if y_true:
+        print_confusion(class_names, y_true, y_pred)
+    else:
+        log("Không có nhãn thật (tên thư mục cha không trùng lớp nào), bỏ qua ma trận nhầm lẫn")
+
+
+if __name__ == "__main__":
+    main()